@@ -2,7 +2,7 @@ import secrets
 from datetime import datetime, timedelta, timezone
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, Header, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy import select, and_
 from sqlalchemy.exc import IntegrityError
@@ -19,25 +19,37 @@ from schema.auth import (
     MessageResponse,
 )
 from schema.climber import ClimberCreate, AuthOut
-from security.hashing import verify_password, needs_rehash, hash_password
-from security.jwt_tools import create_access_token, create_refresh_token, decode_token
-from services.email import send_password_reset_email
+from security.hashing import verify_password_async, needs_rehash, hash_password_async
+from schema.setting import settings
+from security import refresh_store, reset_tokens
+from security.rehash import schedule_rehash
+from security.deps import invalidate_principal
+from security.jwt_tools import create_access_token, decode_token
+from services import mail_templates, outbox
+from services.email import enqueue_password_reset_email
 
 Session = Annotated[AsyncSession, Depends(get_session)]
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
 
+def _access_token(user: Climber) -> str:
+    extra = {"username": user.username}
+    if settings.STATELESS_ACCESS_TOKENS:
+        extra["scope"] = str(getattr(user.user_scope, "value", user.user_scope))
+        extra["ver"] = user.token_version
+    return create_access_token(user.id, extra=extra)
+
+
 async def authenticate_user(session: AsyncSession, username: str, password: str) -> Climber:
     """Authenticate user and return Climber object, raise 401 if invalid."""
     user = await session.scalar(select(Climber).where(Climber.username == username))
-    if not user or not verify_password(password, user.password):
+    if not user or not await verify_password_async(password, user.password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
 
-    # Opportunistic rehash if password parameters changed
+    # Opportunistic rehash if password parameters changed, off the request path
     if needs_rehash(user.password):
-        user.password = hash_password(password)
-        await session.commit()
+        schedule_rehash(user.id, password, user.password)
 
     return user
 
@@ -53,12 +65,13 @@ async def signup(payload: ClimberCreate, session: Session):
     climber = Climber(
         **climber_data,
         user_scope="climber",
-        password=hash_password(payload.password),
+        password=await hash_password_async(payload.password),
     )
     session.add(climber)
 
     try:
         await session.flush()
+        refresh_token = await refresh_store.issue(session, climber.id)
         await session.commit()
     except IntegrityError:
         await session.rollback()
@@ -67,17 +80,19 @@ async def signup(payload: ClimberCreate, session: Session):
     await session.refresh(climber)
     return AuthOut(
         climber=climber,
-        access_token=create_access_token(climber.id),
-        refresh_token=create_refresh_token(climber.id)
+        access_token=_access_token(climber),
+        refresh_token=refresh_token,
     )
 
 
 @router.post("/login", response_model=TokenPair)
 async def login(body: LoginRequest, session: Session):
     user = await authenticate_user(session, body.username, body.password)
+    refresh_token = await refresh_store.issue(session, user.id)
+    await session.commit()
     return TokenPair(
-        access_token=create_access_token(user.id, extra={"username": user.username}),
-        refresh_token=create_refresh_token(user.id),
+        access_token=_access_token(user),
+        refresh_token=refresh_token,
     )
 
 
@@ -88,30 +103,26 @@ async def token(form_data: Annotated[OAuth2PasswordRequestForm, Depends()], sess
     Uses the same logic as /login but accepts OAuth2PasswordRequestForm.
     """
     user = await authenticate_user(session, form_data.username, form_data.password)
+    refresh_token = await refresh_store.issue(session, user.id)
+    await session.commit()
     return TokenPair(
-        access_token=create_access_token(user.id, extra={"username": user.username}),
-        refresh_token=create_refresh_token(user.id),
+        access_token=_access_token(user),
+        refresh_token=refresh_token,
     )
 
 
 @router.post("/password-reset/request", response_model=MessageResponse)
 async def request_password_reset(
     body: PasswordResetRequest,
-    background_tasks: BackgroundTasks,
     session: Session,
+    accept_language: Annotated[str | None, Header()] = None,
 ):
     username = body.username.strip().lower()
     user = await session.scalar(select(Climber).where(Climber.username == username))
 
     if user and user.email:
         # Invalidate any existing unused tokens for this user
-        existing = await session.scalars(
-            select(PasswordResetToken).where(
-                and_(PasswordResetToken.user_id == user.id, PasswordResetToken.used == False)
-            )
-        )
-        for t in existing:
-            await session.delete(t)
+        await reset_tokens.invalidate_unused(session, user.id)
 
         token = secrets.token_urlsafe(32)
         reset_token = PasswordResetToken(
@@ -120,14 +131,16 @@ async def request_password_reset(
             expires_at=datetime.now(tz=timezone.utc) + timedelta(hours=1),
         )
         session.add(reset_token)
-        await session.commit()
-
-        background_tasks.add_task(
-            send_password_reset_email,
+        # Queued in the same transaction as the token, so the mail cannot be lost on restart
+        enqueue_password_reset_email(
+            session,
             email=user.email,
             token=token,
             firstname=user.firstname,
+            locale=mail_templates.locale_from_header(accept_language),
         )
+        await session.commit()
+        outbox.notify()
 
     # Always return the same message to avoid revealing whether the email exists
     return MessageResponse(message="Om e-postadressen finns i systemet har ett mail skickats.")
@@ -153,9 +166,12 @@ async def confirm_password_reset(body: PasswordResetConfirm, session: Session):
     if not user:
         raise HTTPException(status_code=400, detail="Invalid or expired reset token")
 
-    user.password = hash_password(body.new_password)
+    user.password = await hash_password_async(body.new_password)
+    user.token_version += 1
     reset_token.used = True
+    await refresh_store.revoke_all(session, user.id)
     await session.commit()
+    invalidate_principal(user.id)
 
     return MessageResponse(message="Lösenordet har ändrats.")
 
@@ -169,10 +185,34 @@ async def refresh(body: RefreshRequest, session: Session):
     if payload.get("type") != "refresh":
         raise HTTPException(status_code=401, detail="Wrong token type")
     uid = int(payload["sub"])
+
+    jti = payload.get("jti")
+    if jti is None:
+        # Issued before refresh tokens were stored: it cannot be consumed or revoked, so log in again.
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Refresh token has been revoked")
+    refresh_token = await refresh_store.rotate(session, jti, uid, payload.get("fam"))
+    if refresh_token is None:
+        await session.commit()
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Refresh token has been revoked")
+
     user = await session.get(Climber, uid)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+    await session.commit()
     return TokenPair(
-        access_token=create_access_token(uid),
-        refresh_token=create_refresh_token(uid),  # rotation; add blacklist if needed
+        access_token=_access_token(user),
+        refresh_token=refresh_token,
     )
+
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(body: RefreshRequest, session: Session):
+    """Revoke the session behind a refresh token. Unknown or invalid tokens are ignored."""
+    try:
+        payload = decode_token(body.refresh_token)
+    except Exception:
+        return None
+    if payload.get("type") == "refresh" and payload.get("jti"):
+        await refresh_store.revoke(session, payload["jti"])
+        await session.commit()
+    return None
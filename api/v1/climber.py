@@ -8,8 +8,10 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from db.config import get_session
 from db.models import Climber, UserScope
 from schema.climber import ClimberOut, ClimberCreate, ClimberUpdate, AdminClimberUpdate
-from security.deps import CurrentUser, AdminUser
-from security.hashing import hash_password
+from security.deps import CurrentUser, AdminUser, invalidate_principal
+from security import refresh_store
+from security.hashing import hash_password_async
+from services import leaderboard
 
 Session = Annotated[AsyncSession, Depends(get_session)]
 
@@ -34,7 +36,7 @@ async def create_climber(payload: ClimberCreate, session: Session):
     await check_email_available(session, payload.email)
 
     climber_data = payload.model_dump(exclude={'password'})
-    climber = Climber(**climber_data, password=hash_password(payload.password))
+    climber = Climber(**climber_data, password=await hash_password_async(payload.password))
     session.add(climber)
 
     try:
@@ -49,8 +51,13 @@ async def create_climber(payload: ClimberCreate, session: Session):
 
 
 @router.get("/me", response_model=ClimberOut)
-async def get_me(current: CurrentUser):
-    return current
+async def get_me(current: CurrentUser, session: Session):
+    if current.profile_loaded:
+        return current
+    climber = await session.get(Climber, current.id)
+    if climber is None:
+        raise HTTPException(status_code=401, detail="User not found")
+    return climber
 
 
 @router.patch("/me", response_model=ClimberOut)
@@ -59,28 +66,38 @@ async def update_me(payload: ClimberUpdate, current: CurrentUser, session: Sessi
     Update the current user's profile.
     Users can update their own username and password.
     """
+    climber = await session.get(Climber, current.id)
+    if climber is None:
+        raise HTTPException(status_code=401, detail="User not found")
+
     updates = payload.model_dump(exclude_unset=True)
 
     # Check username uniqueness if being changed
-    if 'username' in updates and updates['username'] != current.username:
-        await check_username_available(session, updates['username'], exclude_id=current.id)
+    if 'username' in updates and updates['username'] != climber.username:
+        await check_username_available(session, updates['username'], exclude_id=climber.id)
 
-    # Hash password if provided
+    # Hash password if provided; a new password revokes outstanding access and refresh tokens
     if 'password' in updates:
-        updates['password'] = hash_password(updates['password'])
+        updates['password'] = await hash_password_async(updates['password'])
+        updates['token_version'] = climber.token_version + 1
 
     # Apply updates
     for field, value in updates.items():
-        setattr(current, field, value)
+        setattr(climber, field, value)
 
     try:
+        if 'token_version' in updates:
+            await refresh_store.revoke_all(session, climber.id)
         await session.commit()
-        await session.refresh(current)
+        await session.refresh(climber)
     except IntegrityError:
         await session.rollback()
         raise HTTPException(status_code=409, detail="Username is already taken")
 
-    return current
+    invalidate_principal(climber.id)
+    if updates.keys() & {"username", "firstname", "lastname"}:
+        leaderboard.invalidate_all()
+    return climber
 
 
 @router.get("", response_model=List[ClimberOut])
@@ -108,27 +125,35 @@ async def update_climber(climber_id: int, payload: AdminClimberUpdate, admin: Ad
     if 'username' in updates and updates['username'] != climber.username:
         await check_username_available(session, updates['username'], exclude_id=climber.id)
 
-    # Hash password if provided
+    # Hash password if provided; a new password revokes outstanding access and refresh tokens
     if 'password' in updates:
-        updates['password'] = hash_password(updates['password'])
+        updates['password'] = await hash_password_async(updates['password'])
+        updates['token_version'] = climber.token_version + 1
 
     # Validate user scope if provided
     if 'user_scope' in updates:
         valid_scopes = {scope.value for scope in UserScope}
         if updates['user_scope'] not in valid_scopes:
             raise HTTPException(status_code=400, detail="Invalid user scope")
+        if updates['user_scope'] != climber.user_scope:
+            updates['token_version'] = climber.token_version + 1
 
     # Apply updates
     for field, value in updates.items():
         setattr(climber, field, value)
 
     try:
+        if 'token_version' in updates:
+            await refresh_store.revoke_all(session, climber.id)
         await session.commit()
         await session.refresh(climber)
     except IntegrityError:
         await session.rollback()
         raise HTTPException(status_code=409, detail="Username is already taken")
 
+    invalidate_principal(climber.id)
+    if updates.keys() & {"username", "firstname", "lastname"}:
+        leaderboard.invalidate_all()
     return climber
 
 
@@ -144,6 +169,8 @@ async def delete_climber(climber_id: int, admin: AdminUser, session: Session):
 
     await session.delete(climber)
     await session.commit()
+    invalidate_principal(climber_id)
+    leaderboard.invalidate_all()
     return None
 
 
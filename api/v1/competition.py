@@ -1,27 +1,41 @@
-from itertools import groupby
+import asyncio
+import hashlib
+import os
 from typing import Annotated, List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import func, select
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import and_, func, or_, select
 from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import InstrumentedAttribute
 
 from db.config import get_session
-from db.models import Climber, Competition, Problem, ProblemScore, Registration
+from db.models import Climber, Competition, LeaderboardTotal, Problem, Registration
 from schema.competition import (
     CompetitionCreate,
     CompetitionOut,
     CompetitionUpdate,
     LeaderboardEntry,
+    LeaderboardPage,
     LeaderboardResponse,
     LevelLeaderboard,
+    MyRankResponse,
+    PublicLeaderboardResponse,
 )
-from security.deps import AdminUser
+from security.deps import AdminUser, CurrentUser
+from services import leaderboard, ranking, standings
 
 router = APIRouter(prefix="/competition", tags=["competition"])
 SessionDep = Annotated[AsyncSession, Depends(get_session)]
 
+SSE_KEEPALIVE_S = float(os.getenv("SSE_KEEPALIVE_S", "15"))
+# Cache-Control for the public board; a proxy may keep serving it while revalidating
+PUBLIC_MAX_AGE_S = int(os.getenv("PUBLIC_LEADERBOARD_MAX_AGE_S", "5"))
+PUBLIC_STALE_S = int(os.getenv("PUBLIC_LEADERBOARD_STALE_S", "30"))
+# Ranks shown per level on the full board; the rest is paged from /leaderboard/level/{level}
+BOARD_SIZE = 20
+
 
 async def seed_problems(session: AsyncSession, comp_id: int, levels: int = 10, per_level: int = 8) -> int:
     rows = [
@@ -108,98 +122,317 @@ async def update_competition(
     }
     _ = CompetitionCreate.model_validate(merged)
 
+    old_season_id = comp.season_id
     for k, v in incoming.items():
         setattr(comp, k, v)
 
     await session.flush()
+    if comp.season_id != old_season_id:
+        # The round's totals move between seasons; rebuild both rather than unpicking them.
+        for season_id in (old_season_id, comp.season_id):
+            await standings.rebuild_season(session, season_id)
     await session.commit()
+    if "season_id" in incoming:
+        leaderboard.standings_cache.clear()
     await session.refresh(comp)
     return comp
 
 
 @router.get("/{comp_id}/leaderboard", response_model=LeaderboardResponse)
 async def get_leaderboard(comp_id: int, session: SessionDep, _: AdminUser):
-    comp = await session.get(Competition, comp_id)
-    if not comp:
+    return await _cached_leaderboard(session.bind, comp_id)
+
+
+@router.get("/{comp_id}/leaderboard/public", response_model=PublicLeaderboardResponse)
+async def get_public_leaderboard(
+        comp_id: int,
+        session: SessionDep,
+        if_none_match: Optional[str] = Header(None),
+):
+    """
+    Leaderboard of a published competition, without auth. The ETag is a hash
+    of the board served, so it changes only when a score, registration or
+    climber name on the board changes; send it back in If-None-Match to get
+    304 Not Modified.
+    """
+    if not await session.scalar(select(Competition.published).where(Competition.id == comp_id)):
         raise HTTPException(status_code=404, detail="Competition not found")
 
-    # Pre-aggregate scores per (user, competition, level) via Problem to enforce level isolation.
-    # Without the Problem join the outer join would pull in scores from ALL levels for that user,
-    # causing climbers who changed levels to appear under multiple level groups.
-    scores_by_level = (
-        select(
-            ProblemScore.user_id,
-            func.sum(ProblemScore.ifsc_score).label("total_score"),
-            Problem.level_no,
-        )
-        .join(Problem, Problem.id == ProblemScore.problem_id)
-        .where(ProblemScore.competition_id == comp_id)
-        .group_by(ProblemScore.user_id, Problem.level_no)
-        .subquery()
-    )
+    headers = {"Cache-Control": f"public, max-age={PUBLIC_MAX_AGE_S}, stale-while-revalidate={PUBLIC_STALE_S}"}
+    # Tagging the content rather than a version kept by the writers means score
+    # writes share no row to bump, and a worker serving a board built before a
+    # write elsewhere labels it with that board's own tag.
+    board = PublicLeaderboardResponse.model_validate((await _cached_leaderboard(session.bind, comp_id)).model_dump())
+    resp = JSONResponse(board.model_dump(mode="json"), headers=headers)
+    etag = _etag(resp.body)
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={**headers, "ETag": etag})
+    resp.headers["ETag"] = etag
+    return resp
+
+
+def _etag(body: bytes) -> str:
+    return f'"{hashlib.sha256(body).hexdigest()}"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+@router.get("/{comp_id}/leaderboard/stream", response_class=StreamingResponse)
+async def stream_leaderboard(comp_id: int, session: SessionDep, _: AdminUser):
+    """
+    Server-Sent Events: a `snapshot` event with the full leaderboard, then a `diff`
+    event after each score write ({level, upsert: [entries], remove: [user_ids]} per
+    changed level). A client that falls behind receives a new `snapshot` instead.
+    """
+    bind = session.bind
+    await _cached_leaderboard(bind, comp_id)  # 404 before the stream starts
+
+    async def load() -> dict:
+        return (await _cached_leaderboard(bind, comp_id)).model_dump()
+
+    sub = await leaderboard.leaderboard_stream.subscribe(comp_id, load)
+
+    async def events():
+        try:
+            while True:
+                event = await sub.next(timeout=SSE_KEEPALIVE_S)
+                yield event if event is not None else b": keepalive\n\n"
+        finally:
+            leaderboard.leaderboard_stream.unsubscribe(sub)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+async def _cached_leaderboard(bind, comp_id: int) -> LeaderboardResponse:
+    # Concurrent misses share one computation, which outlives any single request
+    # and so opens its own session.
+    async def compute() -> LeaderboardResponse:
+        async with AsyncSession(bind=bind, expire_on_commit=False) as own:
+            if not await own.get(Competition, comp_id):
+                raise HTTPException(status_code=404, detail="Competition not found")
+            return await _build_leaderboard(own, comp_id)
+
+    try:
+        return await leaderboard.leaderboard_cache.get(comp_id, compute)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Leaderboard is being computed, try again shortly",
+                            headers={"Retry-After": "1"})
+
+
+async def _build_leaderboard(session: AsyncSession, comp_id: int) -> LeaderboardResponse:
+    levels = []
+    for level in (await session.scalars(
+        select(LeaderboardTotal.level)
+        .where(LeaderboardTotal.competition_id == comp_id, LeaderboardTotal.ranked.is_(True))
+        .distinct()
+        .order_by(LeaderboardTotal.level)
+    )).all():
+        levels.append(LevelLeaderboard(level=level, entries=await _board_top(session, comp_id, level)))
+    return LeaderboardResponse(competition_id=comp_id, levels=levels)
+
+
+async def _board_top(session: AsyncSession, comp_id: int, level: int) -> list[LeaderboardEntry]:
+    """
+    Climbers ranked BOARD_SIZE or better: the first BOARD_SIZE rows of the index,
+    plus any that tie the last of them. Ranks follow from the rows themselves,
+    as everyone ahead of them is among them.
+    """
+    rows = _level_rows(comp_id, level)
+    top = (await session.execute(rows.order_by(*_BOARD_ORDER).limit(BOARD_SIZE))).all()
+    if len(top) == BOARD_SIZE:
+        last = _position(top[-1])
+        top += (await session.execute(
+            rows.where(_behind(last), *(col == value for (col, _), value in zip(_BOARD_KEY[:-1], last)))
+            .order_by(*_BOARD_ORDER)
+        )).all()
+
+    entries: list[LeaderboardEntry] = []
+    previous = None
+    for i, r in enumerate(top):
+        key = _position(r)[:-1]
+        if key != previous:
+            rank, previous = i + 1, key
+        entries.append(LeaderboardEntry(
+            rank=rank,
+            user_id=r.user_id,
+            name=_display_name(r.firstname, r.lastname, r.username),
+            total_score=r.total_score,
+        ))
+    return entries
+
+
+def _display_name(firstname: Optional[str], lastname: Optional[str], username: str) -> str:
+    return f"{firstname} {lastname}".strip() if firstname or lastname else username
+
 
-    score_sub = (
+# Board order within a level: the IFSC keys of services.ranking, then user_id so
+# every row has a unique position, which is what keyset cursors and the windows
+# below rely on. All of them walk leaderboard_total_ranked_idx, which has the
+# same order, instead of ranking the whole level.
+_BOARD_KEY = (*ranking.RANK_KEY, (LeaderboardTotal.user_id, False))
+_BOARD_ORDER = tuple(col.desc() if descending else col.asc() for col, descending in _BOARD_KEY)
+_REVERSE_ORDER = tuple(col.asc() if descending else col.desc() for col, descending in _BOARD_KEY)
+
+
+def _level_rows(comp_id: int, level: int):
+    return (
         select(
-            Registration.level,
-            Registration.user_id,
-            func.coalesce(scores_by_level.c.total_score, 0.0).label("total_score"),
+            *(col for col, _ in _BOARD_KEY),
             Climber.firstname,
             Climber.lastname,
             Climber.username,
         )
-        .join(Climber, Climber.id == Registration.user_id)
-        .outerjoin(
-            scores_by_level,
-            (scores_by_level.c.user_id == Registration.user_id)
-            & (scores_by_level.c.level_no == Registration.level),
+        .join(Climber, Climber.id == LeaderboardTotal.user_id)
+        .where(
+            LeaderboardTotal.competition_id == comp_id,
+            LeaderboardTotal.level == level,
+            LeaderboardTotal.ranked.is_(True),
         )
-        .where(Registration.comp_id == comp_id, Registration.approved.is_(True))
-        .subquery()
     )
 
-    # Add rank window function
-    ranked_sub = (
-        select(
-            score_sub.c.level,
-            score_sub.c.total_score,
-            score_sub.c.firstname,
-            score_sub.c.lastname,
-            score_sub.c.username,
-            func.rank()
-            .over(
-                partition_by=score_sub.c.level,
-                order_by=score_sub.c.total_score.desc(),
-            )
-            .label("rank"),
+
+def _position(row) -> tuple:
+    """The row's values for _BOARD_KEY."""
+    return tuple(getattr(row, col.key) for col, _ in _BOARD_KEY)
+
+
+def _ahead_of(position: tuple):
+    """Rows before `position` in board order."""
+    return _compare(position, ahead=True)
+
+
+def _behind(position: tuple):
+    """Rows after `position` in board order."""
+    return _compare(position, ahead=False)
+
+
+def _compare(position: tuple, ahead: bool):
+    # (a, b, c) < (x, y, z) as a OR-chain, since the key mixes directions. A
+    # position without its user_id compares on the ranking keys alone.
+    clauses = []
+    for i, ((col, descending), value) in enumerate(zip(_BOARD_KEY, position)):
+        before = col > value if descending == ahead else col < value
+        clauses.append(and_(*(c == v for (c, _), v in zip(_BOARD_KEY[:i], position[:i])), before))
+    return or_(*clauses)
+
+
+async def _rank_entries(session: AsyncSession, comp_id: int, level: int, rows) -> list[LeaderboardEntry]:
+    """Ranks (ties share one, as with rank()) for a contiguous run of rows in board order."""
+    if not rows:
+        return []
+    first = _position(rows[0])
+    # One count over the index entries ahead of the run; the rest follows from the run itself.
+    ahead, better = (await session.execute(
+        select(func.count(), func.count().filter(_ahead_of(first[:-1])))
+        .where(
+            LeaderboardTotal.competition_id == comp_id,
+            LeaderboardTotal.level == level,
+            LeaderboardTotal.ranked.is_(True),
+            _ahead_of(first),
         )
-        .subquery()
+    )).one()
+
+    entries: list[LeaderboardEntry] = []
+    rank, key = better + 1, first[:-1]
+    for i, r in enumerate(rows):
+        if _position(r)[:-1] != key:
+            rank, key = ahead + i + 1, _position(r)[:-1]
+        entries.append(LeaderboardEntry(
+            rank=rank,
+            user_id=r.user_id,
+            name=_display_name(r.firstname, r.lastname, r.username),
+            total_score=r.total_score,
+        ))
+    return entries
+
+
+def _cursor(row) -> str:
+    return ":".join(str(value) for value in _position(row))
+
+
+def _parse_cursor(cursor: str) -> tuple:
+    try:
+        total_score, *rest = cursor.split(":")
+        position = (float(total_score), *map(int, rest))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if len(position) != len(_BOARD_KEY):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return position
+
+
+@router.get("/{comp_id}/leaderboard/level/{level}", response_model=LeaderboardPage)
+async def get_leaderboard_page(
+        comp_id: int,
+        level: int,
+        session: SessionDep,
+        _: CurrentUser,
+        after: Optional[str] = None,
+        limit: int = Query(20, ge=1, le=100),
+):
+    """The full ranking of one level, `limit` entries at a time; pass `next_cursor` as `after`."""
+    if not await session.get(Competition, comp_id):
+        raise HTTPException(status_code=404, detail="Competition not found")
+
+    stmt = _level_rows(comp_id, level)
+    if after is not None:
+        stmt = stmt.where(_behind(_parse_cursor(after)))
+    rows = (await session.execute(stmt.order_by(*_BOARD_ORDER).limit(limit + 1))).all()
+    page = rows[:limit]
+
+    return LeaderboardPage(
+        competition_id=comp_id,
+        level=level,
+        entries=await _rank_entries(session, comp_id, level, page),
+        next_cursor=_cursor(page[-1]) if len(rows) > limit else None,
     )
 
-    stmt = (
-        select(ranked_sub)
-        .where(ranked_sub.c.rank <= 20)
-        .order_by(ranked_sub.c.level.asc(), ranked_sub.c.rank.asc())
+
+@router.get("/{comp_id}/leaderboard/me", response_model=MyRankResponse)
+async def get_my_rank(
+        comp_id: int,
+        session: SessionDep,
+        current: CurrentUser,
+        window: int = Query(5, ge=0, le=50),
+):
+    """Your rank at your registered level, with up to `window` climbers either side."""
+    reg = await session.scalar(
+        select(Registration).where(Registration.comp_id == comp_id, Registration.user_id == current.id)
     )
+    if not reg:
+        raise HTTPException(status_code=404, detail="Registration not found")
+    me = await session.get(LeaderboardTotal, (comp_id, reg.level, current.id))
+    if not me or not me.ranked:
+        raise HTTPException(status_code=404, detail="Not ranked in this competition")
 
-    rows = (await session.execute(stmt)).mappings().all()
-
-    levels: list[LevelLeaderboard] = []
-    for level, group in groupby(rows, key=lambda r: r["level"]):
-        entries = [
-            LeaderboardEntry(
-                rank=r["rank"],
-                name=(
-                    f"{r['firstname']} {r['lastname']}".strip()
-                    if r["firstname"] or r["lastname"]
-                    else r["username"]
-                ),
-                total_score=r["total_score"],
-            )
-            for r in group
-        ]
-        levels.append(LevelLeaderboard(level=level, entries=entries))
+    rows = _level_rows(comp_id, reg.level)
+    position = _position(me)
+    above = (await session.execute(
+        rows.where(_ahead_of(position)).order_by(*_REVERSE_ORDER).limit(window)
+    )).all()
+    rest = (await session.execute(
+        rows.where(or_(LeaderboardTotal.user_id == me.user_id, _behind(position)))
+        .order_by(*_BOARD_ORDER)
+        .limit(window + 1)
+    )).all()
 
-    return LeaderboardResponse(competition_id=comp_id, levels=levels)
+    entries = await _rank_entries(session, comp_id, reg.level, above[::-1] + rest)
+    mine = next(e for e in entries if e.user_id == current.id)
+    return MyRankResponse(
+        competition_id=comp_id,
+        level=reg.level,
+        rank=mine.rank,
+        total_score=mine.total_score,
+        entries=entries,
+    )
 
 
 @router.delete("/{comp_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -211,6 +444,10 @@ async def delete_competition(
     comp = await session.get(Competition, comp_id)
     if not comp:
         raise HTTPException(status_code=404, detail="Competition not found")
+    season_id = comp.season_id
     await session.delete(comp)
+    await session.flush()
+    await standings.rebuild_season(session, season_id)
     await session.commit()
+    leaderboard.invalidate(comp_id)
     return None
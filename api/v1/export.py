@@ -0,0 +1,135 @@
+import os
+from typing import Annotated, AsyncIterator, List
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.config import get_session
+from db.models import Climber, Competition, LeaderboardTotal, Problem, ProblemScore, Season
+from security.deps import AnalystUser
+from services import export, ranking
+from services.export import ExportFormat
+
+router = APIRouter(prefix="/export", tags=["export"])
+SessionDep = Annotated[AsyncSession, Depends(get_session)]
+
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "5000"))
+
+# One row per scored problem of each ranked climber; climbers without scores get
+# one row with empty problem columns. total_score and rank are per competition and level.
+COLUMNS = [
+    ("season_id", "int64"),
+    ("competition_id", "int64"),
+    ("round_no", "int64"),
+    ("level", "int64"),
+    ("user_id", "int64"),
+    ("username", "string"),
+    ("problem_no", "int64"),
+    ("attempts_total", "int64"),
+    ("got_bonus", "bool_"),
+    ("got_top", "bool_"),
+    ("attempts_to_bonus", "int64"),
+    ("attempts_to_top", "int64"),
+    ("ifsc_score", "float64"),
+    ("total_score", "float64"),
+    ("rank", "int64"),
+]
+
+
+def _score_rows(comp_id: int):
+    totals = (
+        select(
+            LeaderboardTotal.competition_id,
+            LeaderboardTotal.level,
+            LeaderboardTotal.user_id,
+            LeaderboardTotal.total_score,
+            ranking.level_rank().label("rank"),
+        )
+        .where(LeaderboardTotal.competition_id == comp_id, LeaderboardTotal.ranked.is_(True))
+        .subquery()
+    )
+    scored = (
+        select(
+            ProblemScore.user_id,
+            Problem.level_no,
+            Problem.problem_no,
+            ProblemScore.attempts_total,
+            ProblemScore.got_bonus,
+            ProblemScore.got_top,
+            ProblemScore.attempts_to_bonus,
+            ProblemScore.attempts_to_top,
+            ProblemScore.ifsc_score,
+        )
+        .join(Problem, Problem.id == ProblemScore.problem_id)
+        .where(ProblemScore.competition_id == comp_id)
+        .subquery()
+    )
+    return (
+        select(
+            Competition.season_id,
+            Competition.id,
+            Competition.round_no,
+            totals.c.level,
+            totals.c.user_id,
+            Climber.username,
+            scored.c.problem_no,
+            scored.c.attempts_total,
+            scored.c.got_bonus,
+            scored.c.got_top,
+            scored.c.attempts_to_bonus,
+            scored.c.attempts_to_top,
+            scored.c.ifsc_score,
+            totals.c.total_score,
+            totals.c.rank,
+        )
+        .select_from(totals)
+        .join(Competition, Competition.id == totals.c.competition_id)
+        .join(Climber, Climber.id == totals.c.user_id)
+        .outerjoin(scored, and_(scored.c.user_id == totals.c.user_id, scored.c.level_no == totals.c.level))
+        .order_by(totals.c.level, totals.c.user_id, scored.c.problem_no)
+    )
+
+
+async def _stream(bind, comp_ids: List[int], fmt: ExportFormat) -> AsyncIterator[bytes]:
+    # Runs after the handler returns, so it opens its own session. Rows arrive in
+    # EXPORT_CHUNK_ROWS chunks from a server-side cursor, ranked by the database.
+    enc = export.encoder(fmt, COLUMNS)
+    async with AsyncSession(bind=bind) as session:
+        for comp_id in comp_ids:
+            result = await session.stream(_score_rows(comp_id).execution_options(yield_per=EXPORT_CHUNK_ROWS))
+            async for chunk in result.partitions():
+                yield enc.write([tuple(row) for row in chunk])
+    yield enc.close()
+
+
+def _response(bind, comp_ids: List[int], fmt: ExportFormat, filename: str) -> StreamingResponse:
+    if not export.available(fmt):
+        raise HTTPException(status_code=501, detail=f"{fmt.value} export needs pyarrow installed")
+    return StreamingResponse(
+        _stream(bind, comp_ids, fmt),
+        media_type=export.MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt.value}"'},
+    )
+
+
+@router.get("/competition/{comp_id}", response_class=StreamingResponse)
+async def export_competition(comp_id: int, session: SessionDep, _: AnalystUser, format: ExportFormat = ExportFormat.csv):
+    """Per-problem scores with totals and ranks for one competition."""
+    if not await session.get(Competition, comp_id):
+        raise HTTPException(status_code=404, detail="Competition not found")
+    return _response(session.bind, [comp_id], format, f"competition-{comp_id}")
+
+
+@router.get("/season/{season_id}", response_class=StreamingResponse)
+async def export_season(season_id: int, session: SessionDep, _: AnalystUser, format: ExportFormat = ExportFormat.csv):
+    """Per-problem scores with totals and ranks for every competition in the season, by round."""
+    if not await session.get(Season, season_id):
+        raise HTTPException(status_code=404, detail="Season not found")
+    comp_ids = (await session.scalars(
+        select(Competition.id)
+        .where(Competition.season_id == season_id)
+        .order_by(Competition.round_no, Competition.id)
+    )).all()
+    return _response(session.bind, list(comp_ids), format, f"season-{season_id}")
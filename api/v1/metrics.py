@@ -0,0 +1,14 @@
+from typing import Any, Dict
+
+from fastapi import APIRouter
+
+from security.deps import AdminUser
+from services.metrics import snapshot
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+
+@router.get("", response_model=Dict[str, Dict[str, Any]])
+async def get_metrics(_: AdminUser):
+    """In-process counters for this worker. Admin only."""
+    return snapshot()
@@ -1,36 +1,40 @@
-from typing import Annotated, Dict
+import os
+from typing import Annotated, Dict, Sequence, Tuple
 
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import select
+from sqlalchemy import and_, func, literal, select, union_all
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from db.config import get_session
-from db.models import Problem, Registration, ProblemScore
+from db.models import AttemptEvent, Problem, Registration, ProblemScore
 from schema.problem_score import (
     ProblemScoreUpsert,
     ProblemScoreOut,
     ProblemScoreBulkResult,
     ProblemScoreBulkRequest,
     ProblemScoreOutBulk,
+    JudgeScoreRequest,
+    JudgeScoreResult,
+    AttemptEventCreate,
+    AttemptEventOut,
 )
-from security.deps import CurrentUser
+from security.deps import CurrentUser, SetterUser
+from services import attempts, leaderboard
+from services.scoring import calculate_ifsc_score
 
 router = APIRouter(prefix="/competitions", tags=["scores"])
 
 SessionDep = Annotated[AsyncSession, Depends(get_session)]
 
-
-def calculate_ifsc_score(body: ProblemScoreUpsert) -> float:
-    if body.got_top:
-        return 25 - ((body.attempts_to_top - 1) * 0.1)
-    if body.got_bonus:
-        return 15 - ((body.attempts_to_bonus - 1) * 0.1)
-    return 0.0
+# Scores per INSERT on the judge endpoint. Each is 8 bind parameters and one
+# UNION ALL arm (SQLite allows at most 500 arms).
+JUDGE_CHUNK_ROWS = int(os.getenv("JUDGE_CHUNK_ROWS", "250"))
 
 
 async def _require_registration(
     session: AsyncSession, comp_id: int, user_id: int, level: int
-) -> None:
+) -> Registration:
     reg = await session.scalar(
         select(Registration).where(
             Registration.comp_id == comp_id,
@@ -41,6 +45,7 @@ async def _require_registration(
         raise HTTPException(status_code=403, detail="Not registered for this competition")
     if reg.level != level:
         raise HTTPException(status_code=403, detail="Registered for a different level")
+    return reg
 
 
 def _build_score_result(problem_no: int, ps: ProblemScore) -> ProblemScoreBulkResult:
@@ -57,13 +62,69 @@ def _build_score_result(problem_no: int, ps: ProblemScore) -> ProblemScoreBulkRe
     )
 
 
-def _apply_score_fields(ps: ProblemScore, body: ProblemScoreUpsert) -> None:
-    ps.attempts_total = body.attempts_total
-    ps.got_bonus = body.got_bonus
-    ps.got_top = body.got_top
-    ps.attempts_to_bonus = body.attempts_to_bonus
-    ps.attempts_to_top = body.attempts_to_top
-    ps.ifsc_score = calculate_ifsc_score(body)
+_SCORE_FIELDS = ("attempts_total", "got_bonus", "got_top", "attempts_to_bonus", "attempts_to_top", "ifsc_score")
+
+
+async def _missing_problem_or_registration(
+    session: AsyncSession, comp_id: int, user_id: int, level: int, problem_no: int
+) -> None:
+    """Only on the error path of a single-problem write: raise for whichever check failed."""
+    if not await session.scalar(select(Problem.id).where(
+        Problem.competition_id == comp_id,
+        Problem.level_no == level,
+        Problem.problem_no == problem_no,
+    )):
+        raise HTTPException(status_code=404, detail="Problem not found")
+    await _require_registration(session, comp_id, user_id, level)
+
+
+def _score_values(body: ProblemScoreUpsert) -> dict:
+    return {**body.model_dump(include=set(_SCORE_FIELDS)), "ifsc_score": calculate_ifsc_score(body)}
+
+
+def _upsert_scores(comp_id: int, level: int, items: Sequence[Tuple[int, int, ProblemScoreUpsert]]):
+    """
+    A single statement that resolves each (user_id, problem_no, score) item's
+    problem, requires the climber's registration at this level and upserts the
+    scores, returning them. Fewer rows back than items means a problem or a
+    registration is missing.
+    """
+    cols = ProblemScore.__table__.c
+    rows = [
+        select(
+            literal(user_id, cols.user_id.type).label("user_id"),
+            literal(problem_no, Problem.problem_no.type).label("problem_no"),
+            *(literal(value, cols[f].type).label(f) for f, value in _score_values(body).items()),
+        )
+        for user_id, problem_no, body in items
+    ]
+    item = (rows[0] if len(rows) == 1 else union_all(*rows)).subquery("item")
+    source = (
+        select(
+            literal(comp_id, cols.competition_id.type),
+            Problem.id,
+            item.c.user_id,
+            *(item.c[f] for f in _SCORE_FIELDS),
+        )
+        .select_from(item)
+        .join(Problem, and_(
+            Problem.competition_id == comp_id,
+            Problem.level_no == level,
+            Problem.problem_no == item.c.problem_no,
+        ))
+        .join(Registration, and_(
+            Registration.comp_id == Problem.competition_id,
+            Registration.user_id == item.c.user_id,
+            Registration.level == Problem.level_no,
+        ))
+        # SQLite needs a WHERE before ON CONFLICT to parse INSERT ... SELECT ... JOIN
+        .where(Problem.competition_id == comp_id)
+    )
+    stmt = insert(ProblemScore).from_select(["competition_id", "problem_id", "user_id", *_SCORE_FIELDS], source)
+    return stmt.on_conflict_do_update(
+        index_elements=[ProblemScore.problem_id, ProblemScore.user_id],
+        set_={**{f: stmt.excluded[f] for f in _SCORE_FIELDS}, "updated_at": func.now()},
+    ).returning(*(cols[f] for f in _SCORE_FIELDS))
 
 
 @router.put(
@@ -79,39 +140,59 @@ async def upsert_problem_score(
         session: SessionDep,
         current: CurrentUser,
 ):
-    problem = await session.scalar(
-        select(Problem).where(
-            Problem.competition_id == comp_id,
-            Problem.level_no == level_no,
-            Problem.problem_no == problem_no,
-        )
-    )
-    if not problem:
-        raise HTTPException(status_code=404, detail="Problem not found")
+    before = await leaderboard.lock_total(session, comp_id, current.id, level_no)
+    stmt = _upsert_scores(comp_id, level_no, [(current.id, problem_no, body)])
+    row = (await session.execute(stmt)).mappings().first()
+    if row is None:
+        await _missing_problem_or_registration(session, comp_id, current.id, level_no, problem_no)
 
-    await _require_registration(session, comp_id, current.id, level_no)
+    await leaderboard.refresh_total(session, comp_id, current.id, level_no, before)
+    await session.commit()
+    leaderboard.invalidate(comp_id)
+    return ProblemScoreOut(problem_no=problem_no, **row)
 
-    ps = await session.scalar(
-        select(ProblemScore).where(
-            ProblemScore.competition_id == comp_id,
-            ProblemScore.problem_id == problem.id,
-            ProblemScore.user_id == current.id,
-        )
-    )
 
-    if ps is None:
-        ps = ProblemScore(
-            competition_id=comp_id,
-            problem_id=problem.id,
-            user_id=current.id,
+@router.post(
+    "/{comp_id}/level/{level_no}/problems/{problem_no}/attempts",
+    response_model=AttemptEventOut,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def log_attempt(
+        comp_id: int,
+        level_no: int,
+        problem_no: int,
+        body: AttemptEventCreate,
+        session: SessionDep,
+        current: CurrentUser,
+):
+    """
+    Append one attempt, zone or top. The score and leaderboard follow once the
+    projector has applied it (see services/attempts.py), usually within a second.
+    """
+    source = (
+        select(
+            literal(comp_id, AttemptEvent.competition_id.type),
+            Problem.id,
+            literal(current.id, AttemptEvent.user_id.type),
+            literal(body.kind, AttemptEvent.kind.type),
         )
-        session.add(ps)
-
-    _apply_score_fields(ps, body)
-    await session.flush()
+        .select_from(Problem)
+        .join(Registration, and_(
+            Registration.comp_id == Problem.competition_id,
+            Registration.user_id == current.id,
+            Registration.level == Problem.level_no,
+        ))
+        .where(Problem.competition_id == comp_id, Problem.level_no == level_no, Problem.problem_no == problem_no)
+    )
+    stmt = insert(AttemptEvent).from_select(["competition_id", "problem_id", "user_id", "kind"], source)
+    row = (await session.execute(
+        stmt.returning(AttemptEvent.id, AttemptEvent.kind, AttemptEvent.created_at)
+    )).mappings().first()
+    if row is None:
+        await _missing_problem_or_registration(session, comp_id, current.id, level_no, problem_no)
     await session.commit()
-    await session.refresh(ps)
-    return ProblemScoreOut(problem_no=problem_no, **ps.__dict__)
+    attempts.notify()
+    return AttemptEventOut(**row)
 
 
 @router.put(
@@ -126,56 +207,81 @@ async def upsert_problem_scores_batch(
         session: SessionDep,
         current: CurrentUser,
 ):
-    await _require_registration(session, comp_id, current.id, level)
-
-    wanted_nos = [item.problem_no for item in body.items]
-
-    problems = (await session.execute(
-        select(Problem)
-        .where(
+    items = [(current.id, item.problem_no, item) for item in body.items]
+    before = await leaderboard.lock_total(session, comp_id, current.id, level)
+    written = len((await session.execute(_upsert_scores(comp_id, level, items))).all())
+    if written != len(items):
+        # Only on the error path: work out which check failed.
+        await _require_registration(session, comp_id, current.id, level)
+        wanted_nos = [no for _, no, _ in items]
+        found = set((await session.scalars(select(Problem.problem_no).where(
             Problem.competition_id == comp_id,
             Problem.level_no == level,
             Problem.problem_no.in_(wanted_nos),
-        )
-    )).scalars().all()
-    if len(problems) != len(wanted_nos):
-        missing = sorted(set(wanted_nos) - {p.problem_no for p in problems})
-        raise HTTPException(status_code=404, detail=f"Problems not found: {missing}")
-
-    problem_by_no: Dict[int, Problem] = {p.problem_no: p for p in problems}
-    problem_ids = [p.id for p in problems]
+        ))).all())
+        raise HTTPException(status_code=404, detail=f"Problems not found: {sorted(set(wanted_nos) - found)}")
 
-    existing_scores = (await session.execute(
-        select(ProblemScore)
-        .where(
-            ProblemScore.competition_id == comp_id,
-            ProblemScore.user_id == current.id,
-            ProblemScore.problem_id.in_(problem_ids),
-        )
-    )).scalars().all()
-    existing_by_pid: Dict[int, ProblemScore] = {ps.problem_id: ps for ps in existing_scores}
-
-    results: list[ProblemScoreBulkResult] = []
-
-    for item in body.items:
-        prob = problem_by_no[item.problem_no]
-        ps = existing_by_pid.get(prob.id)
-        if ps is None:
-            ps = ProblemScore(
-                competition_id=comp_id,
-                problem_id=prob.id,
-                user_id=current.id,
-            )
-            session.add(ps)
-            existing_by_pid[prob.id] = ps
+    await leaderboard.refresh_total(session, comp_id, current.id, level, before)
+    await session.commit()
+    leaderboard.invalidate(comp_id)
+    # ON CONFLICT sets every column from the item, so the stored rows are the items.
+    return sorted(
+        (ProblemScoreBulkResult(problem_no=no, score=ProblemScoreOutBulk(**_score_values(item)))
+         for _, no, item in items),
+        key=lambda r: r.problem_no,
+    )
 
-        _apply_score_fields(ps, item)
-        results.append(_build_score_result(item.problem_no, ps))
 
-    await session.flush()
+@router.put(
+    "/{comp_id}/level/{level}/scores/judge",
+    response_model=list[JudgeScoreResult],
+    status_code=status.HTTP_200_OK,
+)
+async def upsert_judge_scores(
+        comp_id: int,
+        level: int,
+        body: JudgeScoreRequest,
+        session: SessionDep,
+        current: SetterUser,
+):
+    """
+    Scores for many climbers at once, e.g. one problem across a whole final.
+    Registrations and problems are checked with one query each, then the scores
+    are written JUDGE_CHUNK_ROWS at a time and the totals refreshed together.
+    """
+    user_ids = sorted({item.user_id for item in body.items})
+    registered = set((await session.scalars(select(Registration.user_id).where(
+        Registration.comp_id == comp_id,
+        Registration.level == level,
+        Registration.user_id.in_(user_ids),
+    ))).all())
+    if len(registered) != len(user_ids):
+        missing = sorted(set(user_ids) - registered)
+        raise HTTPException(status_code=404, detail=f"Not registered for this level: {missing}")
+    wanted_nos = sorted({item.problem_no for item in body.items})
+    found = set((await session.scalars(select(Problem.problem_no).where(
+        Problem.competition_id == comp_id,
+        Problem.level_no == level,
+        Problem.problem_no.in_(wanted_nos),
+    ))).all())
+    if len(found) != len(wanted_nos):
+        raise HTTPException(status_code=404, detail=f"Problems not found: {sorted(set(wanted_nos) - found)}")
+
+    before = await leaderboard.lock_totals(session, comp_id, level, user_ids)
+    items = [(item.user_id, item.problem_no, item) for item in body.items]
+    for start in range(0, len(items), JUDGE_CHUNK_ROWS):
+        chunk = items[start:start + JUDGE_CHUNK_ROWS]
+        if len((await session.execute(_upsert_scores(comp_id, level, chunk))).all()) != len(chunk):
+            # A registration or problem went away after the checks above
+            raise HTTPException(status_code=409, detail="Registrations changed during the write, retry")
+    await leaderboard.refresh_totals(session, comp_id, level, user_ids, before)
     await session.commit()
-    results.sort(key=lambda x: x.problem_no)
-    return results
+    leaderboard.invalidate(comp_id)
+    return sorted(
+        (JudgeScoreResult(user_id=uid, problem_no=no, score=ProblemScoreOutBulk(**_score_values(item)))
+         for uid, no, item in items),
+        key=lambda r: (r.problem_no, r.user_id),
+    )
 
 
 @router.get(
@@ -14,6 +14,7 @@ from schema.registration import (
     RegistrationLevelUpdate,
 )
 from security.deps import AdminUser, CurrentUser
+from services import leaderboard
 
 router = APIRouter(tags=["registration"])
 SessionDep = Annotated[AsyncSession, Depends(get_session)]
@@ -80,6 +81,7 @@ async def register_self(
     await session.refresh(reg)
 
     await _create_empty_scores(session, comp_id, current.id, body.level)
+    await leaderboard.set_ranked(session, comp_id, current.id, body.level, reg.approved)
 
     await session.flush()
     await session.commit()
@@ -169,7 +171,9 @@ async def update_registration_approval(
         raise HTTPException(status_code=404, detail="Registration not found")
 
     reg.approved = payload.approved
+    await leaderboard.set_ranked(session, comp_id, user_id, reg.level, reg.approved)
     await session.commit()
+    leaderboard.invalidate(comp_id)
     await session.refresh(reg)
     return reg
 
@@ -196,9 +200,12 @@ async def update_registration_level(
     if reg.level == payload.level:
         return reg
 
+    await leaderboard.set_ranked(session, comp_id, user_id, reg.level, False)
     reg.level = payload.level
     await _create_empty_scores(session, comp_id, user_id, payload.level, skip_existing=True)
+    await leaderboard.set_ranked(session, comp_id, user_id, reg.level, reg.approved)
 
     await session.commit()
+    leaderboard.invalidate(comp_id)
     await session.refresh(reg)
     return reg
@@ -6,6 +6,8 @@ from api.v1.competition import router as comp_router
 from api.v1.registration import router as reg_router
 from api.v1.season import router as season_router
 from api.v1.problem_score import router as problem_score_router
+from api.v1.metrics import router as metrics_router
+from api.v1.export import router as export_router
 
 api_router = APIRouter()
 
@@ -15,4 +17,6 @@ api_router.include_router(comp_router)
 api_router.include_router(reg_router)
 api_router.include_router(season_router)
 api_router.include_router(problem_score_router)
+api_router.include_router(metrics_router)
+api_router.include_router(export_router)
 
@@ -1,12 +1,13 @@
+import asyncio
 from itertools import groupby
 from typing import Annotated, List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import and_, func, select
+from sqlalchemy import case, func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from db.config import get_session
-from db.models import Climber, Competition, Problem, ProblemScore, Registration, Season
+from db.models import Climber, Competition, LeaderboardTotal, Problem, ProblemScore, Season, SeasonStanding
 from schema.season import (
     SeasonCreate,
     SeasonOut,
@@ -16,6 +17,7 @@ from schema.season import (
     SeasonStandingsEntry,
 )
 from security.deps import AdminUser
+from services import leaderboard, ranking
 
 router = APIRouter(prefix="/season", tags=["season"])
 SessionDep = Annotated[AsyncSession, Depends(get_session)]
@@ -64,70 +66,93 @@ async def list_seasons(
 
 @router.get("/{season_id}/standings", response_model=SeasonStandingsResponse)
 async def get_season_standings(season_id: int, session: SessionDep, _: AdminUser):
+    # Concurrent misses share one computation, which outlives any single request
+    # and so opens its own session.
+    async def compute() -> SeasonStandingsResponse:
+        async with AsyncSession(bind=session.bind, expire_on_commit=False) as own:
+            return await _build_standings(own, season_id)
+
+    try:
+        return await leaderboard.standings_cache.get(season_id, compute)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Standings are being computed, try again shortly",
+                            headers={"Retry-After": "1"})
+
+
+async def _build_standings(session: AsyncSession, season_id: int) -> SeasonStandingsResponse:
     season = await session.get(Season, season_id)
     if not season:
         raise HTTPException(status_code=404, detail="Season not found")
 
-    # Aggregate scores per (user, level) across all approved registrations in this season.
-    # Joining through Problem enforces level isolation: a climber who changed levels
-    # in a competition only contributes scores from problems at their registered level.
-    scores_sub = (
-        select(
-            Registration.user_id,
-            Registration.level,
-            func.sum(ProblemScore.ifsc_score).label("total_score"),
-        )
-        .join(Competition, and_(Competition.id == Registration.comp_id, Competition.season_id == season_id))
-        .join(Problem, and_(Problem.competition_id == Registration.comp_id, Problem.level_no == Registration.level))
-        .join(ProblemScore, and_(ProblemScore.problem_id == Problem.id, ProblemScore.user_id == Registration.user_id))
-        .where(Registration.approved.is_(True))
-        .group_by(Registration.user_id, Registration.level)
-        .subquery()
-    )
-
-    ranked_sub = (
+    # season_standing holds each climber's season total per level, maintained on every
+    # score and registration write, so this reads one index range for the season.
+    rows = (await session.execute(
         select(
-            scores_sub.c.level,
-            scores_sub.c.total_score,
+            SeasonStanding.level,
+            SeasonStanding.user_id,
+            SeasonStanding.total_score,
             Climber.firstname,
             Climber.lastname,
             Climber.username,
-            func.rank()
-            .over(
-                partition_by=scores_sub.c.level,
-                order_by=scores_sub.c.total_score.desc(),
-            )
-            .label("rank"),
         )
-        .join(Climber, Climber.id == scores_sub.c.user_id)
-        .subquery()
-    )
-
-    rows = (
-        await session.execute(
-            select(ranked_sub).order_by(ranked_sub.c.level.asc(), ranked_sub.c.rank.asc())
-        )
-    ).mappings().all()
+        .join(Climber, Climber.id == SeasonStanding.user_id)
+        .where(SeasonStanding.season_id == season_id, SeasonStanding.competitions > 0)
+        .order_by(SeasonStanding.level)
+    )).all()
 
     levels: list[LevelStandings] = []
-    for level, group in groupby(rows, key=lambda r: r["level"]):
+    for level, group in groupby(rows, key=lambda r: r.level):
+        group = list(group)
+        totals = ranking.Totals.from_points([r.user_id for r in group], [r.total_score for r in group])
+        tied = ranking.tied_on_points(totals)
+        if tied.any():
+            # Only climbers level on points need their tops, zones and attempts.
+            totals.set_tiebreaks(await _season_tiebreaks(session, season_id, level, totals.user_ids[tied].tolist()))
+        order, ranks = ranking.rank(totals)
         entries = [
             SeasonStandingsEntry(
-                rank=r["rank"],
+                rank=rank,
                 name=(
-                    f"{r['firstname']} {r['lastname']}".strip()
-                    if r["firstname"] or r["lastname"]
-                    else r["username"]
+                    f"{group[i].firstname} {group[i].lastname}".strip()
+                    if group[i].firstname or group[i].lastname
+                    else group[i].username
                 ),
-                total_score=r["total_score"],
+                total_score=group[i].total_score,
             )
-            for r in group
+            for i, rank in zip(order.tolist(), ranks.tolist())
         ]
         levels.append(LevelStandings(level=level, entries=entries))
 
     return SeasonStandingsResponse(season_id=season_id, season_name=season.name, levels=levels)
 
 
+async def _season_tiebreaks(session: AsyncSession, season_id: int, level: int, user_ids: list[int]):
+    """(user_id, tops, zones, attempts to top, attempts to zone) over the climbers' ranked rounds."""
+    zone = ProblemScore.got_top | ProblemScore.got_bonus
+    return (await session.execute(
+        select(
+            ProblemScore.user_id,
+            func.sum(case((ProblemScore.got_top, 1), else_=0)),
+            func.sum(case((zone, 1), else_=0)),
+            func.sum(case((ProblemScore.got_top, func.coalesce(ProblemScore.attempts_to_top, 0)), else_=0)),
+            func.sum(case((zone, func.coalesce(ProblemScore.attempts_to_bonus, ProblemScore.attempts_to_top, 0)),
+                          else_=0)),
+        )
+        .join(Problem, Problem.id == ProblemScore.problem_id)
+        .join(Competition, Competition.id == ProblemScore.competition_id)
+        .join(LeaderboardTotal, (LeaderboardTotal.competition_id == ProblemScore.competition_id)
+              & (LeaderboardTotal.level == Problem.level_no)
+              & (LeaderboardTotal.user_id == ProblemScore.user_id))
+        .where(
+            Competition.season_id == season_id,
+            Problem.level_no == level,
+            LeaderboardTotal.ranked.is_(True),
+            ProblemScore.user_id.in_(user_ids),
+        )
+        .group_by(ProblemScore.user_id)
+    )).all()
+
+
 @router.patch("/{season_id}", response_model=SeasonOut, status_code=status.HTTP_200_OK)
 async def update_season(
         season_id: int,
@@ -152,6 +177,7 @@ async def update_season(
 
     await session.flush()
     await session.commit()
+    leaderboard.standings_cache.invalidate(season_id)
     await session.refresh(season)
     return season
 
@@ -167,4 +193,5 @@ async def delete_season(
         raise HTTPException(status_code=404, detail="Competition not found")
     await session.delete(season)
     await session.commit()
+    leaderboard.standings_cache.invalidate(season_id)
     return None
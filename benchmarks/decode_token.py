@@ -0,0 +1,43 @@
+"""
+CPU cost of decode_token with and without the verified-token cache.
+
+    python -m benchmarks.decode_token [--requests 100000] [--tokens 500]
+
+Simulates `--requests` authenticated requests spread over `--tokens`
+distinct live access tokens (one per connected client).
+"""
+import argparse
+import random
+import time
+
+from security import jwt_tools
+
+
+def _run(tokens: list[str], requests: int, cached: bool) -> float:
+    jwt_tools._verified_tokens.clear()
+    decode = jwt_tools.decode_token if cached else jwt_tools._decode_uncached
+    order = [random.choice(tokens) for _ in range(requests)]
+    start = time.perf_counter()
+    for token in order:
+        decode(token)
+    return time.perf_counter() - start
+
+
+def main(requests: int, n_tokens: int) -> None:
+    tokens = [jwt_tools.create_access_token(i, extra={"username": f"user{i}"}) for i in range(n_tokens)]
+    uncached = _run(tokens, requests, cached=False)
+    cached = _run(tokens, requests, cached=True)
+    per_uncached = uncached / requests * 1e6
+    per_cached = cached / requests * 1e6
+    print(f"uncached: {per_uncached:.2f} us/request ({requests / uncached:,.0f} req/s of CPU)")
+    print(f"cached:   {per_cached:.2f} us/request ({requests / cached:,.0f} req/s of CPU)")
+    print(f"saved:    {per_uncached - per_cached:.2f} us/request, "
+          f"hit rate {jwt_tools._verified_tokens.stats()['hit_rate']:.2%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=100_000)
+    parser.add_argument("--tokens", type=int, default=500)
+    args = parser.parse_args()
+    main(args.requests, args.tokens)
@@ -0,0 +1,92 @@
+"""
+Fan-out cost of the live leaderboard stream on one worker.
+
+    python -m benchmarks.leaderboard_stream [--clients 1000] [--writes 200] [--slow 0.05]
+
+Subscribes `--clients` consumers to one competition (a `--slow` fraction never
+read, like stalled phones), then applies `--writes` score changes to a 7-level
+board and measures the time from each write until every live consumer has the
+diff. Also compares diff size with the full snapshot a poller would download.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from benchmarks._app import percentiles
+from services.broadcast import Broadcaster, encode_event
+from services.leaderboard import diff_boards
+
+LEVELS, PER_LEVEL = 7, 20
+
+
+def _board(scores: dict) -> dict:
+    levels = []
+    for level in range(1, LEVELS + 1):
+        ranked = sorted(((s, uid) for (lvl, uid), s in scores.items() if lvl == level), reverse=True)
+        entries, rank, prev = [], 0, None
+        for i, (s, uid) in enumerate(ranked[:PER_LEVEL]):
+            rank = rank if s == prev else i + 1
+            prev = s
+            entries.append({"rank": rank, "user_id": uid, "name": f"Klättrare {uid}", "total_score": s})
+        levels.append({"level": level, "entries": entries})
+    return {"competition_id": 1, "levels": levels}
+
+
+async def main(clients: int, writes: int, slow: float) -> None:
+    scores = {(lvl, lvl * 1000 + i): 0.0 for lvl in range(1, LEVELS + 1) for i in range(PER_LEVEL)}
+
+    async def load():
+        return _board(scores)
+
+    broadcaster = Broadcaster(diff=diff_boards, debounce=0)
+    subs = [await broadcaster.subscribe(1, load) for _ in range(clients)]
+    n_slow = int(clients * slow)
+    live = subs[n_slow:]
+    received = asyncio.Event()
+    pending = 0
+
+    async def consume(sub, record: bool):
+        nonlocal pending
+        while True:
+            event = await sub.queue.get()
+            if record:
+                diff_bytes.append(len(event))
+            pending -= 1
+            if pending == 0:
+                received.set()
+
+    for sub in live:
+        sub.queue.get_nowait()  # initial snapshot
+    latencies, diff_bytes = [], []
+    consumers = [asyncio.create_task(consume(sub, i == 0)) for i, sub in enumerate(live)]
+
+    for _ in range(writes):
+        key = random.choice(list(scores))
+        scores[key] = round(scores[key] + random.choice([5.0, 9.9, 15.0, 24.9]), 1)
+        pending = len(live)
+        received.clear()
+        start = time.perf_counter()
+        broadcaster.notify(1)
+        await received.wait()
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    for task in consumers:
+        task.cancel()
+    stats = broadcaster.stats()
+    full = len(encode_event("snapshot", _board(scores)))
+    print(f"clients: {clients} ({n_slow} never read), writes: {writes}")
+    print(f"write -> every live client has the diff: {percentiles(latencies)}")
+    print(f"deliveries: {stats['deliveries']:,}, slow-client resyncs: {stats['resyncs']:,}")
+    if n_slow:
+        print(f"max events queued per slow client: {max(s.queue.qsize() for s in subs[:n_slow])}")
+    print(f"bytes per client per write: diff ~{sum(diff_bytes) / len(diff_bytes):,.0f}, full board {full:,}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--writes", type=int, default=200)
+    parser.add_argument("--slow", type=float, default=0.05)
+    args = parser.parse_args()
+    asyncio.run(main(args.clients, args.writes, args.slow))
@@ -0,0 +1,68 @@
+"""
+Latency of an unrelated endpoint while a burst of logins is hashing.
+
+    python -m benchmarks.login_storm [--logins 40] [--sync]
+
+--sync patches the login path back to the blocking verify to show the
+event-loop stall the async hashing pool removes. Argon2 parameters come
+from the usual ARGON2_* variables, so run it with production values.
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks._app import BASE, bench_client, percentiles
+
+
+async def _probe(client, climber_id: int, stop: asyncio.Event, samples: list[float]) -> None:
+    while not stop.is_set():
+        start = time.perf_counter()
+        resp = await client.get(f"{BASE}/climber/{climber_id}")
+        resp.raise_for_status()
+        samples.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.005)
+
+
+async def _measure(client, climber_id: int, logins: int) -> list[float]:
+    stop = asyncio.Event()
+    samples: list[float] = []
+    probe = asyncio.create_task(_probe(client, climber_id, stop, samples))
+    if logins:
+        await asyncio.gather(*(
+            client.post(f"{BASE}/auth/login", json={"username": "storm", "password": "secret123"})
+            for _ in range(logins)
+        ))
+    else:
+        await asyncio.sleep(1.0)
+    stop.set()
+    await probe
+    return samples
+
+
+async def main(logins: int, sync: bool) -> None:
+    if sync:
+        from api.v1 import auth
+        from security.hashing import verify_password
+
+        async def blocking_verify(plain: str, hashed: str) -> bool:
+            return verify_password(plain, hashed)
+
+        auth.verify_password_async = blocking_verify
+
+    async with bench_client() as client:
+        resp = await client.post(f"{BASE}/auth/signup", json={
+            "username": "storm", "password": "secret123", "firstname": "S", "lastname": "T",
+        })
+        climber_id = resp.json()["climber"]["id"]
+
+        print("idle:  ", percentiles(await _measure(client, climber_id, 0)))
+        print("storm: ", percentiles(await _measure(client, climber_id, logins)),
+              f"({logins} logins, {'sync' if sync else 'pooled'} hashing)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--sync", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.sync))
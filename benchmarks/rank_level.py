@@ -0,0 +1,75 @@
+"""
+Cost of ranking one level of season totals with the full IFSC tie-breaks.
+
+    python -m benchmarks.rank_level [--climbers 5000] [--repeat 20]
+
+Builds random per-climber totals (points, tops, zones, attempts) for
+`--climbers` climbers, as season standings load them, and times the NumPy
+lexsort in services.ranking against sorting the same totals in Python with a
+compound key. Competition boards rank in SQL over leaderboard_total and are
+not measured here.
+"""
+import argparse
+import random
+import time
+
+from benchmarks._app import percentiles
+from services import ranking
+
+
+def _rows(climbers: int) -> list:
+    """(user_id, points, tops, zones, top_attempts, zone_attempts), with many ties on points."""
+    rng = random.Random(1)
+    rows = []
+    for uid in range(1, climbers + 1):
+        tops = rng.randint(0, 8)
+        zones = tops + rng.randint(0, 8 - tops)
+        top_attempts = tops + rng.randint(0, 2 * tops)
+        zone_attempts = zones + rng.randint(0, zones)
+        points = round(tops * 25 + (zones - tops) * 15 - rng.randint(0, 10) * 0.1, 1)
+        rows.append((uid, points, tops, zones, top_attempts, zone_attempts))
+    return rows
+
+
+def _python(rows) -> list:
+    return [r[0] for r in sorted(rows, key=lambda r: (-round(r[1], 1), -r[2], -r[3], r[4], r[5], r[0]))]
+
+
+def _totals(rows) -> ranking.Totals:
+    totals = ranking.Totals.from_points([r[0] for r in rows], [r[1] for r in rows])
+    totals.set_tiebreaks([(r[0], *r[2:]) for r in rows])
+    return totals
+
+
+def _numpy(rows) -> list:
+    totals = _totals(rows)
+    order, _ = ranking.rank(totals)
+    return totals.user_ids[order].tolist()
+
+
+def _time(label: str, repeat: int, fn) -> list:
+    samples, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    print(f"{label:<16} {percentiles(samples)}")
+    return result
+
+
+def main(climbers: int, repeat: int) -> None:
+    rows = _rows(climbers)
+    print(f"{climbers} climbers")
+    expected = _time("python sort", repeat, lambda: _python(rows))
+    actual = _time("numpy lexsort", repeat, lambda: _numpy(rows))
+    assert actual == expected, "orderings differ"
+    totals = _totals(rows)
+    _time("  rank only", repeat, lambda: ranking.rank(totals))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--climbers", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    main(args.climbers, args.repeat)
@@ -0,0 +1,129 @@
+"""
+Statements and latency of an 8-problem batch score write.
+
+    python -m benchmarks.score_batch [--batches 200]
+
+Times PUT .../scores/batch, now one INSERT ... SELECT ... ON CONFLICT for the
+whole batch, against the ORM loop it replaced (load problems, load scores
+FOR UPDATE, mutate, flush), mounted on a side route for the run. Both keep
+leaderboard_total the same way, so the difference is the score write itself.
+"""
+import argparse
+import asyncio
+import time
+from typing import Dict
+
+from benchmarks._app import BASE, bench_client, percentiles
+
+from fastapi import HTTPException
+from sqlalchemy import event, select, update
+from sqlalchemy.engine import Engine
+
+from api.v1.problem_score import SessionDep, _require_registration, _score_values
+from db.config import get_session
+from db.models import Climber, Problem, ProblemScore, UserScope
+from main import app
+from schema.problem_score import ProblemScoreBulkRequest
+from security.deps import CurrentUser
+from services import leaderboard
+
+LEGACY = "/bench/competitions/{comp_id}/level/{level}/scores/batch"
+
+
+async def legacy_batch(comp_id: int, level: int, body: ProblemScoreBulkRequest,
+                       session: SessionDep, current: CurrentUser) -> None:
+    await _require_registration(session, comp_id, current.id, level)
+    problems = (await session.execute(select(Problem).where(
+        Problem.competition_id == comp_id,
+        Problem.level_no == level,
+        Problem.problem_no.in_([item.problem_no for item in body.items]),
+    ))).scalars().all()
+    if len(problems) != len(body.items):
+        raise HTTPException(status_code=404, detail="Problems not found")
+    problem_by_no: Dict[int, Problem] = {p.problem_no: p for p in problems}
+
+    before = await leaderboard.lock_total(session, comp_id, current.id, level)
+    existing = {ps.problem_id: ps for ps in (await session.execute(select(ProblemScore).where(
+        ProblemScore.competition_id == comp_id,
+        ProblemScore.user_id == current.id,
+        ProblemScore.problem_id.in_([p.id for p in problems]),
+    ).with_for_update())).scalars().all()}
+    for item in body.items:
+        prob = problem_by_no[item.problem_no]
+        ps = existing.get(prob.id)
+        if ps is None:
+            ps = ProblemScore(competition_id=comp_id, problem_id=prob.id, user_id=current.id)
+            session.add(ps)
+        for field, value in _score_values(item).items():
+            setattr(ps, field, value)
+    await session.flush()
+    await leaderboard.refresh_total(session, comp_id, current.id, level, before)
+    await session.commit()
+    leaderboard.invalidate(comp_id)
+
+
+def _items(i: int) -> list:
+    attempts = i % 5 + 1
+    return [
+        {"problem_no": no, "attempts_total": attempts, "got_bonus": True, "got_top": bool(no % 2),
+         "attempts_to_bonus": 1, "attempts_to_top": attempts if no % 2 else None}
+        for no in range(1, 9)
+    ]
+
+
+async def _run(client, url: str, headers: dict, batches: int) -> tuple:
+    statements = 0
+
+    def count(*args):
+        nonlocal statements
+        statements += 1
+
+    samples = []
+    event.listen(Engine, "before_cursor_execute", count)
+    try:
+        for i in range(batches):
+            start = time.perf_counter()
+            resp = await client.put(url, json={"items": _items(i)}, headers=headers)
+            samples.append((time.perf_counter() - start) * 1000)
+            assert resp.status_code == 200, resp.text
+    finally:
+        event.remove(Engine, "before_cursor_execute", count)
+    return samples, statements / batches
+
+
+async def main(batches: int) -> None:
+    app.add_api_route(LEGACY, legacy_batch, methods=["PUT"])
+    async with bench_client() as client:
+        resp = await client.post(f"{BASE}/auth/signup", json={
+            "username": "bench", "password": "secret123", "firstname": "B", "lastname": "",
+        })
+        user_id = resp.json()["climber"]["id"]
+        headers = {"Authorization": f"Bearer {resp.json()['access_token']}"}
+        async for session in app.dependency_overrides[get_session]():
+            await session.execute(update(Climber).where(Climber.id == user_id).values(user_scope=UserScope.admin))
+            await session.commit()
+
+        season = await client.post(f"{BASE}/season", json={"name": "Bench", "year": 2026}, headers=headers)
+        comp = await client.post(f"{BASE}/competition", json={
+            "name": "Bench", "comp_type": "QUALIFIER", "comp_date": "2026-03-01",
+            "season_id": season.json()["id"], "round_no": 1,
+        }, headers=headers)
+        comp_id = comp.json()["id"]
+        await client.post(f"{BASE}/competition/{comp_id}/register", json={"level": 1}, headers=headers)
+        await client.patch(f"{BASE}/competition/{comp_id}/registration/{user_id}",
+                           json={"approved": True}, headers=headers)
+
+        for label, url in [
+            ("orm loop", LEGACY.format(comp_id=comp_id, level=1)),
+            ("single upsert", f"{BASE}/competitions/{comp_id}/level/1/scores/batch"),
+        ]:
+            await _run(client, url, headers, 10)  # warm up
+            samples, per_batch = await _run(client, url, headers, batches)
+            print(f"{label:<14} {per_batch:4.1f} statements/batch  {percentiles(samples)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batches", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.batches))
@@ -0,0 +1,7 @@
+-- migrate:up
+ALTER TABLE public.climber
+ADD COLUMN token_version integer NOT NULL DEFAULT 0;
+
+-- migrate:down
+ALTER TABLE public.climber
+DROP COLUMN IF EXISTS token_version;
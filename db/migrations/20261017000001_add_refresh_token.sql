@@ -0,0 +1,16 @@
+-- migrate:up
+CREATE TABLE public.refresh_token (
+    jti text PRIMARY KEY,
+    family_id text NOT NULL,
+    user_id bigint NOT NULL REFERENCES public.climber(id) ON DELETE CASCADE,
+    expires_at timestamptz NOT NULL,
+    created_at timestamptz NOT NULL DEFAULT now(),
+    rotated_at timestamptz
+);
+
+CREATE INDEX refresh_token_user_idx ON public.refresh_token (user_id);
+CREATE INDEX refresh_token_family_idx ON public.refresh_token (family_id);
+CREATE INDEX refresh_token_expires_idx ON public.refresh_token (expires_at);
+
+-- migrate:down
+DROP TABLE IF EXISTS public.refresh_token;
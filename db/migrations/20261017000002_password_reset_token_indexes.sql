@@ -0,0 +1,14 @@
+-- migrate:up
+-- confirm_password_reset looks up by token, which its UNIQUE index already covers.
+
+-- request_password_reset invalidates by (user_id, used); also covers the FK
+DROP INDEX IF EXISTS public.password_reset_token_user_id_idx;
+CREATE INDEX password_reset_token_user_used_idx ON public.password_reset_token (user_id, used);
+
+-- purge job
+CREATE INDEX password_reset_token_expires_idx ON public.password_reset_token (expires_at);
+
+-- migrate:down
+DROP INDEX IF EXISTS public.password_reset_token_expires_idx;
+DROP INDEX IF EXISTS public.password_reset_token_user_used_idx;
+CREATE INDEX password_reset_token_user_id_idx ON public.password_reset_token (user_id);
@@ -0,0 +1,22 @@
+-- migrate:up
+CREATE TABLE public.email_outbox (
+    id bigserial PRIMARY KEY,
+    recipient text NOT NULL,
+    subject text NOT NULL,
+    body_html text NOT NULL,
+    body_text text,
+    status text NOT NULL DEFAULT 'pending',
+    attempts integer NOT NULL DEFAULT 0,
+    next_attempt_at timestamptz NOT NULL DEFAULT now(),
+    last_error text,
+    created_at timestamptz NOT NULL DEFAULT now(),
+    sent_at timestamptz,
+    CONSTRAINT email_outbox_status_check CHECK (status IN ('pending', 'sent', 'failed'))
+);
+
+CREATE INDEX email_outbox_due_idx ON public.email_outbox (status, next_attempt_at);
+-- purge of sent rows past MAIL_SENT_RETENTION_S
+CREATE INDEX email_outbox_sent_idx ON public.email_outbox (sent_at) WHERE status = 'sent';
+
+-- migrate:down
+DROP TABLE IF EXISTS public.email_outbox;
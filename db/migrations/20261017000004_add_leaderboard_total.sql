@@ -0,0 +1,29 @@
+-- migrate:up
+CREATE TABLE public.leaderboard_total (
+    competition_id bigint NOT NULL REFERENCES public.competition(id) ON DELETE CASCADE,
+    level integer NOT NULL,
+    user_id bigint NOT NULL REFERENCES public.climber(id) ON DELETE CASCADE,
+    total_score numeric(10, 1) NOT NULL DEFAULT 0,
+    ranked boolean NOT NULL DEFAULT false,
+    updated_at timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY (competition_id, level, user_id)
+);
+
+CREATE INDEX leaderboard_total_ranked_idx
+    ON public.leaderboard_total (competition_id, level, total_score DESC)
+    WHERE ranked;
+
+-- Backfill: totals from existing scores, then one (possibly empty) row per registration
+INSERT INTO public.leaderboard_total (competition_id, level, user_id, total_score)
+SELECT ps.competition_id, p.level_no, ps.user_id, round(sum(ps.ifsc_score)::numeric, 1)
+FROM public.problem_score ps
+JOIN public.problem p ON p.id = ps.problem_id
+GROUP BY ps.competition_id, p.level_no, ps.user_id;
+
+INSERT INTO public.leaderboard_total (competition_id, level, user_id, ranked)
+SELECT r.comp_id, r.level, r.user_id, r.approved
+FROM public.registration r
+ON CONFLICT (competition_id, level, user_id) DO UPDATE SET ranked = EXCLUDED.ranked;
+
+-- migrate:down
+DROP TABLE IF EXISTS public.leaderboard_total;
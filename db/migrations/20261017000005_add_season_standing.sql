@@ -0,0 +1,29 @@
+-- migrate:up
+CREATE TABLE public.season_standing (
+    season_id bigint NOT NULL REFERENCES public.season(id) ON DELETE CASCADE,
+    level integer NOT NULL,
+    user_id bigint NOT NULL REFERENCES public.climber(id) ON DELETE CASCADE,
+    total_score numeric(10, 1) NOT NULL DEFAULT 0,
+    competitions integer NOT NULL DEFAULT 0,
+    updated_at timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY (season_id, level, user_id)
+);
+
+CREATE INDEX season_standing_rank_idx
+    ON public.season_standing (season_id, level, total_score DESC)
+    WHERE competitions > 0;
+
+-- Backfill; same query as `python -m services.standings`
+INSERT INTO public.season_standing (season_id, level, user_id, total_score, competitions)
+SELECT c.season_id, r.level, r.user_id,
+       round(coalesce(sum(ps.ifsc_score), 0)::numeric, 1),
+       count(DISTINCT r.comp_id)
+FROM public.registration r
+JOIN public.competition c ON c.id = r.comp_id
+LEFT JOIN public.problem p ON p.competition_id = r.comp_id AND p.level_no = r.level
+LEFT JOIN public.problem_score ps ON ps.problem_id = p.id AND ps.user_id = r.user_id
+WHERE r.approved
+GROUP BY c.season_id, r.level, r.user_id;
+
+-- migrate:down
+DROP TABLE IF EXISTS public.season_standing;
@@ -0,0 +1,12 @@
+-- migrate:up
+-- user_id breaks ties so keyset pages ("after score S, user U") are one index range.
+DROP INDEX IF EXISTS public.leaderboard_total_ranked_idx;
+CREATE INDEX leaderboard_total_ranked_idx
+    ON public.leaderboard_total (competition_id, level, total_score DESC, user_id)
+    WHERE ranked;
+
+-- migrate:down
+DROP INDEX IF EXISTS public.leaderboard_total_ranked_idx;
+CREATE INDEX leaderboard_total_ranked_idx
+    ON public.leaderboard_total (competition_id, level, total_score DESC)
+    WHERE ranked;
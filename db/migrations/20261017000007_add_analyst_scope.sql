@@ -0,0 +1,12 @@
+-- migrate:up transaction:false
+ALTER TYPE user_scope_t ADD VALUE IF NOT EXISTS 'analyst';
+
+-- migrate:down
+UPDATE climber SET user_scope = 'climber' WHERE user_scope = 'analyst';
+ALTER TYPE user_scope_t RENAME TO user_scope_t_old;
+CREATE TYPE user_scope_t AS ENUM ('climber', 'admin');
+ALTER TABLE climber
+    ALTER COLUMN user_scope DROP DEFAULT,
+    ALTER COLUMN user_scope TYPE user_scope_t USING user_scope::text::user_scope_t,
+    ALTER COLUMN user_scope SET DEFAULT 'climber'::user_scope_t;
+DROP TYPE user_scope_t_old;
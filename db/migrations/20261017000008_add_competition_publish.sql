@@ -0,0 +1,7 @@
+-- migrate:up
+ALTER TABLE public.competition
+    ADD COLUMN published boolean NOT NULL DEFAULT false;
+
+-- migrate:down
+ALTER TABLE public.competition
+    DROP COLUMN IF EXISTS published;
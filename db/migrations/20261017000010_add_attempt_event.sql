@@ -0,0 +1,22 @@
+-- migrate:up
+CREATE TABLE public.attempt_event (
+    id bigserial PRIMARY KEY,
+    competition_id bigint NOT NULL REFERENCES public.competition(id) ON DELETE CASCADE,
+    problem_id bigint NOT NULL REFERENCES public.problem(id) ON DELETE CASCADE,
+    user_id bigint NOT NULL REFERENCES public.climber(id) ON DELETE CASCADE,
+    kind text NOT NULL,
+    created_at timestamptz NOT NULL DEFAULT now(),
+    CONSTRAINT attempt_event_kind_check CHECK (kind IN ('attempt', 'zone', 'top'))
+);
+
+CREATE TABLE public.event_projection (
+    name text PRIMARY KEY,
+    last_event_id bigint NOT NULL DEFAULT 0,
+    updated_at timestamptz NOT NULL DEFAULT now()
+);
+
+INSERT INTO public.event_projection (name) VALUES ('problem_score');
+
+-- migrate:down
+DROP TABLE IF EXISTS public.event_projection;
+DROP TABLE IF EXISTS public.attempt_event;
@@ -0,0 +1,12 @@
+-- migrate:up
+ALTER TABLE public.email_outbox ADD COLUMN locked_until timestamptz;
+ALTER TABLE public.email_outbox DROP CONSTRAINT email_outbox_status_check;
+ALTER TABLE public.email_outbox
+    ADD CONSTRAINT email_outbox_status_check CHECK (status IN ('pending', 'sending', 'sent', 'failed'));
+
+-- migrate:down
+UPDATE public.email_outbox SET status = 'pending' WHERE status = 'sending';
+ALTER TABLE public.email_outbox DROP CONSTRAINT email_outbox_status_check;
+ALTER TABLE public.email_outbox
+    ADD CONSTRAINT email_outbox_status_check CHECK (status IN ('pending', 'sent', 'failed'));
+ALTER TABLE public.email_outbox DROP COLUMN locked_until;
@@ -0,0 +1,37 @@
+-- migrate:up
+-- IFSC tie-breaks next to the total, so every leaderboard endpoint orders by
+-- points, tops, zones, attempts to top, attempts to zone from the index alone.
+ALTER TABLE public.leaderboard_total
+    ADD COLUMN tops integer NOT NULL DEFAULT 0,
+    ADD COLUMN zones integer NOT NULL DEFAULT 0,
+    ADD COLUMN top_attempts integer NOT NULL DEFAULT 0,
+    ADD COLUMN zone_attempts integer NOT NULL DEFAULT 0;
+
+UPDATE public.leaderboard_total lt
+SET tops = s.tops, zones = s.zones, top_attempts = s.top_attempts, zone_attempts = s.zone_attempts
+FROM (
+    SELECT ps.competition_id, p.level_no, ps.user_id,
+           count(*) FILTER (WHERE ps.got_top) AS tops,
+           count(*) FILTER (WHERE ps.got_top OR ps.got_bonus) AS zones,
+           coalesce(sum(coalesce(ps.attempts_to_top, 0)) FILTER (WHERE ps.got_top), 0) AS top_attempts,
+           coalesce(sum(coalesce(ps.attempts_to_bonus, ps.attempts_to_top, 0))
+                    FILTER (WHERE ps.got_top OR ps.got_bonus), 0) AS zone_attempts
+    FROM public.problem_score ps
+    JOIN public.problem p ON p.id = ps.problem_id
+    GROUP BY ps.competition_id, p.level_no, ps.user_id
+) s
+WHERE lt.competition_id = s.competition_id AND lt.level = s.level_no AND lt.user_id = s.user_id;
+
+DROP INDEX IF EXISTS public.leaderboard_total_ranked_idx;
+CREATE INDEX leaderboard_total_ranked_idx
+    ON public.leaderboard_total
+       (competition_id, level, total_score DESC, tops DESC, zones DESC, top_attempts, zone_attempts, user_id)
+    WHERE ranked;
+
+-- migrate:down
+DROP INDEX IF EXISTS public.leaderboard_total_ranked_idx;
+CREATE INDEX leaderboard_total_ranked_idx
+    ON public.leaderboard_total (competition_id, level, total_score DESC, user_id)
+    WHERE ranked;
+ALTER TABLE public.leaderboard_total
+    DROP COLUMN tops, DROP COLUMN zones, DROP COLUMN top_attempts, DROP COLUMN zone_attempts;
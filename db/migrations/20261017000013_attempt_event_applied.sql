@@ -0,0 +1,29 @@
+-- migrate:up
+-- Mark each event as applied instead of keeping a last-applied-id watermark:
+-- ids commit out of order, and an event committed behind a higher applied id
+-- fell below the watermark and was never projected.
+ALTER TABLE public.attempt_event
+    ADD COLUMN applied_at timestamptz;
+
+UPDATE public.attempt_event
+SET applied_at = now()
+WHERE id <= (SELECT last_event_id FROM public.event_projection WHERE name = 'problem_score');
+
+CREATE INDEX attempt_event_pending_idx
+    ON public.attempt_event (id)
+    WHERE applied_at IS NULL;
+
+ALTER TABLE public.event_projection
+    DROP COLUMN last_event_id;
+
+-- migrate:down
+ALTER TABLE public.event_projection
+    ADD COLUMN last_event_id bigint NOT NULL DEFAULT 0;
+
+UPDATE public.event_projection
+SET last_event_id = coalesce((SELECT max(id) FROM public.attempt_event WHERE applied_at IS NOT NULL), 0)
+WHERE name = 'problem_score';
+
+DROP INDEX IF EXISTS public.attempt_event_pending_idx;
+ALTER TABLE public.attempt_event
+    DROP COLUMN applied_at;
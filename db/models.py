@@ -16,6 +16,7 @@ from sqlalchemy import (
     UniqueConstraint,
     BigInteger,
     func,
+    text,
 )
 from sqlalchemy.orm import (
     DeclarativeBase,
@@ -35,6 +36,8 @@ class CompType(PyEnum):
 
 class UserScope(str, PyEnum):
     climber = "climber"
+    setter = "setter"
+    analyst = "analyst"
     admin = "admin"
 
 
@@ -56,14 +59,21 @@ class Climber(Base):
         nullable=False,
         default=UserScope.climber,
     )
+    # Bumped on password/scope change to revoke stateless access tokens
+    token_version: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
 
     registrations: Mapped[List["Registration"]] = relationship(back_populates="user", cascade="all, delete-orphan")
     problem_scores: Mapped[List["ProblemScore"]] = relationship(back_populates="user", cascade="all, delete-orphan")
     password_reset_tokens: Mapped[List["PasswordResetToken"]] = relationship(back_populates="user", cascade="all, delete-orphan")
+    refresh_tokens: Mapped[List["RefreshToken"]] = relationship(back_populates="user", cascade="all, delete-orphan")
 
 
 class PasswordResetToken(Base):
     __tablename__ = "password_reset_token"
+    __table_args__ = (
+        Index("password_reset_token_user_used_idx", "user_id", "used"),
+        Index("password_reset_token_expires_idx", "expires_at"),
+    )
 
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("climber.id", ondelete="CASCADE"), nullable=False)
@@ -75,6 +85,51 @@ class PasswordResetToken(Base):
     user: Mapped["Climber"] = relationship(back_populates="password_reset_tokens")
 
 
+class RefreshToken(Base):
+    """
+    One row per login session; `jti` is replaced on every rotation. `family_id`
+    is the login's first jti and is carried by every token rotated from it.
+    """
+    __tablename__ = "refresh_token"
+    __table_args__ = (
+        Index("refresh_token_user_idx", "user_id"),
+        Index("refresh_token_family_idx", "family_id"),
+        Index("refresh_token_expires_idx", "expires_at"),
+    )
+
+    jti: Mapped[str] = mapped_column(Text, primary_key=True)
+    family_id: Mapped[str] = mapped_column(Text, nullable=False)
+    user_id: Mapped[int] = mapped_column(ForeignKey("climber.id", ondelete="CASCADE"), nullable=False)
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    rotated_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
+
+    user: Mapped["Climber"] = relationship(back_populates="refresh_tokens")
+
+
+class EmailOutbox(Base):
+    __tablename__ = "email_outbox"
+    __table_args__ = (
+        CheckConstraint("status IN ('pending', 'sending', 'sent', 'failed')", name="email_outbox_status_check"),
+        Index("email_outbox_due_idx", "status", "next_attempt_at"),
+        Index("email_outbox_sent_idx", "sent_at",
+              postgresql_where=text("status = 'sent'"), sqlite_where=text("status = 'sent'")),
+    )
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    recipient: Mapped[str] = mapped_column(Text, nullable=False)
+    subject: Mapped[str] = mapped_column(Text, nullable=False)
+    body_html: Mapped[str] = mapped_column(Text, nullable=False)
+    body_text: Mapped[Optional[str]] = mapped_column(Text)
+    status: Mapped[str] = mapped_column(Text, nullable=False, default="pending", server_default="pending")
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    last_error: Mapped[Optional[str]] = mapped_column(Text)
+    locked_until: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))  # lease while 'sending'
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    sent_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
+
+
 class Season(Base):
     __tablename__ = "season"
 
@@ -96,6 +151,8 @@ class Competition(Base):
     comp_date: Mapped[date] = mapped_column(Date, nullable=False)
     season_id: Mapped[int] = mapped_column(ForeignKey("season.id", ondelete="CASCADE"), nullable=False)
     round_no: Mapped[Optional[int]] = mapped_column(Integer)
+    # Published boards are served without auth
+    published: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False, server_default="false")
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
 
@@ -130,6 +187,10 @@ class Registration(Base):
 
 class Problem(Base):
     __tablename__ = "problem"
+    __table_args__ = (
+        UniqueConstraint("competition_id", "level_no", "problem_no",
+                         name="problem_competition_id_level_no_problem_no_key"),
+    )
 
     id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
     competition_id: Mapped[int] = mapped_column(ForeignKey("competition.id", ondelete="CASCADE"), nullable=False)
@@ -162,3 +223,106 @@ class ProblemScore(Base):
     competition: Mapped["Competition"] = relationship(back_populates="problem_scores")
     problem: Mapped["Problem"] = relationship(back_populates="scores")
     user: Mapped["Climber"] = relationship(back_populates="problem_scores")
+
+
+class LeaderboardTotal(Base):
+    """
+    Running ifsc_score total per (competition, level, climber), kept in step with
+    problem_score by the score endpoints, with the IFSC tie-break sums (tops,
+    zones, attempts to them). `ranked` is true when the climber has an approved
+    registration at this level, i.e. the row belongs on the leaderboard.
+    """
+    __tablename__ = "leaderboard_total"
+
+    competition_id: Mapped[int] = mapped_column(ForeignKey("competition.id", ondelete="CASCADE"), primary_key=True)
+    level: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("climber.id", ondelete="CASCADE"), primary_key=True)
+    total_score: Mapped[float] = mapped_column(Numeric(10, 1, asdecimal=False), nullable=False, default=0,
+                                               server_default="0")
+    tops: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    zones: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    top_attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    zone_attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    ranked: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False, server_default="false")
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+
+# Board order, so every leaderboard endpoint reads it as one index range
+Index(
+    "leaderboard_total_ranked_idx",
+    LeaderboardTotal.competition_id,
+    LeaderboardTotal.level,
+    LeaderboardTotal.total_score.desc(),
+    LeaderboardTotal.tops.desc(),
+    LeaderboardTotal.zones.desc(),
+    LeaderboardTotal.top_attempts,
+    LeaderboardTotal.zone_attempts,
+    LeaderboardTotal.user_id,
+    postgresql_where=LeaderboardTotal.ranked,
+    sqlite_where=LeaderboardTotal.ranked,
+)
+
+
+class SeasonStanding(Base):
+    """
+    Season total per (season, level, climber): the sum of their ranked
+    leaderboard_total rows in the season's competitions. `competitions` counts
+    those rows; climbers with none are not on the standings.
+    """
+    __tablename__ = "season_standing"
+
+    season_id: Mapped[int] = mapped_column(ForeignKey("season.id", ondelete="CASCADE"), primary_key=True)
+    level: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("climber.id", ondelete="CASCADE"), primary_key=True)
+    total_score: Mapped[float] = mapped_column(Numeric(10, 1, asdecimal=False), nullable=False, default=0,
+                                               server_default="0")
+    competitions: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+
+Index(
+    "season_standing_rank_idx",
+    SeasonStanding.season_id,
+    SeasonStanding.level,
+    SeasonStanding.total_score.desc(),
+    postgresql_where=SeasonStanding.competitions > 0,
+    sqlite_where=SeasonStanding.competitions > 0,
+)
+
+
+class AttemptEvent(Base):
+    """
+    One logged attempt, zone or top, appended by the attempts endpoint and
+    folded into problem_score by services.attempts. `zone` and `top` refer to
+    the climber's latest attempt on the problem.
+    """
+    __tablename__ = "attempt_event"
+    __table_args__ = (
+        CheckConstraint("kind IN ('attempt', 'zone', 'top')", name="attempt_event_kind_check"),
+    )
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    competition_id: Mapped[int] = mapped_column(ForeignKey("competition.id", ondelete="CASCADE"), nullable=False)
+    problem_id: Mapped[int] = mapped_column(ForeignKey("problem.id", ondelete="CASCADE"), nullable=False)
+    user_id: Mapped[int] = mapped_column(ForeignKey("climber.id", ondelete="CASCADE"), nullable=False)
+    kind: Mapped[str] = mapped_column(Text, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    # Set by the projector in the transaction that folds the event into problem_score
+    applied_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
+
+
+# The projector's queue: only events not yet applied
+Index(
+    "attempt_event_pending_idx",
+    AttemptEvent.id,
+    postgresql_where=AttemptEvent.applied_at.is_(None),
+    sqlite_where=AttemptEvent.applied_at.is_(None),
+)
+
+
+class EventProjection(Base):
+    """One row per projector, locked while it applies a batch so only one runs at a time."""
+    __tablename__ = "event_projection"
+
+    name: Mapped[str] = mapped_column(Text, primary_key=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
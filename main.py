@@ -1,17 +1,44 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 
 from api.router import api_router
+from security.hashing import HashingOverloaded, shutdown_hash_pool
+from services import background, mail_templates
+from services.idempotency import IdempotencyMiddleware
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    mail_templates.warm()
+    background.start()
+    yield
+    await background.stop()
+    shutdown_hash_pool()
 
 
 app = FastAPI(title="Grepp API (FastAPI Edition)",
     version="1.0.0",
+    lifespan=lifespan,
     swagger_ui_parameters={
         "persistAuthorization": True,
     },
 )
 
+# Retried score and registration writes; added before CORS so replays still get CORS headers
+app.add_middleware(
+    IdempotencyMiddleware,
+    routes=[
+        ("PUT", "/api/v1/competitions/{comp_id}/level/{level_no}/problems/{problem_no}/score"),
+        ("POST", "/api/v1/competitions/{comp_id}/level/{level_no}/problems/{problem_no}/attempts"),
+        ("PUT", "/api/v1/competitions/{comp_id}/level/{level}/scores/batch"),
+        ("PUT", "/api/v1/competitions/{comp_id}/level/{level}/scores/judge"),
+        ("POST", "/api/v1/competition/{comp_id}/register"),
+    ],
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["https://grepp.vercel.app", "http://localhost:5173"],
@@ -23,6 +50,16 @@ app.add_middleware(
 app.include_router(api_router)
 
 
+@app.exception_handler(HashingOverloaded)
+async def hashing_overloaded_handler(_request: Request, exc: HashingOverloaded):
+    """Shed login/signup bursts instead of queueing until the container runs out of memory."""
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Too many requests, try again shortly"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
 @app.exception_handler(Exception)
 async def unhandled_exception_handler(_request: Request, _exc: Exception):
     """Catch-all so unhandled 500s still pass through CORSMiddleware."""
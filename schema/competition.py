@@ -18,6 +18,7 @@ class CompetitionCreate(BaseModel):
     comp_date: date
     season_id: int
     round_no: Optional[conint(ge=1, le=4)] = None
+    published: bool = False
 
     @model_validator(mode="after")
     def _check_round_vs_type(self):
@@ -36,6 +37,7 @@ class CompetitionUpdate(BaseModel):
     comp_date: Optional[date] = None
     season_id: Optional[int] = None
     round_no: Optional[conint(ge=1, le=4)] = None
+    published: Optional[bool] = None
 
 
 class CompetitionOut(BaseModel):
@@ -46,12 +48,14 @@ class CompetitionOut(BaseModel):
     comp_date: date
     season_id: int
     round_no: Optional[int]
+    published: bool = False
 
     model_config = {"from_attributes": True}
 
 
 class LeaderboardEntry(BaseModel):
     rank: int
+    user_id: int
     name: str
     total_score: float
 
@@ -64,3 +68,35 @@ class LevelLeaderboard(BaseModel):
 class LeaderboardResponse(BaseModel):
     competition_id: int
     levels: list[LevelLeaderboard]
+
+
+class PublicLeaderboardEntry(BaseModel):
+    """A board entry as shown without auth: no internal ids."""
+    rank: int
+    name: str
+    total_score: float
+
+
+class PublicLevelLeaderboard(BaseModel):
+    level: int
+    entries: list[PublicLeaderboardEntry]
+
+
+class PublicLeaderboardResponse(BaseModel):
+    competition_id: int
+    levels: list[PublicLevelLeaderboard]
+
+
+class LeaderboardPage(BaseModel):
+    competition_id: int
+    level: int
+    entries: list[LeaderboardEntry]
+    next_cursor: Optional[str] = None  # pass as `after` for the next page; None on the last page
+
+
+class MyRankResponse(BaseModel):
+    competition_id: int
+    level: int
+    rank: int
+    total_score: float
+    entries: list[LeaderboardEntry]  # up to `window` climbers either side, including you
@@ -1,4 +1,5 @@
-from typing import Optional, List
+from datetime import datetime
+from typing import Literal, Optional, List
 
 from pydantic import BaseModel, ConfigDict, conint, model_validator
 from pydantic import Field
@@ -51,6 +52,22 @@ class ProblemScoreBulkRequest(BaseModel):
         return self
 
 
+class JudgeScoreItem(ProblemScoreUpsert):
+    user_id: int
+    problem_no: conint(ge=1, le=8)
+
+
+class JudgeScoreRequest(BaseModel):
+    items: List[JudgeScoreItem] = Field(min_length=1, max_length=2000)
+
+    @model_validator(mode="after")
+    def _unique_scores(self):
+        keys = [(i.user_id, i.problem_no) for i in self.items]
+        if len(keys) != len(set(keys)):
+            raise ValueError("Duplicate (user_id, problem_no) in payload")
+        return self
+
+
 class ProblemScoreOutBulk(BaseModel):
     attempts_total: int
     got_bonus: bool
@@ -68,4 +85,21 @@ class ProblemScoreOut(ProblemScoreOutBulk):
 
 class ProblemScoreBulkResult(BaseModel):
     problem_no: int
-    score: ProblemScoreOutBulk
\ No newline at end of file
+    score: ProblemScoreOutBulk
+
+
+class JudgeScoreResult(BaseModel):
+    user_id: int
+    problem_no: int
+    score: ProblemScoreOutBulk
+
+
+class AttemptEventCreate(BaseModel):
+    # `zone` and `top` mark the latest attempt; log the `attempt` first
+    kind: Literal["attempt", "zone", "top"]
+
+
+class AttemptEventOut(BaseModel):
+    id: int
+    kind: str
+    created_at: datetime
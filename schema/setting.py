@@ -10,6 +10,9 @@ class Settings(BaseModel):
     ACCESS_TTL: int = int(os.getenv("ACCESS_TTL_MIN", "15"))
     REFRESH_TTL: int = int(os.getenv("REFRESH_TTL_DAYS", "7"))
     ISSUER: str = os.getenv("JWT_ISSUER", "climb-api")
+    # Embed scope + token_version in access tokens and authorize from the claims alone
+    STATELESS_ACCESS_TOKENS: bool = os.getenv("STATELESS_ACCESS_TOKENS", "false").lower() == "true"
+    TOKEN_VERSION_CACHE_TTL: float = float(os.getenv("TOKEN_VERSION_CACHE_TTL_S", "30"))
 
     @property
     def access_delta(self) -> timedelta:
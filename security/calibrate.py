@@ -0,0 +1,203 @@
+"""
+Benchmark Argon2 on this host and recommend ARGON2_* settings.
+
+    python -m security.calibrate --target-ms 250 --target-lps 20 --report argon2-calibration.json
+
+Every candidate (memory, time cost, parallelism) is timed at several
+concurrency levels, capped by how many hashes fit in HASH_MEMORY_BUDGET_MIB.
+The recommendation is the strongest candidate whose p95 verify latency stays
+under --target-ms while sustaining at least --target-lps verifications per
+second. The JSON report records the host, the targets and every measurement,
+so keep it with the deployment it was run for.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import List, Optional, Sequence
+
+from passlib.context import CryptContext
+
+from security.hashing import HASH_CPU_BUDGET, HASH_MEMORY_BUDGET_MIB
+
+DEFAULT_MEMORY_KIB = (19456, 47104, 65536, 131072)
+DEFAULT_TIME_COSTS = (1, 2, 3, 4)
+DEFAULT_PARALLELISM = (1, 2)
+_PASSWORD = "calibration-password"
+
+
+@dataclass
+class LevelResult:
+    concurrency: int
+    p50_ms: float
+    p95_ms: float
+    verifies_per_sec: float
+
+
+@dataclass
+class CandidateResult:
+    memory_kib: int
+    time_cost: int
+    parallelism: int
+    max_concurrency: int
+    levels: List[LevelResult] = field(default_factory=list)
+
+    @property
+    def strength(self) -> int:
+        return self.memory_kib * self.time_cost
+
+    def best_level(self, target_ms: float) -> Optional[LevelResult]:
+        """Highest-throughput level that still meets the latency target."""
+        ok = [lvl for lvl in self.levels if lvl.p95_ms <= target_ms]
+        return max(ok, key=lambda lvl: lvl.verifies_per_sec, default=None)
+
+
+def _context(memory_kib: int, time_cost: int, parallelism: int) -> CryptContext:
+    return CryptContext(
+        schemes=["argon2"],
+        argon2__type="ID",
+        argon2__time_cost=time_cost,
+        argon2__memory_cost=memory_kib,
+        argon2__parallelism=parallelism,
+    )
+
+
+def _percentile(samples: Sequence[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def measure_level(ctx: CryptContext, password_hash: str, concurrency: int, rounds: int) -> LevelResult:
+    def timed_verify(_: int) -> float:
+        start = time.perf_counter()
+        ctx.verify(_PASSWORD, password_hash)
+        return (time.perf_counter() - start) * 1000
+
+    total = concurrency * rounds
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        samples = list(pool.map(timed_verify, range(total)))
+        elapsed = time.perf_counter() - start
+
+    return LevelResult(
+        concurrency=concurrency,
+        p50_ms=round(statistics.median(samples), 2),
+        p95_ms=round(_percentile(samples, 0.95), 2),
+        verifies_per_sec=round(total / elapsed, 2),
+    )
+
+
+def concurrency_levels(max_concurrency: int) -> List[int]:
+    levels, c = [], 1
+    while c < max_concurrency:
+        levels.append(c)
+        c *= 2
+    levels.append(max_concurrency)
+    return levels
+
+
+def measure_candidate(memory_kib: int, time_cost: int, parallelism: int,
+                      memory_budget_mib: int, cpu_budget: int, rounds: int) -> CandidateResult:
+    ctx = _context(memory_kib, time_cost, parallelism)
+    password_hash = ctx.hash(_PASSWORD)
+    max_concurrency = max(1, min((memory_budget_mib * 1024) // memory_kib, cpu_budget // parallelism))
+    result = CandidateResult(memory_kib, time_cost, parallelism, max_concurrency)
+    for c in concurrency_levels(max_concurrency):
+        result.levels.append(measure_level(ctx, password_hash, c, rounds))
+    return result
+
+
+def recommend(results: Sequence[CandidateResult], target_ms: float,
+              target_lps: float) -> Optional[CandidateResult]:
+    """Strongest candidate that meets both targets; ties go to lower parallelism."""
+    eligible = [
+        r for r in results
+        if (lvl := r.best_level(target_ms)) is not None and lvl.verifies_per_sec >= target_lps
+    ]
+    return max(eligible, key=lambda r: (r.strength, -r.parallelism), default=None)
+
+
+def run(memory_kibs: Sequence[int], time_costs: Sequence[int], parallelisms: Sequence[int],
+        target_ms: float, target_lps: float, memory_budget_mib: int, cpu_budget: int,
+        rounds: int) -> dict:
+    results: List[CandidateResult] = []
+    for parallelism in parallelisms:
+        for memory_kib in memory_kibs:
+            for time_cost in time_costs:
+                res = measure_candidate(memory_kib, time_cost, parallelism,
+                                        memory_budget_mib, cpu_budget, rounds)
+                results.append(res)
+                print(f"m={memory_kib:>6} KiB t={time_cost} p={parallelism} "
+                      f"p95@1={res.levels[0].p95_ms:>8.2f}ms "
+                      f"max={max(lvl.verifies_per_sec for lvl in res.levels):>7.2f}/s")
+                if res.levels[0].p95_ms > target_ms:
+                    # Higher time costs at this memory size will only be slower.
+                    break
+
+    best = recommend(results, target_ms, target_lps)
+    return {
+        "generated_at": datetime.now(tz=timezone.utc).isoformat(),
+        "host": {
+            "hostname": platform.node(),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+        },
+        "targets": {
+            "verify_p95_ms": target_ms,
+            "logins_per_sec": target_lps,
+            "memory_budget_mib": memory_budget_mib,
+            "cpu_budget": cpu_budget,
+        },
+        "candidates": [
+            {**asdict(r), "levels": [asdict(lvl) for lvl in r.levels]} for r in results
+        ],
+        "recommendation": None if best is None else {
+            "ARGON2_MEMORY_KIB": best.memory_kib,
+            "ARGON2_TIME_COST": best.time_cost,
+            "ARGON2_PARALLELISM": best.parallelism,
+            "expected": asdict(best.best_level(target_ms)),
+        },
+    }
+
+
+def _ints(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Calibrate Argon2 parameters for this host.")
+    parser.add_argument("--target-ms", type=float, default=250.0, help="p95 verify latency target")
+    parser.add_argument("--target-lps", type=float, default=20.0, help="logins per second to sustain")
+    parser.add_argument("--memory-kib", type=_ints, default=list(DEFAULT_MEMORY_KIB))
+    parser.add_argument("--time-cost", type=_ints, default=list(DEFAULT_TIME_COSTS))
+    parser.add_argument("--parallelism", type=_ints, default=list(DEFAULT_PARALLELISM))
+    parser.add_argument("--memory-budget-mib", type=int, default=HASH_MEMORY_BUDGET_MIB)
+    parser.add_argument("--cpu-budget", type=int, default=HASH_CPU_BUDGET)
+    parser.add_argument("--rounds", type=int, default=4, help="verifies per worker at each level")
+    parser.add_argument("--report", default="argon2-calibration.json")
+    args = parser.parse_args(argv)
+
+    report = run(args.memory_kib, args.time_cost, args.parallelism, args.target_ms,
+                 args.target_lps, args.memory_budget_mib, args.cpu_budget, args.rounds)
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+
+    rec = report["recommendation"]
+    if rec is None:
+        print(f"No candidate meets {args.target_ms}ms at {args.target_lps}/s; report in {args.report}")
+        return 1
+    print("Recommended settings:")
+    for key in ("ARGON2_TIME_COST", "ARGON2_MEMORY_KIB", "ARGON2_PARALLELISM"):
+        print(f"{key}={rec[key]}")
+    print(f"Report written to {args.report}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,13 +1,20 @@
-from typing import Annotated
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Annotated, FrozenSet, Optional
 from enum import Enum
 from fastapi import Depends, HTTPException, status, Security
 from fastapi.security import OAuth2PasswordBearer, SecurityScopes
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Iterable, Set, Dict
 
 from db.config import get_session
 from db.models import Climber
+from schema.setting import settings
 from security.jwt_tools import decode_token
+from services import metrics
+from services.cache import TTLCache
 
 ALL_SCOPES = {"climber", "setter", "analyst", "admin"}
 
@@ -36,10 +43,92 @@ def expand_scopes(role: Enum) -> Set[str]:
     return effective
 
 
+@dataclass(frozen=True)
+class Principal:
+    """The authenticated climber as handlers see it, detached from any DB session."""
+    id: int
+    username: str
+    user_scope: str
+    effective_scopes: FrozenSet[str]
+    email: Optional[str] = None
+    firstname: Optional[str] = None
+    lastname: Optional[str] = None
+    club: Optional[str] = None
+    created_at: Optional[datetime] = None
+    # False when built from token claims only; load the Climber if you need the profile
+    profile_loaded: bool = True
+
+    @classmethod
+    def from_climber(cls, user: Climber) -> "Principal":
+        return cls(
+            id=user.id,
+            username=user.username,
+            user_scope=str(getattr(user.user_scope, "value", user.user_scope)),
+            effective_scopes=frozenset(expand_scopes(getattr(user, "user_scope", []) or [])),
+            email=user.email,
+            firstname=user.firstname,
+            lastname=user.lastname,
+            club=user.club,
+            created_at=user.created_at,
+        )
+
+    @classmethod
+    def from_claims(cls, uid: int, payload: dict) -> "Principal":
+        scope = str(payload["scope"]).lower()
+        return cls(
+            id=uid,
+            username=payload.get("username", ""),
+            user_scope=scope,
+            effective_scopes=frozenset(ROLE_HIERARCHY.get(scope, set())),
+            profile_loaded=False,
+        )
+
+
+# Saves the Climber lookup on most authenticated requests. Each worker has its own
+# copy, so a change made through another worker is visible here after at most the TTL.
+principal_cache: TTLCache[int, Principal] = TTLCache(
+    maxsize=int(os.getenv("PRINCIPAL_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("PRINCIPAL_CACHE_TTL_S", "60")),
+)
+metrics.register("principal_cache", principal_cache.stats)
+
+# user id -> current token_version, for revocation checks on stateless access tokens
+token_versions: TTLCache[int, int] = TTLCache(
+    maxsize=int(os.getenv("TOKEN_VERSION_CACHE_SIZE", "16384")),
+    ttl=settings.TOKEN_VERSION_CACHE_TTL,
+)
+metrics.register("token_version_cache", token_versions.stats)
+
+
+def invalidate_principal(user_id: int) -> None:
+    """Call after committing any change to a climber's profile, scope, token_version or existence."""
+    principal_cache.pop(user_id)
+    token_versions.pop(user_id)
+
+
+async def _current_token_version(session: AsyncSession, uid: int) -> Optional[int]:
+    version = token_versions.get(uid)
+    if version is None:
+        version = await session.scalar(select(Climber.token_version).where(Climber.id == uid))
+        if version is None:
+            return None
+        token_versions.set(uid, version)
+    return version
+
+
+async def _principal_from_claims(session: AsyncSession, uid: int, payload: dict) -> Principal:
+    version = await _current_token_version(session, uid)
+    if version is None:
+        raise HTTPException(status_code=401, detail="User not found")
+    if payload["ver"] != version:
+        raise HTTPException(status_code=401, detail="Token has been revoked")
+    return Principal.from_claims(uid, payload)
+
+
 async def get_current_user(security_scopes: SecurityScopes,
                            token: str = Depends(oauth2),
                            session: AsyncSession = Depends(get_session)
-                           ) -> Climber:
+                           ) -> Principal:
     try:
         payload = decode_token(token)
     except Exception:
@@ -49,27 +138,32 @@ async def get_current_user(security_scopes: SecurityScopes,
         raise HTTPException(status_code=401, detail="Wrong token type")
 
     uid = int(payload["sub"])
-    user = await session.get(Climber, uid)
-    if not user:
-        raise HTTPException(status_code=401, detail="User not found")
-
-    user_effective = expand_scopes(getattr(user, "user_scope", []) or [])
+    if settings.STATELESS_ACCESS_TOKENS and "scope" in payload and "ver" in payload:
+        principal = await _principal_from_claims(session, uid, payload)
+    else:
+        principal = principal_cache.get(uid)
+    if principal is None:
+        user = await session.get(Climber, uid)
+        if not user:
+            raise HTTPException(status_code=401, detail="User not found")
+        principal = Principal.from_climber(user)
+        principal_cache.set(uid, principal)
 
     # enforce required scopes if any were requested
     required = set(security_scopes.scopes)
-    if required and not required.issubset(user_effective):
+    if required and not required.issubset(principal.effective_scopes):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Insufficient permissions"
         )
 
-    # stash for later
-    user.effective_scopes = user_effective
-    return user
+    return principal
 
 def Require(*scopes: str):
     """Use like: user: CurrentUser = Security(get_current_user, scopes=['admin'])"""
     return Security(get_current_user, scopes=list(scopes))
 
-CurrentUser = Annotated[Climber, Security(get_current_user)]
-AdminUser = Annotated[Climber, Security(get_current_user, scopes=["admin"])]
\ No newline at end of file
+CurrentUser = Annotated[Principal, Security(get_current_user)]
+AdminUser = Annotated[Principal, Security(get_current_user, scopes=["admin"])]
+SetterUser = Annotated[Principal, Security(get_current_user, scopes=["setter"])]
+AnalystUser = Annotated[Principal, Security(get_current_user, scopes=["analyst"])]
@@ -1,8 +1,16 @@
+import asyncio
+import math
 import os
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Optional
 
 from passlib.context import CryptContext
 
-# TODO: Tune these based on benchmarks for server.
+from services import metrics
+
+# Defaults only; run `python -m security.calibrate` on the target host to tune them.
 PWD_CONTEXT = CryptContext(
     schemes=["argon2"],
     deprecated="auto",
@@ -13,6 +21,19 @@ PWD_CONTEXT = CryptContext(
 )
 PEPPER = os.getenv("PASSWORD_PEPPER", "")
 
+# Argon2 is CPU and memory bound, so the async helpers below run it off the event loop.
+# "thread" works because argon2-cffi releases the GIL; "process" isolates the work completely.
+HASH_EXECUTOR = os.getenv("HASH_EXECUTOR", "thread").lower()
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Every running hash holds ARGON2_MEMORY_KIB of RAM and ARGON2_PARALLELISM lanes,
+# so concurrency is capped by whichever budget runs out first.
+HASH_MEMORY_BUDGET_MIB = int(os.getenv("HASH_MEMORY_BUDGET_MIB", "512"))
+HASH_CPU_BUDGET = int(os.getenv("HASH_CPU_BUDGET", str(os.cpu_count() or 1)))
+HASH_QUEUE_SIZE = int(os.getenv("HASH_QUEUE_SIZE", "16"))
+HASH_QUEUE_TIMEOUT_S = float(os.getenv("HASH_QUEUE_TIMEOUT_S", "2.0"))
+
+_executor: Optional[Executor] = None
+
 
 def _pepper(pw: str) -> str:
     return pw + PEPPER
@@ -28,3 +49,137 @@ def verify_password(plain_password: str, password_hash: str) -> bool:
 
 def needs_rehash(password_hash: str) -> bool:
     return PWD_CONTEXT.needs_update(password_hash)
+
+
+def hash_concurrency() -> int:
+    memory_kib = PWD_CONTEXT.handler("argon2").memory_cost
+    parallelism = PWD_CONTEXT.handler("argon2").parallelism
+    by_memory = (HASH_MEMORY_BUDGET_MIB * 1024) // memory_kib
+    by_cpu = HASH_CPU_BUDGET // parallelism
+    return max(1, min(HASH_WORKERS, by_memory, by_cpu))
+
+
+class HashingOverloaded(Exception):
+    """Raised when the hashing queue is full; mapped to 429 in main.py."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Password hashing is overloaded")
+        self.retry_after = retry_after
+
+
+class HashLimiter:
+    """
+    Admission control for hashing work: `slots` hashes run at once, up to
+    `queue_size` callers wait (FIFO, at most `timeout` seconds) and everyone
+    else is rejected straight away with HashingOverloaded.
+    """
+
+    def __init__(self, slots: int, queue_size: int, timeout: float):
+        self.slots = slots
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._avg_duration = 0.5
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        backlog = (self.queue_depth + self.in_flight) / self.slots
+        return max(1, math.ceil(backlog * self._avg_duration))
+
+    async def acquire(self) -> None:
+        if self.in_flight < self.slots and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+        if self.queue_depth >= self.queue_size:
+            self.rejected_full += 1
+            raise HashingOverloaded(self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.timeout)
+        except asyncio.TimeoutError:
+            if waiter.done():
+                # Got the slot right as the timeout fired; hand it on.
+                self.release(0.0)
+            else:
+                self._waiters.remove(waiter)
+            self.rejected_timeout += 1
+            raise HashingOverloaded(self.retry_after())
+        except BaseException:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            elif waiter.done() and not waiter.cancelled():
+                self.release(0.0)
+            raise
+        self.admitted += 1
+
+    def release(self, duration: float) -> None:
+        if duration:
+            self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # The slot passes directly to the next waiter; in_flight is unchanged.
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "slots": self.slots,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "queue_size": self.queue_size,
+            "admitted": self.admitted,
+            "rejected_full": self.rejected_full,
+            "rejected_timeout": self.rejected_timeout,
+            "avg_hash_seconds": round(self._avg_duration, 4),
+        }
+
+
+hash_limiter = HashLimiter(hash_concurrency(), HASH_QUEUE_SIZE, HASH_QUEUE_TIMEOUT_S)
+metrics.register("password_hashing", hash_limiter.stats)
+
+
+def _get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        if HASH_EXECUTOR == "process":
+            _executor = ProcessPoolExecutor(max_workers=hash_limiter.slots)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=hash_limiter.slots, thread_name_prefix="argon2")
+    return _executor
+
+
+async def _run_in_pool(fn: Callable[..., Any], *args: Any) -> Any:
+    await hash_limiter.acquire()
+    start = time.perf_counter()
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_executor(), fn, *args)
+    finally:
+        hash_limiter.release(time.perf_counter() - start)
+
+
+async def hash_password_async(plain_password: str) -> str:
+    return await _run_in_pool(hash_password, plain_password)
+
+
+async def verify_password_async(plain_password: str, password_hash: str) -> bool:
+    return await _run_in_pool(verify_password, plain_password, password_hash)
+
+
+def shutdown_hash_pool() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -1,9 +1,14 @@
+import hashlib
+import os
+import time
 from datetime import datetime, timezone
 from typing import Any, Dict, Optional
 
 import jwt
 
 from schema.setting import settings
+from services import metrics
+from services.cache import TTLCache
 
 
 def _now() -> datetime:
@@ -29,7 +34,7 @@ def create_access_token(sub: str | int, extra: Optional[Dict[str, Any]] = None)
     return jwt.encode(payload, settings.JWT_SECRET, algorithm=settings.JWT_ALG)
 
 
-def create_refresh_token(sub: str | int, jti: Optional[str] = None) -> str:
+def create_refresh_token(sub: str | int, jti: Optional[str] = None, family: Optional[str] = None) -> str:
     # jti optional if we later want rotation/blacklisting
     now = _now()
     payload = {
@@ -42,10 +47,22 @@ def create_refresh_token(sub: str | int, jti: Optional[str] = None) -> str:
     }
     if jti:
         payload["jti"] = jti
+    if family:
+        payload["fam"] = family
     return jwt.encode(payload, settings.JWT_SECRET, algorithm=settings.JWT_ALG)
 
 
-def decode_token(token: str) -> dict:
+# Verified access-token payloads keyed by a digest of the raw token. The same token is
+# sent on every request for its whole lifetime, so this skips the parse + HMAC check.
+# Entries expire at the token's own exp; the TTL below only bounds entries without one.
+_verified_tokens: TTLCache[bytes, Dict[str, Any]] = TTLCache(
+    maxsize=int(os.getenv("JWT_CACHE_SIZE", "8192")),
+    ttl=settings.ACCESS_TTL * 60,
+)
+metrics.register("jwt_cache", _verified_tokens.stats)
+
+
+def _decode_uncached(token: str) -> dict:
     return jwt.decode(
         token,
         settings.JWT_SECRET,
@@ -54,3 +71,17 @@ def decode_token(token: str) -> dict:
         leeway=10,  # leeway handles small clock skews
         issuer=settings.ISSUER,
     )
+
+
+def decode_token(token: str) -> dict:
+    key = hashlib.sha256(token.encode()).digest()
+    cached = _verified_tokens.get(key)
+    if cached is not None:
+        return dict(cached)
+
+    payload = _decode_uncached(token)
+    # Refresh tokens are single-use after rotation, so caching them only evicts access tokens.
+    ttl = payload["exp"] - time.time()
+    if payload.get("type") == "access" and ttl > 0:
+        _verified_tokens.set(key, payload, ttl=ttl)
+    return dict(payload)
@@ -0,0 +1,113 @@
+import asyncio
+import os
+import secrets
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from db.config import AsyncSessionLocal
+from db.models import RefreshToken
+from schema.setting import settings
+from security.jwt_tools import create_refresh_token
+from services import background, metrics
+from services.cache import TTLCache
+
+SWEEP_INTERVAL_S = float(os.getenv("REFRESH_SWEEP_INTERVAL_S", "3600"))
+SWEEP_BATCH_SIZE = int(os.getenv("REFRESH_SWEEP_BATCH_SIZE", "1000"))
+
+# jtis of sessions that are gone (logout, revoke_all, reuse detected); rejected without
+# touching the database. Rotated jtis are not added: replaying one must reach the
+# database so reuse detection can revoke the family that replaced it.
+revoked_jtis: TTLCache[str, bool] = TTLCache(
+    maxsize=int(os.getenv("REVOKED_JTI_CACHE_SIZE", "65536")),
+    ttl=settings.refresh_delta.total_seconds(),
+)
+metrics.register("revoked_jti_cache", revoked_jtis.stats)
+
+
+def _now() -> datetime:
+    return datetime.now(tz=timezone.utc)
+
+
+def _new_jti() -> str:
+    return secrets.token_urlsafe(16)
+
+
+async def issue(session: AsyncSession, user_id: int) -> str:
+    """Start a new session row and return its refresh token. The caller commits."""
+    jti = _new_jti()
+    session.add(RefreshToken(jti=jti, family_id=jti, user_id=user_id, expires_at=_now() + settings.refresh_delta))
+    return create_refresh_token(user_id, jti=jti, family=jti)
+
+
+async def rotate(session: AsyncSession, jti: str, user_id: int, family: Optional[str]) -> Optional[str]:
+    """
+    Swap `jti` for a new one in a single UPDATE and return the new refresh token,
+    or None if it was revoked, expired or already used. `family` is the token's
+    `fam` claim. Presenting a jti rotated any number of generations ago means
+    the token leaked, so every session of its login family is revoked.
+    """
+    if revoked_jtis.get(jti):
+        return None
+
+    now = _now()
+    new_jti = _new_jti()
+    rotated = await session.execute(
+        update(RefreshToken)
+        .where(
+            RefreshToken.jti == jti,
+            RefreshToken.user_id == user_id,
+            RefreshToken.expires_at > now,
+        )
+        .values(jti=new_jti, expires_at=now + settings.refresh_delta, rotated_at=now)
+        .returning(RefreshToken.family_id)
+    )
+    family_id = rotated.scalar()
+    if family_id is None:
+        successors = (await session.execute(
+            delete(RefreshToken)
+            .where(RefreshToken.family_id == family, RefreshToken.user_id == user_id)
+            .returning(RefreshToken.jti)
+        )).scalars().all() if family else []
+        for revoked in (jti, *successors):
+            revoked_jtis.set(revoked, True)
+        return None
+    return create_refresh_token(user_id, jti=new_jti, family=family_id)
+
+
+async def revoke(session: AsyncSession, jti: str) -> None:
+    await session.execute(delete(RefreshToken).where(RefreshToken.jti == jti))
+    revoked_jtis.set(jti, True)
+
+
+async def revoke_all(session: AsyncSession, user_id: int) -> None:
+    jtis = (await session.execute(
+        delete(RefreshToken).where(RefreshToken.user_id == user_id).returning(RefreshToken.jti)
+    )).scalars().all()
+    for jti in jtis:
+        revoked_jtis.set(jti, True)
+
+
+async def sweep_expired(factory: async_sessionmaker = AsyncSessionLocal,
+                        batch_size: int = SWEEP_BATCH_SIZE) -> int:
+    """Delete expired rows in batches of `batch_size`, one short transaction each."""
+    total = 0
+    while True:
+        async with factory() as session:
+            expired = (
+                select(RefreshToken.jti)
+                .where(RefreshToken.expires_at <= _now())
+                .limit(batch_size)
+                .scalar_subquery()
+            )
+            result = await session.execute(delete(RefreshToken).where(RefreshToken.jti.in_(expired)))
+            await session.commit()
+        total += result.rowcount
+        if result.rowcount < batch_size:
+            return total
+        await asyncio.sleep(0)
+
+
+background.register("refresh_token_sweeper", SWEEP_INTERVAL_S, sweep_expired)
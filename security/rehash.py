@@ -0,0 +1,139 @@
+"""
+Deferred password rehashing.
+
+When Argon2 parameters change, every user's next login would otherwise pay
+for a second full hash plus a write before getting a token. Instead the
+login enqueues the plaintext on an in-memory queue and a single worker
+rehashes at REHASH_PER_SECOND. The plaintext never leaves this process,
+is dropped after REHASH_MAX_AGE_S, and anything that does not fit in the
+queue is simply retried on the user's next login.
+"""
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from typing import Optional, Set
+
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from db.config import AsyncSessionLocal
+from db.models import Climber
+from security.hashing import HashingOverloaded, hash_password_async
+from services import background, metrics
+
+REHASH_QUEUE_SIZE = int(os.getenv("REHASH_QUEUE_SIZE", "256"))
+REHASH_PER_SECOND = float(os.getenv("REHASH_PER_SECOND", "2"))
+REHASH_MAX_AGE_S = float(os.getenv("REHASH_MAX_AGE_S", "60"))
+
+
+@dataclass
+class _RehashJob:
+    user_id: int
+    plain_password: str
+    old_hash: str
+    enqueued_at: float
+
+
+class _Stats:
+    enqueued = 0
+    dropped_full = 0
+    dropped_stale = 0
+    dropped_overloaded = 0
+    rehashed = 0
+    skipped_changed = 0
+
+
+_queue: Optional[asyncio.Queue] = None
+_pending: Set[int] = set()
+_stats = _Stats()
+
+
+def _get_queue() -> asyncio.Queue:
+    global _queue
+    if _queue is None:
+        _queue = asyncio.Queue(maxsize=REHASH_QUEUE_SIZE)
+    return _queue
+
+
+def schedule_rehash(user_id: int, plain_password: str, old_hash: str) -> bool:
+    """Queue a rehash without waiting. Returns False if it was dropped or already queued."""
+    if user_id in _pending:
+        return False
+    try:
+        _get_queue().put_nowait(_RehashJob(user_id, plain_password, old_hash, time.monotonic()))
+    except asyncio.QueueFull:
+        _stats.dropped_full += 1
+        return False
+    _pending.add(user_id)
+    _stats.enqueued += 1
+    return True
+
+
+async def _process(job: _RehashJob, factory: async_sessionmaker) -> None:
+    if time.monotonic() - job.enqueued_at > REHASH_MAX_AGE_S:
+        _stats.dropped_stale += 1
+        return
+    try:
+        new_hash = await hash_password_async(job.plain_password)
+    except HashingOverloaded:
+        # Logins take priority; the user is picked up again on their next login.
+        _stats.dropped_overloaded += 1
+        return
+
+    async with factory() as session:
+        # Only replace the hash we verified against, never a password changed meanwhile.
+        result = await session.execute(
+            update(Climber)
+            .where(Climber.id == job.user_id, Climber.password == job.old_hash)
+            .values(password=new_hash)
+        )
+        await session.commit()
+    if result.rowcount:
+        _stats.rehashed += 1
+    else:
+        _stats.skipped_changed += 1
+
+
+async def process_next(factory: async_sessionmaker = AsyncSessionLocal) -> bool:
+    """Process one queued job if there is one; returns whether anything was processed."""
+    try:
+        job = _get_queue().get_nowait()
+    except asyncio.QueueEmpty:
+        return False
+    try:
+        await _process(job, factory)
+    finally:
+        _pending.discard(job.user_id)
+        job.plain_password = ""
+    return True
+
+
+async def run_worker(factory: async_sessionmaker = AsyncSessionLocal) -> None:
+    queue = _get_queue()
+    interval = 1 / REHASH_PER_SECOND
+    while True:
+        job = await queue.get()
+        try:
+            await _process(job, factory)
+        finally:
+            _pending.discard(job.user_id)
+            job.plain_password = ""
+        await asyncio.sleep(interval)
+
+
+def stats() -> dict:
+    return {
+        "queue_depth": _get_queue().qsize(),
+        "enqueued": _stats.enqueued,
+        "rehashed": _stats.rehashed,
+        "skipped_changed": _stats.skipped_changed,
+        "dropped_full": _stats.dropped_full,
+        "dropped_stale": _stats.dropped_stale,
+        "dropped_overloaded": _stats.dropped_overloaded,
+    }
+
+
+metrics.register("password_rehash", stats)
+if REHASH_PER_SECOND > 0:
+    background.register_worker("password_rehash", run_worker)
@@ -0,0 +1,49 @@
+import asyncio
+import os
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from db.config import AsyncSessionLocal
+from db.models import PasswordResetToken
+from services import background
+
+PURGE_INTERVAL_S = float(os.getenv("RESET_TOKEN_PURGE_INTERVAL_S", "3600"))
+PURGE_BATCH_SIZE = int(os.getenv("RESET_TOKEN_PURGE_BATCH_SIZE", "1000"))
+
+
+async def invalidate_unused(session: AsyncSession, user_id: int) -> None:
+    """Drop every outstanding reset token for the user in one statement. The caller commits."""
+    await session.execute(
+        delete(PasswordResetToken).where(
+            PasswordResetToken.user_id == user_id,
+            PasswordResetToken.used.is_(False),
+        )
+    )
+
+
+async def purge_expired(factory: async_sessionmaker = AsyncSessionLocal,
+                        batch_size: int = PURGE_BATCH_SIZE) -> int:
+    """Delete used and expired tokens in batches of `batch_size`, one short transaction each."""
+    total = 0
+    while True:
+        async with factory() as session:
+            dead = (
+                select(PasswordResetToken.id)
+                .where(or_(
+                    PasswordResetToken.used.is_(True),
+                    PasswordResetToken.expires_at <= datetime.now(tz=timezone.utc),
+                ))
+                .limit(batch_size)
+                .scalar_subquery()
+            )
+            result = await session.execute(delete(PasswordResetToken).where(PasswordResetToken.id.in_(dead)))
+            await session.commit()
+        total += result.rowcount
+        if result.rowcount < batch_size:
+            return total
+        await asyncio.sleep(0)
+
+
+background.register("password_reset_token_purge", PURGE_INTERVAL_S, purge_expired)
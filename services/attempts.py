@@ -0,0 +1,179 @@
+"""
+Projection of attempt_event into problem_score.
+
+Logging an attempt, zone or top appends one attempt_event row, so the write
+neither reads nor locks score state. The projector worker folds unapplied
+events, in id order, into problem_score and the leaderboard totals, and sets
+their applied_at in the same transaction. A periodic compaction deletes
+events applied more than ATTEMPT_EVENT_RETENTION_S ago.
+
+Event ids are taken at insert but become visible at commit, so a smaller id
+can appear after a larger one has been applied. Each event carries its own
+applied mark rather than sitting below a watermark, so a late commit is
+simply picked up by the next batch.
+"""
+import asyncio
+import os
+import time
+from collections import defaultdict
+from datetime import timedelta
+from typing import Dict, Optional, Set, Tuple
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from db.config import AsyncSessionLocal
+from db.models import AttemptEvent, EventProjection, Problem, ProblemScore
+from services import background, leaderboard, metrics
+from services.scoring import calculate_ifsc_score
+
+PROJECTION = "problem_score"
+
+BATCH_SIZE = int(os.getenv("ATTEMPT_PROJECTION_BATCH", "500"))
+POLL_INTERVAL_S = float(os.getenv("ATTEMPT_PROJECTION_POLL_S", "5"))
+RETENTION_S = float(os.getenv("ATTEMPT_EVENT_RETENTION_S", "86400"))
+COMPACT_INTERVAL_S = float(os.getenv("ATTEMPT_EVENT_COMPACT_INTERVAL_S", "300"))
+
+
+def apply_event(score: ProblemScore, kind: str) -> None:
+    """Fold one event into `score`. A zone or top with no attempt logged yet counts as the first attempt."""
+    if kind == "attempt" or score.attempts_total == 0:
+        score.attempts_total += 1
+    if kind in ("zone", "top") and not score.got_bonus:
+        score.got_bonus = True
+        score.attempts_to_bonus = score.attempts_total
+    if kind == "top" and not score.got_top:
+        score.got_top = True
+        score.attempts_to_top = score.attempts_total
+    score.ifsc_score = calculate_ifsc_score(score)
+
+
+class _Stats:
+    projected = 0
+    batches = 0
+    compacted = 0
+    last_event_id = 0  # highest id in the last batch, for monitoring only
+    last_batch_seconds = 0.0
+
+
+_stats = _Stats()
+_wakeup: Optional[asyncio.Event] = None
+
+
+async def project_batch(factory: async_sessionmaker = AsyncSessionLocal, batch_size: Optional[int] = None) -> int:
+    """Apply the next batch of events. Returns how many were applied (0 if another worker is projecting)."""
+    batch_size = batch_size or BATCH_SIZE
+    start = time.perf_counter()
+    async with factory() as session:
+        # One projector at a time, so each climber's events are applied in order
+        await session.execute(insert(EventProjection).values(name=PROJECTION).on_conflict_do_nothing())
+        projector = await session.scalar(
+            select(EventProjection).where(EventProjection.name == PROJECTION).with_for_update(skip_locked=True)
+        )
+        if projector is None:
+            return 0
+        events = (await session.execute(
+            select(AttemptEvent.id, AttemptEvent.competition_id, AttemptEvent.problem_id, AttemptEvent.user_id,
+                   AttemptEvent.kind, Problem.level_no)
+            .join(Problem, Problem.id == AttemptEvent.problem_id)
+            .where(AttemptEvent.applied_at.is_(None))
+            .order_by(AttemptEvent.id)
+            .limit(batch_size)
+        )).all()
+        if not events:
+            return 0
+
+        # Totals are locked before scores, in the same order as the score endpoints
+        climbers: Dict[Tuple[int, int], Set[int]] = defaultdict(set)
+        for e in events:
+            climbers[(e.competition_id, e.level_no)].add(e.user_id)
+        before = {
+            (comp_id, level): await leaderboard.lock_totals(session, comp_id, level, sorted(user_ids))
+            for (comp_id, level), user_ids in climbers.items()
+        }
+
+        keys = {(e.problem_id, e.user_id) for e in events}
+        scores = {
+            (ps.problem_id, ps.user_id): ps
+            for ps in (await session.scalars(
+                select(ProblemScore)
+                .where(
+                    ProblemScore.problem_id.in_({problem_id for problem_id, _ in keys}),
+                    ProblemScore.user_id.in_({user_id for _, user_id in keys}),
+                )
+                .with_for_update()
+            )).all()
+        }
+        for e in events:
+            ps = scores.get((e.problem_id, e.user_id))
+            if ps is None:
+                ps = ProblemScore(competition_id=e.competition_id, problem_id=e.problem_id, user_id=e.user_id,
+                                  attempts_total=0, got_bonus=False, got_top=False)
+                session.add(ps)
+                scores[(e.problem_id, e.user_id)] = ps
+            apply_event(ps, e.kind)
+            ps.updated_at = func.now()
+        await session.flush()
+
+        for (comp_id, level), user_ids in climbers.items():
+            await leaderboard.refresh_totals(session, comp_id, level, sorted(user_ids), before[(comp_id, level)])
+        await session.execute(
+            update(AttemptEvent).where(AttemptEvent.id.in_([e.id for e in events])).values(applied_at=func.now())
+        )
+        projector.updated_at = func.now()
+        await session.commit()
+
+    for comp_id in {e.competition_id for e in events}:
+        leaderboard.invalidate(comp_id)
+    _stats.projected += len(events)
+    _stats.batches += 1
+    _stats.last_event_id = events[-1].id
+    _stats.last_batch_seconds = time.perf_counter() - start
+    return len(events)
+
+
+async def compact(factory: async_sessionmaker = AsyncSessionLocal, retention_s: Optional[float] = None) -> int:
+    """Delete events applied longer ago than the retention. Returns the count."""
+    retention_s = RETENTION_S if retention_s is None else retention_s
+    stmt = delete(AttemptEvent).where(AttemptEvent.applied_at.is_not(None))
+    if retention_s > 0:
+        stmt = stmt.where(AttemptEvent.applied_at < func.now() - timedelta(seconds=retention_s))
+    async with factory() as session:
+        result = await session.execute(stmt)
+        await session.commit()
+    _stats.compacted += result.rowcount
+    return result.rowcount
+
+
+def notify() -> None:
+    """Wake the projector after committing new events instead of waiting for the next poll."""
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+async def run_worker(factory: async_sessionmaker = AsyncSessionLocal) -> None:
+    global _wakeup
+    _wakeup = asyncio.Event()
+    while True:
+        if await project_batch(factory) < BATCH_SIZE:
+            _wakeup.clear()
+            try:
+                await asyncio.wait_for(_wakeup.wait(), POLL_INTERVAL_S)
+            except asyncio.TimeoutError:
+                continue
+
+
+def stats() -> dict:
+    return {
+        "projected": _stats.projected,
+        "batches": _stats.batches,
+        "compacted": _stats.compacted,
+        "last_event_id": _stats.last_event_id,
+        "last_batch_seconds": round(_stats.last_batch_seconds, 4),
+    }
+
+
+metrics.register("attempt_projection", stats)
+background.register_worker("attempt_projection", run_worker)
+background.register("attempt_event_compaction", COMPACT_INTERVAL_S, compact)
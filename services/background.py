@@ -0,0 +1,46 @@
+import asyncio
+from typing import Awaitable, Callable, List, Tuple
+
+Job = Callable[[], Awaitable[object]]
+
+# (name, interval seconds, job); modules register at import time, main.py starts them
+_JOBS: List[Tuple[str, float, Job]] = []
+_WORKERS: List[Tuple[str, Job]] = []
+_tasks: List[asyncio.Task] = []
+_WORKER_RESTART_DELAY_S = 1.0
+
+
+def register(name: str, interval: float, job: Job) -> None:
+    """Run `job` every `interval` seconds for the lifetime of the app. interval <= 0 disables it."""
+    if interval > 0:
+        _JOBS.append((name, interval, job))
+
+
+def register_worker(name: str, worker: Job) -> None:
+    """Run a long-lived `worker` coroutine for the lifetime of the app, restarting it if it fails."""
+    _WORKERS.append((name, worker))
+
+
+async def _run_forever(name: str, interval: float, job: Job) -> None:
+    while True:
+        try:
+            await job()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Background job {name} failed: {e}")
+        await asyncio.sleep(interval)
+
+
+def start() -> None:
+    for name, interval, job in _JOBS:
+        _tasks.append(asyncio.create_task(_run_forever(name, interval, job), name=name))
+    for name, worker in _WORKERS:
+        _tasks.append(asyncio.create_task(_run_forever(name, _WORKER_RESTART_DELAY_S, worker), name=name))
+
+
+async def stop() -> None:
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
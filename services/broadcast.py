@@ -0,0 +1,147 @@
+"""
+In-process fan-out of a keyed state (e.g. one competition's leaderboard) to
+Server-Sent Events subscribers.
+
+Each key with subscribers gets one channel task. `notify(key)` marks it dirty;
+the task reloads the state once per burst of writes, diffs it against what
+subscribers already have and hands the same pre-encoded event to every
+subscriber queue. Queues are bounded: a subscriber that falls behind loses
+its backlog and gets a fresh snapshot instead, so a slow client never holds
+more than `queue_size` events in memory.
+"""
+import asyncio
+import json
+import os
+from typing import Any, Callable, Dict, Hashable, Optional, Set
+
+Loader = Callable[[], Any]  # zero-arg coroutine function returning JSON-able state
+Differ = Callable[[Any, Any], Optional[Any]]
+
+QUEUE_SIZE = int(os.getenv("SSE_QUEUE_SIZE", "32"))
+DEBOUNCE_S = float(os.getenv("SSE_DEBOUNCE_S", "0.2"))
+
+
+def encode_event(event: str, data: Any, event_id: Optional[int] = None) -> bytes:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
+
+
+class Subscription:
+    def __init__(self, key: Hashable, queue_size: int):
+        self.key = key
+        self.queue: "asyncio.Queue[bytes]" = asyncio.Queue(maxsize=queue_size)
+        self.resyncs = 0
+
+    def offer(self, event: bytes, snapshot: Callable[[], bytes]) -> bool:
+        """Queue `event`; on overflow replace the backlog with a snapshot. Returns False on resync."""
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(snapshot())
+            self.resyncs += 1
+            return False
+
+    async def next(self, timeout: Optional[float] = None) -> Optional[bytes]:
+        """Next event, or None if nothing arrived within `timeout` seconds."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class _Channel:
+    def __init__(self, key: Hashable, load: Loader):
+        self.key = key
+        self.load = load
+        self.state: Any = None
+        self.seq = 0
+        self.subscribers: Set[Subscription] = set()
+        self.dirty = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self._snapshot: Optional[bytes] = None
+        self._snapshot_seq = -1
+
+    def snapshot_event(self) -> bytes:
+        if self._snapshot_seq != self.seq:
+            self._snapshot = encode_event("snapshot", self.state, self.seq)
+            self._snapshot_seq = self.seq
+        return self._snapshot
+
+
+class Broadcaster:
+    def __init__(self, diff: Differ, queue_size: int = QUEUE_SIZE, debounce: float = DEBOUNCE_S):
+        self.diff = diff
+        self.queue_size = queue_size
+        self.debounce = debounce
+        self._channels: Dict[Hashable, _Channel] = {}
+        self.events = 0
+        self.deliveries = 0
+        self.resyncs = 0
+
+    async def subscribe(self, key: Hashable, load: Loader) -> Subscription:
+        """Join the channel for `key`; the first queued event is a snapshot of the current state."""
+        channel = self._channels.get(key)
+        if channel is None:
+            channel = self._channels[key] = _Channel(key, load)
+        if channel.state is None:
+            channel.state = await load()
+        sub = Subscription(key, self.queue_size)
+        sub.queue.put_nowait(channel.snapshot_event())
+        channel.subscribers.add(sub)
+        if channel.task is None:
+            channel.task = asyncio.create_task(self._run(channel), name=f"broadcast:{key}")
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        channel = self._channels.get(sub.key)
+        if channel is None:
+            return
+        channel.subscribers.discard(sub)
+        if not channel.subscribers:
+            if channel.task is not None:
+                channel.task.cancel()
+            del self._channels[sub.key]
+
+    def notify(self, key: Hashable) -> None:
+        channel = self._channels.get(key)
+        if channel is not None:
+            channel.dirty.set()
+
+    def notify_all(self) -> None:
+        for channel in self._channels.values():
+            channel.dirty.set()
+
+    async def _run(self, channel: _Channel) -> None:
+        while True:
+            await channel.dirty.wait()
+            # Let a burst of writes settle into a single reload.
+            await asyncio.sleep(self.debounce)
+            channel.dirty.clear()
+            try:
+                state = await channel.load()
+            except Exception as e:
+                print(f"Broadcast reload for {channel.key} failed: {e}")
+                continue
+            change = self.diff(channel.state, state)
+            channel.state = state
+            if change is None:
+                continue
+            channel.seq += 1
+            event = encode_event("diff", change, channel.seq)
+            self.events += 1
+            for sub in list(channel.subscribers):
+                self.deliveries += 1
+                if not sub.offer(event, channel.snapshot_event):
+                    self.resyncs += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "channels": len(self._channels),
+            "subscribers": sum(len(c.subscribers) for c in self._channels.values()),
+            "events": self.events,
+            "deliveries": self.deliveries,
+            "resyncs": self.resyncs,
+        }
@@ -1,7 +1,11 @@
 import os
+from datetime import datetime, timezone
 from typing import Optional
 
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import EmailOutbox
+from services import mail_templates
 
 
 class EmailSettings:
@@ -15,74 +19,45 @@ class EmailSettings:
     MAIL_SSL_TLS: bool = os.getenv("MAIL_SSL_TLS", "false").lower() == "true"
     FRONTEND_URL: str = os.getenv("FRONTEND_URL", "")
 
+    # Outbox worker
+    MAIL_POOL_SIZE: int = int(os.getenv("MAIL_POOL_SIZE", "2"))
+    MAIL_BATCH_SIZE: int = int(os.getenv("MAIL_BATCH_SIZE", "50"))
+    MAIL_MAX_ATTEMPTS: int = int(os.getenv("MAIL_MAX_ATTEMPTS", "6"))
+    MAIL_RETRY_BASE_S: float = float(os.getenv("MAIL_RETRY_BASE_S", "30"))
+    MAIL_POLL_INTERVAL_S: float = float(os.getenv("MAIL_POLL_INTERVAL_S", "5"))
+    # A claimed batch must be sent within this long, or another worker reclaims it
+    MAIL_LEASE_S: float = float(os.getenv("MAIL_LEASE_S", "300"))
+    # Sent rows (with their rendered bodies) are deleted this long after sending
+    MAIL_SENT_RETENTION_S: float = float(os.getenv("MAIL_SENT_RETENTION_S", str(7 * 86400)))
+    MAIL_PURGE_INTERVAL_S: float = float(os.getenv("MAIL_PURGE_INTERVAL_S", "3600"))
+    MAIL_PURGE_BATCH_SIZE: int = int(os.getenv("MAIL_PURGE_BATCH_SIZE", "1000"))
+
 
 email_settings = EmailSettings()
 
 
-def get_mail_config() -> Optional[ConnectionConfig]:
-    if not email_settings.MAIL_USERNAME or not email_settings.MAIL_PASSWORD:
-        return None
+def mail_configured() -> bool:
+    return bool(email_settings.MAIL_USERNAME and email_settings.MAIL_PASSWORD)
 
-    return ConnectionConfig(
-        MAIL_USERNAME=email_settings.MAIL_USERNAME,
-        MAIL_PASSWORD=email_settings.MAIL_PASSWORD,
-        MAIL_FROM=email_settings.MAIL_FROM,
-        MAIL_PORT=email_settings.MAIL_PORT,
-        MAIL_SERVER=email_settings.MAIL_SERVER,
-        MAIL_FROM_NAME=email_settings.MAIL_FROM_NAME,
-        MAIL_STARTTLS=email_settings.MAIL_STARTTLS,
-        MAIL_SSL_TLS=email_settings.MAIL_SSL_TLS,
-        USE_CREDENTIALS=True,
-        VALIDATE_CERTS=True,
-    )
 
+def enqueue_email(session: AsyncSession, recipient: str, subject: str,
+                  body_html: str, body_text: Optional[str] = None) -> EmailOutbox:
+    """Add a message to the outbox. It is sent by the outbox worker once the caller commits."""
+    message = EmailOutbox(
+        recipient=recipient,
+        subject=subject,
+        body_html=body_html,
+        body_text=body_text,
+        next_attempt_at=datetime.now(tz=timezone.utc),
+    )
+    session.add(message)
+    return message
 
-async def send_password_reset_email(email: str, token: str, firstname: Optional[str] = None) -> bool:
-    config = get_mail_config()
-    if not config:
-        print(f"[DEV MODE] Password reset link: {email_settings.FRONTEND_URL}/reset-password?token={token}")
-        return True
 
+def enqueue_password_reset_email(session: AsyncSession, email: str, token: str,
+                                 firstname: Optional[str] = None,
+                                 locale: Optional[str] = None) -> EmailOutbox:
     reset_url = f"{email_settings.FRONTEND_URL}/reset-password?token={token}"
-    greeting = f"Hej {firstname}" if firstname else "Hej"
-
-    html_content = f"""
-    <html>
-    <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
-        <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-            <h2 style="color: #505654;">Återställ ditt lösenord</h2>
-            <p>{greeting},</p>
-            <p>Du har begärt att återställa ditt lösenord för ditt Greppmästerskaps-konto.</p>
-            <p>Klicka på knappen nedan för att välja ett nytt lösenord:</p>
-            <p style="text-align: center; margin: 30px 0;">
-                <a href="{reset_url}"
-                   style="background-color: #505654; color: white; padding: 12px 24px;
-                          text-decoration: none; border-radius: 6px; display: inline-block;">
-                    Återställ lösenord
-                </a>
-            </p>
-            <p>Eller kopiera och klistra in denna länk i din webbläsare:</p>
-            <p style="word-break: break-all; color: #666; font-size: 14px;">{reset_url}</p>
-            <p><strong>Länken är giltig i 1 timme.</strong></p>
-            <p>Om du inte begärde detta kan du ignorera detta mail.</p>
-            <hr style="border: none; border-top: 1px solid #eee; margin: 30px 0;">
-            <p style="color: #999; font-size: 12px;">Detta mail skickades från Grepp.</p>
-        </div>
-    </body>
-    </html>
-    """
-
-    message = MessageSchema(
-        subject="Återställ ditt lösenord - Grepp",
-        recipients=[email],
-        body=html_content,
-        subtype=MessageType.html,
-    )
-
-    try:
-        fm = FastMail(config)
-        await fm.send_message(message)
-        return True
-    except Exception as e:
-        print(f"Failed to send email: {e}")
-        return False
+    mail = mail_templates.render("password_reset", locale, firstname=firstname, reset_url=reset_url)
+    return enqueue_email(session, recipient=email, subject=mail.subject,
+                         body_html=mail.html, body_text=mail.text)
@@ -0,0 +1,130 @@
+"""
+Chunked encoders for result exports: CSV, Arrow IPC stream and Parquet.
+
+Each encoder turns a list of row tuples into the bytes to send for that
+chunk, so a StreamingResponse can emit the file as rows arrive from the
+database. Arrow and Parquet write one record batch / row group per chunk.
+They need pyarrow (`pip install pyarrow`); without it only CSV is available.
+"""
+import csv
+import io
+from enum import Enum
+from typing import Any, List, Sequence, Tuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - exercised only without pyarrow
+    pa = pq = None
+
+# (name, arrow type name) in row order
+Column = Tuple[str, str]
+
+
+class ExportFormat(str, Enum):
+    csv = "csv"
+    arrow = "arrow"
+    parquet = "parquet"
+
+
+MEDIA_TYPES = {
+    ExportFormat.csv: "text/csv; charset=utf-8",
+    ExportFormat.arrow: "application/vnd.apache.arrow.stream",
+    ExportFormat.parquet: "application/vnd.apache.parquet",
+}
+
+
+def available(fmt: ExportFormat) -> bool:
+    return fmt is ExportFormat.csv or pa is not None
+
+
+class _Sink(io.RawIOBase):
+    """Write-only buffer that hands back what was written since the last drain."""
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._pos = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._buf += b
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def drain(self) -> bytes:
+        out = bytes(self._buf)
+        self._buf.clear()
+        return out
+
+
+class CsvEncoder:
+    def __init__(self, columns: Sequence[Column]):
+        self._out = io.StringIO()
+        self._writer = csv.writer(self._out)
+        self._writer.writerow([name for name, _ in columns])
+
+    def _drain(self) -> bytes:
+        data = self._out.getvalue().encode()
+        self._out.seek(0)
+        self._out.truncate()
+        return data
+
+    def write(self, rows: List[Tuple[Any, ...]]) -> bytes:
+        self._writer.writerows(rows)
+        return self._drain()
+
+    def close(self) -> bytes:
+        return self._drain()
+
+
+class _ArrowEncoderBase:
+    def __init__(self, columns: Sequence[Column]):
+        self.schema = pa.schema([(name, getattr(pa, type_name)()) for name, type_name in columns])
+        self._sink = _Sink()
+
+    def _batch(self, rows: List[Tuple[Any, ...]]) -> "pa.RecordBatch":
+        return pa.RecordBatch.from_arrays(
+            [pa.array(col, type=field.type) for col, field in zip(zip(*rows), self.schema)],
+            schema=self.schema,
+        )
+
+
+class ArrowEncoder(_ArrowEncoderBase):
+    def __init__(self, columns: Sequence[Column]):
+        super().__init__(columns)
+        self._writer = pa.ipc.new_stream(self._sink, self.schema)
+
+    def write(self, rows: List[Tuple[Any, ...]]) -> bytes:
+        self._writer.write_batch(self._batch(rows))
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        self._writer.close()
+        return self._sink.drain()
+
+
+class ParquetEncoder(_ArrowEncoderBase):
+    def __init__(self, columns: Sequence[Column]):
+        super().__init__(columns)
+        self._writer = pq.ParquetWriter(self._sink, self.schema)
+
+    def write(self, rows: List[Tuple[Any, ...]]) -> bytes:
+        self._writer.write_batch(self._batch(rows))
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        self._writer.close()
+        return self._sink.drain()
+
+
+def encoder(fmt: ExportFormat, columns: Sequence[Column]):
+    return {
+        ExportFormat.csv: CsvEncoder,
+        ExportFormat.arrow: ArrowEncoder,
+        ExportFormat.parquet: ParquetEncoder,
+    }[fmt](columns)
@@ -0,0 +1,233 @@
+"""
+Idempotency-Key support for retried writes.
+
+Phones on venue Wi-Fi resend a PUT/POST when the response is lost. With an
+`Idempotency-Key` header, the first request runs and its response is stored.
+A retry with the same key gets that response back (marked
+`Idempotent-Replayed: true`) without reaching the endpoint or the database.
+A duplicate that arrives while the first request is still running waits for
+it instead of running alongside it.
+
+Keys are scoped to the Authorization header, method and path, so one
+client's key never answers another's request. Reusing a key with a different
+body is a 422. Only 2xx responses and the definite client errors in
+DEFINITE_ERRORS are stored (see `_stored`): a retry after a server error, a
+409 conflict or a 429 runs again rather than being told to retry for the
+rest of the TTL.
+
+`IdempotencyStore` is the backend interface. `MemoryIdempotencyStore` is the
+in-process default: bounded, LRU, entries dropped after IDEMPOTENCY_TTL_S.
+Retries that land on another worker run again, which the idempotent
+upserts behind these routes tolerate. A shared backend (e.g. Redis with SET NX
+for `claim` and polling in `wait`) can be passed to the middleware as `store=`.
+"""
+import asyncio
+import hashlib
+import json
+import os
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from starlette.routing import compile_path
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from services import metrics
+from services.cache import TTLCache
+
+CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+TTL_S = float(os.getenv("IDEMPOTENCY_TTL_S", "600"))
+WAIT_S = float(os.getenv("IDEMPOTENCY_WAIT_S", "10"))
+MAX_BODY_BYTES = int(os.getenv("IDEMPOTENCY_MAX_BODY_BYTES", str(256 * 1024)))
+
+HEADER = b"idempotency-key"
+MAX_KEY_LENGTH = 255
+# Client errors that a retry of the same request would get again
+DEFINITE_ERRORS = frozenset({400, 401, 403, 404, 405, 410, 413, 415, 422})
+
+
+def _stored(status: int) -> bool:
+    return 200 <= status < 300 or status in DEFINITE_ERRORS
+
+
+@dataclass(frozen=True)
+class StoredResponse:
+    status: int
+    headers: List[Tuple[bytes, bytes]]
+    body: bytes
+
+
+@dataclass(frozen=True)
+class Entry:
+    fingerprint: str  # hash of the request body
+    response: Optional[StoredResponse]  # None while the first request is running
+
+
+class IdempotencyStore(ABC):
+    """Backend interface. Keys arrive already scoped and hashed."""
+
+    @abstractmethod
+    async def claim(self, key: str, fingerprint: str) -> Optional[Entry]:
+        """Reserve `key` for the caller (returns None) or return the entry already there."""
+
+    @abstractmethod
+    async def complete(self, key: str, response: StoredResponse) -> None:
+        """Store the response for a claimed key and wake its waiters."""
+
+    @abstractmethod
+    async def release(self, key: str) -> None:
+        """Drop a claim without a response, so the next request with the key runs."""
+
+    @abstractmethod
+    async def wait(self, key: str, timeout: float) -> None:
+        """Until `key` is no longer in flight. Raises asyncio.TimeoutError after `timeout` seconds."""
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class MemoryIdempotencyStore(IdempotencyStore):
+    def __init__(self, maxsize: int, ttl: float):
+        self._done: TTLCache[str, Entry] = TTLCache(maxsize=maxsize, ttl=ttl)
+        # Kept outside the LRU so a running request's claim is never evicted
+        self._in_flight: Dict[str, Tuple[str, asyncio.Event]] = {}
+        self.replays = 0
+        self.waits = 0
+
+    async def claim(self, key: str, fingerprint: str) -> Optional[Entry]:
+        running = self._in_flight.get(key)
+        if running is not None:
+            return Entry(running[0], None)
+        entry = self._done.get(key)
+        if entry is not None:
+            self.replays += 1
+            return entry
+        self._in_flight[key] = (fingerprint, asyncio.Event())
+        return None
+
+    async def complete(self, key: str, response: StoredResponse) -> None:
+        fingerprint, done = self._in_flight.pop(key)
+        self._done.set(key, Entry(fingerprint, response))
+        done.set()
+
+    async def release(self, key: str) -> None:
+        _, done = self._in_flight.pop(key)
+        done.set()
+
+    async def wait(self, key: str, timeout: float) -> None:
+        running = self._in_flight.get(key)
+        if running is not None:
+            self.waits += 1
+            await asyncio.wait_for(running[1].wait(), timeout)
+
+    def clear(self) -> None:
+        self._done.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._done.stats(), "in_flight": len(self._in_flight), "replays": self.replays, "waits": self.waits}
+
+
+store = MemoryIdempotencyStore(maxsize=CACHE_SIZE, ttl=TTL_S)
+metrics.register("idempotency", store.stats)
+
+
+def _error(status: int, detail: str, headers: Iterable[Tuple[bytes, bytes]] = ()) -> StoredResponse:
+    return StoredResponse(status, [(b"content-type", b"application/json"), *headers],
+                          json.dumps({"detail": detail}).encode())
+
+
+async def _send_response(send: Send, response: StoredResponse, replayed: bool = False) -> None:
+    headers = list(response.headers)
+    if replayed:
+        headers.append((b"idempotent-replayed", b"true"))
+    await send({"type": "http.response.start", "status": response.status, "headers": headers})
+    await send({"type": "http.response.body", "body": response.body})
+
+
+class IdempotencyMiddleware:
+    """
+    Applies to requests that carry an Idempotency-Key and match one of
+    `routes`, given as (method, path template) pairs. Everything else passes
+    straight through.
+    """
+
+    def __init__(self, app: ASGIApp, routes: Iterable[Tuple[str, str]],
+                 store: IdempotencyStore = store, wait: float = WAIT_S):
+        self.app = app
+        self.routes = [(method, compile_path(path)[0]) for method, path in routes]
+        self.store = store
+        self.wait = wait
+
+    def _applies(self, scope: Scope) -> bool:
+        return any(scope["method"] == method and regex.match(scope["path"]) for method, regex in self.routes)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        idem_key = headers.get(HEADER)
+        if idem_key is None or not self._applies(scope):
+            return await self.app(scope, receive, send)
+        if not idem_key or len(idem_key) > MAX_KEY_LENGTH:
+            return await _send_response(send, _error(400, f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters"))
+
+        # The endpoint still gets the body: read it here and hand it back from `replay`
+        chunks = []
+        more = True
+        while more:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            more = message.get("more_body", False)
+        body = b"".join(chunks)
+        fingerprint = hashlib.sha256(body).hexdigest()
+        key = hashlib.sha256(b"\0".join([
+            headers.get(b"authorization", b""), scope["method"].encode(), scope["path"].encode(),
+            scope.get("query_string", b""), idem_key,
+        ])).hexdigest()
+
+        while True:
+            entry = await self.store.claim(key, fingerprint)
+            if entry is None:
+                break
+            if entry.fingerprint != fingerprint:
+                return await _send_response(send, _error(422, "Idempotency-Key reused with a different request"))
+            if entry.response is not None:
+                return await _send_response(send, entry.response, replayed=True)
+            try:
+                await self.store.wait(key, self.wait)
+            except asyncio.TimeoutError:
+                return await _send_response(send, _error(
+                    409, "A request with this Idempotency-Key is still in progress", [(b"retry-after", b"1")],
+                ))
+
+        body_sent = False
+
+        async def replay() -> Message:
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        start: Dict[str, Any] = {}
+        sent: List[bytes] = []
+
+        async def capture(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message["type"] == "http.response.body":
+                sent.append(message.get("body", b""))
+            await send(message)
+
+        completed = False
+        try:
+            await self.app(scope, replay, capture)
+            size = sum(len(chunk) for chunk in sent)
+            if start and _stored(start["status"]) and size <= MAX_BODY_BYTES:
+                await self.store.complete(key, StoredResponse(start["status"], list(start["headers"]), b"".join(sent)))
+                completed = True
+        finally:
+            if not completed:
+                await self.store.release(key)
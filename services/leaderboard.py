@@ -0,0 +1,208 @@
+"""
+Maintenance of the leaderboard_total table and the leaderboard/standings response caches.
+
+Score writes recompute the climber's total at that level in the same
+transaction, so reading a leaderboard is an index range scan over
+leaderboard_total instead of an aggregate over problem_score. Writers touch
+no per-competition row: the public endpoint tags the board it serves with a
+hash of its content, and the caches here are invalidated after commit.
+"""
+import os
+from typing import Any, Collection, Dict, Mapping, Optional
+
+from sqlalchemy import Numeric, and_, case, cast, func, literal, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import LeaderboardTotal, Problem, ProblemScore, Registration
+from services import metrics, standings
+from services.broadcast import Broadcaster
+from services.singleflight import CoalescedCache
+
+CACHE_SIZE = int(os.getenv("LEADERBOARD_CACHE_SIZE", "64"))
+CACHE_TTL_S = float(os.getenv("LEADERBOARD_CACHE_TTL_S", "5"))
+STALE_TTL_S = float(os.getenv("LEADERBOARD_STALE_TTL_S", "30"))
+COMPUTE_TIMEOUT_S = float(os.getenv("LEADERBOARD_COMPUTE_TIMEOUT_S", "10"))
+
+# Built LeaderboardResponse per competition and SeasonStandingsResponse per season.
+# Writers in this process invalidate after commit; other workers serve a response
+# at most CACHE_TTL_S old, plus one stale read while it is recomputed.
+leaderboard_cache: CoalescedCache[int, Any] = CoalescedCache(
+    maxsize=CACHE_SIZE, ttl=CACHE_TTL_S, stale_ttl=STALE_TTL_S, timeout=COMPUTE_TIMEOUT_S,
+)
+standings_cache: CoalescedCache[int, Any] = CoalescedCache(
+    maxsize=CACHE_SIZE, ttl=CACHE_TTL_S, stale_ttl=STALE_TTL_S, timeout=COMPUTE_TIMEOUT_S,
+)
+metrics.register("leaderboard_cache", leaderboard_cache.stats)
+metrics.register("season_standings_cache", standings_cache.stats)
+
+
+def diff_boards(old: Dict[str, Any], new: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Per level: entries that are new or changed (`upsert`) and user_ids that
+    dropped off the board (`remove`). None if nothing changed.
+    """
+    def by_level(board: Dict[str, Any]) -> Dict[int, Dict[int, Dict[str, Any]]]:
+        return {lvl["level"]: {e["user_id"]: e for e in lvl["entries"]} for lvl in board["levels"]}
+
+    before, after = by_level(old), by_level(new)
+    levels = []
+    for level in sorted(before.keys() | after.keys()):
+        old_entries, new_entries = before.get(level, {}), after.get(level, {})
+        upsert = [e for uid, e in new_entries.items() if old_entries.get(uid) != e]
+        remove = [uid for uid in old_entries if uid not in new_entries]
+        if upsert or remove:
+            levels.append({"level": level, "upsert": upsert, "remove": remove})
+    return {"competition_id": new["competition_id"], "levels": levels} if levels else None
+
+
+# Live leaderboard subscribers per competition, refreshed by invalidate()
+leaderboard_stream = Broadcaster(diff=diff_boards)
+metrics.register("leaderboard_stream", leaderboard_stream.stats)
+
+_KEY = [LeaderboardTotal.competition_id, LeaderboardTotal.level, LeaderboardTotal.user_id]
+_TIEBREAKS = ["tops", "zones", "top_attempts", "zone_attempts"]
+
+
+async def lock_total(session: AsyncSession, comp_id: int, user_id: int, level: int) -> Optional[float]:
+    """
+    Lock the climber's total at `level` ahead of a score write and return it
+    (None if there is no row yet). With the lock taken first, refresh_total,
+    a later statement, sees every score committed by a concurrent writer.
+    """
+    return (await lock_totals(session, comp_id, level, [user_id])).get(user_id)
+
+
+async def lock_totals(session: AsyncSession, comp_id: int, level: int,
+                      user_ids: Collection[int]) -> Dict[int, float]:
+    """lock_total for many climbers in one statement: user_id -> total for the rows that exist."""
+    rows = await session.execute(
+        update(LeaderboardTotal)
+        .where(
+            LeaderboardTotal.competition_id == comp_id,
+            LeaderboardTotal.level == level,
+            LeaderboardTotal.user_id.in_(user_ids),
+        )
+        .values(updated_at=func.now())
+        .returning(LeaderboardTotal.user_id, LeaderboardTotal.total_score)
+    )
+    return {r.user_id: r.total_score for r in rows}
+
+
+async def refresh_total(session: AsyncSession, comp_id: int, user_id: int, level: int,
+                        before: Optional[float]) -> None:
+    """
+    Recompute the climber's total at `level` from problem_score, and forward a
+    change in a ranked total to their season standing. `before` is what
+    lock_total returned.
+    """
+    await refresh_totals(session, comp_id, level, [user_id], {} if before is None else {user_id: before})
+
+
+async def refresh_totals(session: AsyncSession, comp_id: int, level: int,
+                         user_ids: Collection[int], before: Mapping[int, float]) -> None:
+    """
+    refresh_total for many climbers: one statement for the totals and their
+    tie-break sums, and one for season standings if a ranked total changed.
+    `before` is what lock_totals returned.
+    """
+    zone = ProblemScore.got_top | ProblemScore.got_bonus
+    points = (
+        select(
+            ProblemScore.user_id,
+            func.sum(ProblemScore.ifsc_score).label("points"),
+            func.sum(case((ProblemScore.got_top, 1), else_=0)).label("tops"),
+            func.sum(case((zone, 1), else_=0)).label("zones"),
+            func.sum(case((ProblemScore.got_top, func.coalesce(ProblemScore.attempts_to_top, 0)),
+                          else_=0)).label("top_attempts"),
+            func.sum(case((zone, func.coalesce(ProblemScore.attempts_to_bonus, ProblemScore.attempts_to_top, 0)),
+                          else_=0)).label("zone_attempts"),
+        )
+        .join(Problem, Problem.id == ProblemScore.problem_id)
+        .where(
+            ProblemScore.competition_id == comp_id,
+            ProblemScore.user_id.in_(user_ids),
+            Problem.level_no == level,
+        )
+        .group_by(ProblemScore.user_id)
+        .subquery()
+    )
+    source = (
+        select(
+            literal(comp_id, LeaderboardTotal.competition_id.type),
+            literal(level, LeaderboardTotal.level.type),
+            Registration.user_id,
+            func.round(cast(func.coalesce(points.c.points, 0), Numeric), 1),
+            func.coalesce(points.c.tops, 0),
+            func.coalesce(points.c.zones, 0),
+            func.coalesce(points.c.top_attempts, 0),
+            func.coalesce(points.c.zone_attempts, 0),
+            and_(Registration.approved, Registration.level == level),
+        )
+        .select_from(Registration)
+        .outerjoin(points, points.c.user_id == Registration.user_id)
+        .where(Registration.comp_id == comp_id, Registration.user_id.in_(user_ids))
+    )
+    stmt = insert(LeaderboardTotal).from_select(
+        ["competition_id", "level", "user_id", "total_score", *_TIEBREAKS, "ranked"], source
+    )
+    rows = await session.execute(stmt.on_conflict_do_update(
+        index_elements=_KEY,
+        set_={
+            "total_score": stmt.excluded.total_score,
+            **{name: stmt.excluded[name] for name in _TIEBREAKS},
+            "updated_at": func.now(),
+        },
+    ).returning(LeaderboardTotal.user_id, LeaderboardTotal.total_score, LeaderboardTotal.ranked))
+    deltas = {}
+    for r in rows:
+        delta = round(r.total_score - before.get(r.user_id, 0.0), 1)
+        if r.ranked and delta:
+            deltas[r.user_id] = delta
+    if deltas:
+        await standings.apply_deltas(session, comp_id, level, deltas)
+
+
+async def set_ranked(session: AsyncSession, comp_id: int, user_id: int, level: int, ranked: bool) -> None:
+    """
+    Show or hide the climber's total at `level`, creating an empty row if needed.
+    A change moves the total into or out of their season standing.
+    """
+    current = (await session.execute(
+        select(LeaderboardTotal.ranked, LeaderboardTotal.total_score)
+        .where(
+            LeaderboardTotal.competition_id == comp_id,
+            LeaderboardTotal.level == level,
+            LeaderboardTotal.user_id == user_id,
+        )
+        .with_for_update()
+    )).first()
+    was_ranked, total = (current.ranked, current.total_score) if current else (False, 0.0)
+
+    stmt = insert(LeaderboardTotal).values(
+        competition_id=comp_id, level=level, user_id=user_id, total_score=0, ranked=ranked,
+    )
+    await session.execute(stmt.on_conflict_do_update(
+        index_elements=_KEY,
+        set_={"ranked": stmt.excluded.ranked, "updated_at": func.now()},
+    ))
+    if ranked != was_ranked:
+        sign = 1 if ranked else -1
+        await standings.apply_delta(session, comp_id, user_id, level, sign * total, competitions=sign)
+
+
+def invalidate(comp_id: int) -> None:
+    """
+    Drop the cached board for `comp_id` and all season standings (the season
+    is not known here, and standings are cheap to miss). Call after commit.
+    """
+    leaderboard_cache.invalidate(comp_id)
+    standings_cache.clear()
+    leaderboard_stream.notify(comp_id)
+
+
+def invalidate_all() -> None:
+    """For changes that touch every board a climber appears on (name change, deletion)."""
+    leaderboard_cache.clear()
+    standings_cache.clear()
+    leaderboard_stream.notify_all()
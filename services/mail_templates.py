@@ -0,0 +1,68 @@
+"""
+Email templates, compiled once per process.
+
+Templates live in services/templates/email as `<name>.<locale>.html` and
+`<name>.<locale>.txt`. The HTML variant sets `subject` with `{% set %}`.
+A missing locale falls back to MAIL_DEFAULT_LOCALE.
+"""
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+from jinja2 import Environment, FileSystemLoader, StrictUndefined, Template, TemplateNotFound
+
+TEMPLATE_DIR = Path(__file__).parent / "templates" / "email"
+DEFAULT_LOCALE = os.getenv("MAIL_DEFAULT_LOCALE", "sv")
+
+_env = Environment(
+    loader=FileSystemLoader(TEMPLATE_DIR),
+    autoescape=lambda name: bool(name and name.endswith(".html")),
+    undefined=StrictUndefined,
+    # Templates only change on deploy; skip the per-render mtime check.
+    auto_reload=False,
+    trim_blocks=True,
+    lstrip_blocks=True,
+)
+
+
+@dataclass(frozen=True)
+class RenderedEmail:
+    subject: str
+    html: str
+    text: str
+
+
+@lru_cache(maxsize=256)
+def _template(name: str, locale: str, kind: str) -> Template:
+    try:
+        return _env.get_template(f"{name}.{locale}.{kind}")
+    except TemplateNotFound:
+        if locale == DEFAULT_LOCALE:
+            raise
+        return _template(name, DEFAULT_LOCALE, kind)
+
+
+def locale_from_header(accept_language: Optional[str]) -> Optional[str]:
+    """Primary language of the first Accept-Language entry, e.g. "en-GB,en;q=0.8" -> "en"."""
+    if not accept_language:
+        return None
+    tag = accept_language.split(",")[0].split(";")[0].split("-")[0].strip().lower()
+    return tag if tag.isalpha() and len(tag) <= 8 else None
+
+
+def render(name: str, locale: Optional[str] = None, **context) -> RenderedEmail:
+    locale = (locale or DEFAULT_LOCALE).lower()
+    if not locale.isalpha():
+        locale = DEFAULT_LOCALE
+    html = _template(name, locale, "html").make_module(context)
+    text = _template(name, locale, "txt").render(context)
+    return RenderedEmail(subject=str(html.subject).strip(), html=str(html), text=text)
+
+
+def warm() -> None:
+    """Compile every template up front so the first mail after a deploy pays nothing extra."""
+    for path in TEMPLATE_DIR.glob("[!_]*.*.*"):
+        name, locale, kind = path.name.split(".")
+        _template(name, locale, kind)
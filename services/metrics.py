@@ -0,0 +1,12 @@
+from typing import Any, Callable, Dict
+
+# name -> zero-arg callable returning a JSON-serialisable dict of current values
+_SOURCES: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+
+def register(name: str, source: Callable[[], Dict[str, Any]]) -> None:
+    _SOURCES[name] = source
+
+
+def snapshot() -> Dict[str, Dict[str, Any]]:
+    return {name: source() for name, source in sorted(_SOURCES.items())}
@@ -0,0 +1,303 @@
+"""
+Outbox worker: delivers rows from email_outbox over a small pool of reused SMTP connections.
+
+Mail is enqueued in the same transaction as whatever triggered it, so nothing
+is lost if the process restarts between the request and the send. Batches
+are leased (status 'sending', locked_until) rather than held under row locks
+while SMTP is slow. Failed sends are retried with exponential backoff up to
+MAIL_MAX_ATTEMPTS. Every MAIL_PURGE_INTERVAL_S the worker also deletes rows
+sent more than MAIL_SENT_RETENTION_S ago.
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+from email.utils import formataddr
+from typing import List, Optional, Sequence
+
+import aiosmtplib
+from sqlalchemy import and_, delete, or_, select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from db.config import AsyncSessionLocal
+from db.models import EmailOutbox
+from services import background, metrics
+from services.email import email_settings, mail_configured
+
+_MAX_BACKOFF = timedelta(hours=1)
+
+
+class SMTPPool:
+    """Up to `size` authenticated SMTP connections, kept open between batches."""
+
+    def __init__(self, hostname: str, port: int, username: Optional[str] = None,
+                 password: Optional[str] = None, use_tls: bool = False,
+                 start_tls: Optional[bool] = None, size: int = 2, timeout: float = 30,
+                 validate_certs: bool = True):
+        self.size = max(1, size)
+        self._options = dict(
+            hostname=hostname, port=port, username=username or None, password=password or None,
+            use_tls=use_tls, start_tls=start_tls, timeout=timeout, validate_certs=validate_certs,
+        )
+        self._idle: List[aiosmtplib.SMTP] = []
+        self.connections_opened = 0
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        smtp = aiosmtplib.SMTP(**self._options)
+        await smtp.connect()
+        self.connections_opened += 1
+        return smtp
+
+    async def _acquire(self) -> aiosmtplib.SMTP:
+        while self._idle:
+            smtp = self._idle.pop()
+            if smtp.is_connected:
+                return smtp
+        return await self._connect()
+
+    def _release(self, smtp: aiosmtplib.SMTP) -> None:
+        if smtp.is_connected and len(self._idle) < self.size:
+            self._idle.append(smtp)
+        else:
+            smtp.close()
+
+    async def _send_serially(self, messages: Sequence[EmailMessage]) -> List[Optional[Exception]]:
+        results: List[Optional[Exception]] = []
+        smtp: Optional[aiosmtplib.SMTP] = None
+        for message in messages:
+            try:
+                if smtp is None:
+                    smtp = await self._acquire()
+                try:
+                    await smtp.send_message(message)
+                except aiosmtplib.SMTPServerDisconnected:
+                    # The server dropped an idle connection; reconnect once.
+                    smtp = await self._connect()
+                    await smtp.send_message(message)
+                results.append(None)
+            except Exception as e:
+                results.append(e)
+                if smtp is not None and not smtp.is_connected:
+                    smtp = None
+        if smtp is not None:
+            self._release(smtp)
+        return results
+
+    async def send_many(self, messages: Sequence[EmailMessage]) -> List[Optional[Exception]]:
+        """Send over up to `size` connections in parallel; one result (None = sent) per message."""
+        chunks = [messages[i::self.size] for i in range(min(self.size, len(messages)))]
+        chunk_results = await asyncio.gather(*(self._send_serially(chunk) for chunk in chunks))
+        results: List[Optional[Exception]] = [None] * len(messages)
+        for offset, chunk in enumerate(chunk_results):
+            results[offset::self.size] = chunk
+        return results
+
+    async def close(self) -> None:
+        for smtp in self._idle:
+            try:
+                await smtp.quit()
+            except Exception:
+                smtp.close()
+        self._idle.clear()
+
+
+class DevMailer:
+    """Used when no SMTP credentials are configured: prints instead of sending."""
+    connections_opened = 0
+
+    async def send_many(self, messages: Sequence[EmailMessage]) -> List[Optional[Exception]]:
+        for message in messages:
+            body = message.get_body(("plain", "html"))
+            print(f"[DEV MODE] Mail to {message['To']}: {message['Subject']}\n{body.get_content() if body else ''}")
+        return [None] * len(messages)
+
+    async def close(self) -> None:
+        pass
+
+
+def get_mailer():
+    if not mail_configured():
+        return DevMailer()
+    return SMTPPool(
+        hostname=email_settings.MAIL_SERVER,
+        port=email_settings.MAIL_PORT,
+        username=email_settings.MAIL_USERNAME,
+        password=email_settings.MAIL_PASSWORD,
+        use_tls=email_settings.MAIL_SSL_TLS,
+        start_tls=email_settings.MAIL_STARTTLS,
+        size=email_settings.MAIL_POOL_SIZE,
+    )
+
+
+def _to_message(row: EmailOutbox) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = formataddr((email_settings.MAIL_FROM_NAME, email_settings.MAIL_FROM))
+    message["To"] = row.recipient
+    message["Subject"] = row.subject
+    message.set_content(row.body_text or "")
+    message.add_alternative(row.body_html, subtype="html")
+    return message
+
+
+def _backoff(attempts: int) -> timedelta:
+    return min(timedelta(seconds=email_settings.MAIL_RETRY_BASE_S * 2 ** (attempts - 1)), _MAX_BACKOFF)
+
+
+class _Stats:
+    sent = 0
+    failed_attempts = 0
+    dead = 0
+    batches = 0
+    last_batch_size = 0
+    last_batch_seconds = 0.0
+    purged = 0
+
+
+_stats = _Stats()
+_mailer = None
+_wakeup: Optional[asyncio.Event] = None
+
+
+async def _claim(factory: async_sessionmaker, batch_size: int, now: datetime) -> list:
+    """
+    Lease up to `batch_size` due rows (pending and due, or sending with an
+    expired lease) by marking them sending, and commit before anything is sent.
+    """
+    due = (
+        select(EmailOutbox.id)
+        .where(or_(
+            and_(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= now),
+            and_(EmailOutbox.status == "sending", EmailOutbox.locked_until <= now),
+        ))
+        .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    async with factory() as session:
+        rows = (await session.execute(
+            update(EmailOutbox)
+            .where(EmailOutbox.id.in_(due.scalar_subquery()))
+            .values(status="sending", locked_until=now + timedelta(seconds=email_settings.MAIL_LEASE_S))
+            .returning(EmailOutbox.id, EmailOutbox.recipient, EmailOutbox.subject, EmailOutbox.body_html,
+                       EmailOutbox.body_text, EmailOutbox.attempts)
+        )).all()
+        await session.commit()
+    return sorted(rows, key=lambda r: r.id)
+
+
+async def deliver_batch(factory: async_sessionmaker = AsyncSessionLocal, mailer=None,
+                        batch_size: Optional[int] = None) -> int:
+    """
+    Send one batch of due messages and record the outcome. Returns the number of rows claimed.
+    No transaction is open while SMTP is talked to: rows are leased in one short
+    transaction and the results written in another. A worker that dies in between
+    leaves the lease to expire, and the batch is sent again (at least once).
+    """
+    mailer = mailer or _mailer or get_mailer()
+    batch_size = batch_size or email_settings.MAIL_BATCH_SIZE
+    start = time.perf_counter()
+    now = datetime.now(tz=timezone.utc)
+    rows = await _claim(factory, batch_size, now)
+    if not rows:
+        return 0
+
+    results = await mailer.send_many([_to_message(row) for row in rows])
+    outcomes = []
+    for row, error in zip(rows, results):
+        if error is None:
+            outcomes.append({"id": row.id, "status": "sent", "sent_at": now, "last_error": None,
+                             "locked_until": None})
+            _stats.sent += 1
+            continue
+        attempts = row.attempts + 1
+        _stats.failed_attempts += 1
+        outcome = {"id": row.id, "attempts": attempts, "last_error": str(error)[:500], "locked_until": None}
+        if attempts >= email_settings.MAIL_MAX_ATTEMPTS:
+            outcome["status"] = "failed"
+            _stats.dead += 1
+        else:
+            outcome.update(status="pending", next_attempt_at=now + _backoff(attempts))
+        outcomes.append(outcome)
+    async with factory() as session:
+        # One executemany UPDATE per set of columns (sent, retried, failed)
+        for keys in {frozenset(o) for o in outcomes}:
+            await session.execute(update(EmailOutbox), [o for o in outcomes if frozenset(o) == keys])
+        await session.commit()
+
+    _stats.batches += 1
+    _stats.last_batch_size = len(rows)
+    _stats.last_batch_seconds = time.perf_counter() - start
+    return len(rows)
+
+
+async def purge_sent(factory: async_sessionmaker = AsyncSessionLocal, batch_size: Optional[int] = None,
+                     retention_s: Optional[float] = None) -> int:
+    """Delete rows sent longer ago than the retention in batches of `batch_size`, one short transaction each."""
+    batch_size = batch_size or email_settings.MAIL_PURGE_BATCH_SIZE
+    retention_s = email_settings.MAIL_SENT_RETENTION_S if retention_s is None else retention_s
+    total = 0
+    while True:
+        async with factory() as session:
+            old = (
+                select(EmailOutbox.id)
+                .where(
+                    EmailOutbox.status == "sent",
+                    EmailOutbox.sent_at <= datetime.now(tz=timezone.utc) - timedelta(seconds=retention_s),
+                )
+                .limit(batch_size)
+                .scalar_subquery()
+            )
+            result = await session.execute(delete(EmailOutbox).where(EmailOutbox.id.in_(old)))
+            await session.commit()
+        total += result.rowcount
+        if result.rowcount < batch_size:
+            _stats.purged += total
+            return total
+        await asyncio.sleep(0)
+
+
+def notify() -> None:
+    """Wake the worker after committing new outbox rows instead of waiting for the next poll."""
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+async def run_worker(factory: async_sessionmaker = AsyncSessionLocal) -> None:
+    global _mailer, _wakeup
+    _mailer = get_mailer()
+    _wakeup = asyncio.Event()
+    next_purge = time.monotonic()
+    try:
+        while True:
+            if time.monotonic() >= next_purge:
+                await purge_sent(factory)
+                next_purge = time.monotonic() + email_settings.MAIL_PURGE_INTERVAL_S
+            claimed = await deliver_batch(factory, _mailer)
+            if claimed < email_settings.MAIL_BATCH_SIZE:
+                _wakeup.clear()
+                try:
+                    await asyncio.wait_for(_wakeup.wait(), email_settings.MAIL_POLL_INTERVAL_S)
+                except asyncio.TimeoutError:
+                    pass
+    finally:
+        await _mailer.close()
+        _mailer = None
+
+
+def stats() -> dict:
+    seconds = _stats.last_batch_seconds
+    return {
+        "sent": _stats.sent,
+        "failed_attempts": _stats.failed_attempts,
+        "dead": _stats.dead,
+        "purged": _stats.purged,
+        "batches": _stats.batches,
+        "connections_opened": (_mailer.connections_opened if _mailer else 0),
+        "last_batch_size": _stats.last_batch_size,
+        "last_batch_seconds": round(seconds, 4),
+        "last_batch_per_second": round(_stats.last_batch_size / seconds, 2) if seconds else 0.0,
+    }
+
+
+metrics.register("email_outbox", stats)
+background.register_worker("email_outbox", run_worker)
@@ -0,0 +1,109 @@
+"""
+IFSC-style ordering of the climbers in one level.
+
+Climbers are ordered by points (the sum of their ifsc_score), then by tops,
+zones, attempts to top and attempts to zone, fewer attempts being better.
+Climbers equal on all five share a rank.
+
+leaderboard_total stores all five per competition and level, so competition
+boards, pages and exports rank in SQL over RANK_KEY. Season standings sum
+points across rounds and load the tie-breaks only for climbers level on
+points; `rank` orders those Totals with a single np.lexsort.
+"""
+from dataclasses import dataclass
+from typing import Iterable, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import func
+
+from db.models import LeaderboardTotal
+
+# (column, descending) in board order; ties on all of them share a rank
+RANK_KEY = (
+    (LeaderboardTotal.total_score, True),
+    (LeaderboardTotal.tops, True),
+    (LeaderboardTotal.zones, True),
+    (LeaderboardTotal.top_attempts, False),
+    (LeaderboardTotal.zone_attempts, False),
+)
+
+
+def level_rank():
+    """rank() of a leaderboard_total row within its competition and level."""
+    return func.rank().over(
+        partition_by=(LeaderboardTotal.competition_id, LeaderboardTotal.level),
+        order_by=[col.desc() if descending else col.asc() for col, descending in RANK_KEY],
+    )
+
+
+@dataclass
+class Totals:
+    """Ranking keys, one entry per climber."""
+    user_ids: np.ndarray
+    points: np.ndarray  # tenths of a point as int64, so equal totals compare equal
+    tops: np.ndarray
+    zones: np.ndarray
+    top_attempts: np.ndarray
+    zone_attempts: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    @classmethod
+    def from_points(cls, user_ids: Sequence[int], points: Sequence[float]) -> "Totals":
+        """Totals with only points set; fill in the tie-break keys with `set_tiebreaks`."""
+        n = len(user_ids)
+        return cls(
+            user_ids=np.asarray(user_ids, dtype=np.int64),
+            points=to_tenths(points),
+            tops=np.zeros(n, dtype=np.int64),
+            zones=np.zeros(n, dtype=np.int64),
+            top_attempts=np.zeros(n, dtype=np.int64),
+            zone_attempts=np.zeros(n, dtype=np.int64),
+        )
+
+    def set_tiebreaks(self, rows: Iterable[Tuple[int, int, int, int, int]]) -> None:
+        """Fill tops, zones, top_attempts and zone_attempts from (user_id, ...) rows."""
+        index = {uid: i for i, uid in enumerate(self.user_ids.tolist())}
+        for user_id, tops, zones, top_attempts, zone_attempts in rows:
+            i = index[user_id]
+            self.tops[i], self.zones[i] = tops, zones
+            self.top_attempts[i], self.zone_attempts[i] = top_attempts, zone_attempts
+
+
+def to_tenths(points) -> np.ndarray:
+    return np.rint(np.asarray(points, dtype=float) * 10).astype(np.int64)
+
+
+def rank(totals: Totals) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Indices into `totals` in board order, and the rank at each position
+    (1-based; climbers equal on every key share a rank, the next rank skips).
+    Fully tied climbers are listed by user_id.
+    """
+    # np.lexsort sorts by the last key first and is stable, so pre-sorting by
+    # user_id gives fully tied climbers a fixed order.
+    keys = np.stack([
+        totals.zone_attempts,
+        totals.top_attempts,
+        -totals.zones,
+        -totals.tops,
+        -totals.points,
+    ])
+    by_user = np.argsort(totals.user_ids, kind="stable")
+    order = by_user[np.lexsort(keys[:, by_user])]
+
+    n = len(order)
+    ordered = keys[:, order]
+    starts = np.ones(n, dtype=bool)
+    starts[1:] = np.any(ordered[:, 1:] != ordered[:, :-1], axis=0)
+    ranks = np.maximum.accumulate(np.where(starts, np.arange(1, n + 1), 0))
+    return order, ranks
+
+
+def tied_on_points(totals: Totals) -> np.ndarray:
+    """Mask of climbers who share their points total with someone else."""
+    if not len(totals):
+        return np.zeros(0, dtype=bool)
+    _, inverse, counts = np.unique(totals.points, return_inverse=True, return_counts=True)
+    return counts[inverse] > 1
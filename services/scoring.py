@@ -0,0 +1,11 @@
+def calculate_ifsc_score(score) -> float:
+    """
+    Points for one problem: 25 for a top, 15 for a zone, less 0.1 per attempt
+    before it. `score` is anything with got_top, got_bonus, attempts_to_top and
+    attempts_to_bonus (a request body or a ProblemScore row).
+    """
+    if score.got_top:
+        return 25 - ((score.attempts_to_top - 1) * 0.1)
+    if score.got_bonus:
+        return 15 - ((score.attempts_to_bonus - 1) * 0.1)
+    return 0.0
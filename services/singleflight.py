@@ -0,0 +1,121 @@
+"""
+Request coalescing for expensive reads.
+
+`SingleFlight` runs at most one computation per key at a time; concurrent
+callers await the same result. `CoalescedCache` puts a TTL cache in front of
+it and serves an expired entry for a further `stale_ttl` seconds while a
+single background refresh runs.
+
+Computations run as their own tasks so a caller that disconnects or times
+out does not cancel the work other callers are waiting on. They must
+therefore not use the request's database session.
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+from services.cache import TTLCache
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class SingleFlight(Generic[K, V]):
+    def __init__(self):
+        self._inflight: Dict[K, "asyncio.Task[V]"] = {}
+        self.leaders = 0
+        self.followers = 0
+        self.timeouts = 0
+
+    def start(self, key: K, compute: Callable[[], Awaitable[V]]) -> "asyncio.Task[V]":
+        task = self._inflight.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(compute())
+            self._inflight[key] = task
+
+            def _done(t: asyncio.Task, key=key) -> None:
+                if self._inflight.get(key) is t:
+                    del self._inflight[key]
+                if not t.cancelled():
+                    t.exception()  # mark retrieved; waiters (if any) re-raise it
+
+            task.add_done_callback(_done)
+        else:
+            self.followers += 1
+        return task
+
+    async def do(self, key: K, compute: Callable[[], Awaitable[V]], timeout: Optional[float] = None) -> V:
+        """Join or start the computation for `key`. Raises asyncio.TimeoutError after `timeout` seconds."""
+        task = self.start(key, compute)
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+
+    def in_flight(self, key: K) -> bool:
+        return key in self._inflight
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._inflight),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "timeouts": self.timeouts,
+        }
+
+
+class CoalescedCache(Generic[K, V]):
+    """
+    Fresh for `ttl` seconds, then served stale for up to `stale_ttl` more while
+    one refresh runs. `invalidate` drops the entry outright, so the next read
+    waits for a recompute instead of seeing pre-write data.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, stale_ttl: float = 0.0, timeout: Optional[float] = None):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.timeout = timeout
+        self._cache: TTLCache[K, Tuple[float, V]] = TTLCache(maxsize=maxsize, ttl=ttl + stale_ttl)
+        self._flight: SingleFlight[Tuple[K, int], V] = SingleFlight()
+        # Bumped by invalidate, so a computation that started before a write is
+        # neither joined by later readers nor allowed to store its result.
+        self._generation: Dict[K, int] = {}
+        self.stale_served = 0
+
+    async def get(self, key: K, compute: Callable[[], Awaitable[V]]) -> V:
+        generation = self._generation.get(key, 0)
+        entry = self._cache.get(key)
+        if entry is not None:
+            stored_at, value = entry
+            if time.monotonic() - stored_at < self.ttl:
+                return value
+            self.stale_served += 1
+            self._flight.start((key, generation), self._loader(key, generation, compute))
+            return value
+        return await self._flight.do((key, generation), self._loader(key, generation, compute), self.timeout)
+
+    def _loader(self, key: K, generation: int, compute: Callable[[], Awaitable[V]]) -> Callable[[], Awaitable[V]]:
+        async def load() -> V:
+            value = await compute()
+            if self._generation.get(key, 0) == generation:
+                self._cache.set(key, (time.monotonic(), value))
+            return value
+
+        return load
+
+    def invalidate(self, key: K) -> None:
+        self._cache.pop(key)
+        self._generation[key] = self._generation.get(key, 0) + 1
+
+    def clear(self) -> None:
+        for key in set(self._generation) | {key for key, _ in self._flight._inflight}:
+            self._generation[key] = self._generation.get(key, 0) + 1
+        self._cache.clear()
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._cache.stats(), **self._flight.stats(), "stale_served": self.stale_served}
@@ -0,0 +1,117 @@
+"""
+Maintenance of the season_standing table.
+
+services.leaderboard forwards every change to a ranked leaderboard_total row
+here, so reading season standings is an index range scan whose cost does not
+grow with the number of rounds. The table can also be rebuilt from
+registrations and scores:
+
+    python -m services.standings [--season ID]
+"""
+import argparse
+import asyncio
+from typing import Mapping, Optional, Sequence
+
+from sqlalchemy import Integer, Numeric, cast, delete, distinct, func, literal, select, union_all
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from db.models import Competition, Problem, ProblemScore, Registration, Season, SeasonStanding
+
+_COLUMNS = ["season_id", "level", "user_id", "total_score", "competitions"]
+_KEY = [SeasonStanding.season_id, SeasonStanding.level, SeasonStanding.user_id]
+
+
+async def apply_delta(session: AsyncSession, comp_id: int, user_id: int, level: int,
+                      delta: float, competitions: int = 0) -> None:
+    """Add `delta` points and `competitions` rounds to the climber's total in the competition's season."""
+    source = select(
+        Competition.season_id,
+        literal(level, Integer),
+        literal(user_id, Integer),
+        literal(round(delta, 1), SeasonStanding.total_score.type),
+        literal(competitions, Integer),
+    ).where(Competition.id == comp_id)
+    stmt = insert(SeasonStanding).from_select(_COLUMNS, source)
+    await session.execute(stmt.on_conflict_do_update(
+        index_elements=_KEY,
+        set_={
+            "total_score": SeasonStanding.total_score + stmt.excluded.total_score,
+            "competitions": SeasonStanding.competitions + stmt.excluded.competitions,
+            "updated_at": func.now(),
+        },
+    ))
+
+
+async def apply_deltas(session: AsyncSession, comp_id: int, level: int, deltas: Mapping[int, float]) -> None:
+    """apply_delta for many climbers at one level in a single statement: user_id -> points."""
+    rows = [
+        select(literal(user_id, Integer).label("user_id"),
+               literal(round(delta, 1), SeasonStanding.total_score.type).label("delta"))
+        for user_id, delta in deltas.items()
+    ]
+    delta = (rows[0] if len(rows) == 1 else union_all(*rows)).subquery("delta")
+    source = (
+        select(Competition.season_id, literal(level, Integer), delta.c.user_id, delta.c.delta, literal(0, Integer))
+        .select_from(delta)
+        .join(Competition, Competition.id == comp_id)
+        # SQLite needs a WHERE before ON CONFLICT to parse INSERT ... SELECT ... JOIN
+        .where(Competition.id == comp_id)
+    )
+    stmt = insert(SeasonStanding).from_select(_COLUMNS, source)
+    await session.execute(stmt.on_conflict_do_update(
+        index_elements=_KEY,
+        set_={"total_score": SeasonStanding.total_score + stmt.excluded.total_score, "updated_at": func.now()},
+    ))
+
+
+async def rebuild_season(session: AsyncSession, season_id: int) -> int:
+    """Recompute the season's rows from approved registrations and their scores. The caller commits."""
+    await session.execute(delete(SeasonStanding).where(SeasonStanding.season_id == season_id))
+    source = (
+        select(
+            Competition.season_id,
+            Registration.level,
+            Registration.user_id,
+            func.round(cast(func.coalesce(func.sum(ProblemScore.ifsc_score), 0), Numeric), 1),
+            func.count(distinct(Registration.comp_id)),
+        )
+        .join(Competition, Competition.id == Registration.comp_id)
+        .outerjoin(Problem, (Problem.competition_id == Registration.comp_id) & (Problem.level_no == Registration.level))
+        .outerjoin(ProblemScore, (ProblemScore.problem_id == Problem.id) & (ProblemScore.user_id == Registration.user_id))
+        .where(Registration.approved.is_(True), Competition.season_id == season_id)
+        .group_by(Competition.season_id, Registration.level, Registration.user_id)
+    )
+    result = await session.execute(insert(SeasonStanding).from_select(_COLUMNS, source))
+    return result.rowcount
+
+
+async def rebuild(factory: async_sessionmaker, season_id: Optional[int] = None) -> int:
+    """Rebuild one season, or every season, each in its own transaction."""
+    async with factory() as session:
+        if season_id is not None:
+            season_ids = [season_id]
+        else:
+            season_ids = (await session.scalars(select(Season.id).order_by(Season.id))).all()
+    total = 0
+    for sid in season_ids:
+        async with factory() as session:
+            total += await rebuild_season(session, sid)
+            await session.commit()
+    return total
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Rebuild season_standing from registrations and scores.")
+    parser.add_argument("--season", type=int, help="only this season (default: all)")
+    args = parser.parse_args(argv)
+
+    from db.config import AsyncSessionLocal
+
+    rows = asyncio.run(rebuild(AsyncSessionLocal, args.season))
+    print(f"Rebuilt {rows} season_standing rows")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
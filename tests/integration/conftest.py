@@ -17,6 +17,9 @@ from sqlalchemy.dialects.sqlite.base import SQLiteTypeCompiler
 from db.config import get_session
 from db.models import Base
 from main import app
+from security.deps import principal_cache
+from services import idempotency
+from services.leaderboard import leaderboard_cache, standings_cache
 
 # SQLite renders BigInteger as "BIGINT NOT NULL, PRIMARY KEY (id)" — a
 # table-level constraint that does NOT trigger SQLite's rowid alias, so
@@ -70,6 +73,11 @@ async def client(engine):
                 await session.close()
 
     app.dependency_overrides[get_session] = override_get_session
+    # Every test starts from an empty database, so ids are reused between tests.
+    principal_cache.clear()
+    idempotency.store.clear()
+    leaderboard_cache.clear()
+    standings_cache.clear()
 
     async with AsyncClient(
         transport=ASGITransport(app=app),
@@ -234,3 +234,450 @@ class TestPasswordResetRequest:
         )
         assert resp.status_code == 200
         assert "mail" in resp.json()["message"]
+
+
+# ---------------------------------------------------------------------------
+# Hashing admission control
+# ---------------------------------------------------------------------------
+
+class TestHashingOverload:
+    async def test_login_returns_429_when_hash_queue_full(self, client, monkeypatch):
+        from security.hashing import hash_limiter
+
+        await signup(client, username="busy")
+        monkeypatch.setattr(hash_limiter, "in_flight", hash_limiter.slots)
+        monkeypatch.setattr(hash_limiter, "queue_size", 0)
+
+        resp = await login(client, username="busy")
+        assert resp.status_code == 429
+        assert int(resp.headers["Retry-After"]) >= 1
+
+
+# ---------------------------------------------------------------------------
+# PATCH /climber/me  (principal cache invalidation)
+# ---------------------------------------------------------------------------
+
+class TestUpdateMe:
+    async def test_update_me_is_visible_on_next_request(self, client):
+        token = (await signup(client, username="before")).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        assert (await client.get(f"{BASE}/climber/me", headers=headers)).json()["username"] == "before"
+
+        resp = await client.patch(f"{BASE}/climber/me", json={"username": "after", "club": "Grepp"},
+                                  headers=headers)
+        assert resp.status_code == 200
+
+        body = (await client.get(f"{BASE}/climber/me", headers=headers)).json()
+        assert body["username"] == "after"
+        assert body["club"] == "Grepp"
+
+    async def test_update_me_password_allows_login_with_new_password(self, client):
+        token = (await signup(client, username="pwchange")).json()["access_token"]
+        resp = await client.patch(f"{BASE}/climber/me", json={"password": "newsecret1"},
+                                  headers={"Authorization": f"Bearer {token}"})
+        assert resp.status_code == 200
+        assert (await login(client, username="pwchange", password="newsecret1")).status_code == 200
+        assert (await login(client, username="pwchange")).status_code == 401
+
+    async def test_update_me_password_revokes_refresh_tokens(self, client):
+        tokens = (await signup(client, username="pwchange")).json()
+        resp = await client.patch(f"{BASE}/climber/me", json={"password": "newsecret1"},
+                                  headers={"Authorization": f"Bearer {tokens['access_token']}"})
+        assert resp.status_code == 200
+        resp = await client.post(f"{BASE}/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+        assert resp.status_code == 401
+
+
+# ---------------------------------------------------------------------------
+# Stateless access tokens (STATELESS_ACCESS_TOKENS=true)
+# ---------------------------------------------------------------------------
+
+@pytest.fixture()
+def stateless(monkeypatch):
+    from schema.setting import settings
+    from security.deps import token_versions
+
+    monkeypatch.setattr(settings, "STATELESS_ACCESS_TOKENS", True)
+    token_versions.clear()
+    yield
+    token_versions.clear()
+
+
+class TestStatelessTokens:
+    async def test_access_token_embeds_scope_and_version(self, client, stateless):
+        from security.jwt_tools import decode_token
+
+        token = (await signup(client, username="claims")).json()["access_token"]
+        payload = decode_token(token)
+        assert payload["scope"] == "climber"
+        assert payload["ver"] == 0
+        assert payload["username"] == "claims"
+
+    async def test_get_me_works_from_claims(self, client, stateless):
+        token = (await signup(client, username="claimsme")).json()["access_token"]
+        resp = await client.get(f"{BASE}/climber/me", headers={"Authorization": f"Bearer {token}"})
+        assert resp.status_code == 200
+        assert resp.json()["username"] == "claimsme"
+
+    async def test_password_change_revokes_old_access_token(self, client, stateless):
+        token = (await signup(client, username="revoked")).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        resp = await client.patch(f"{BASE}/climber/me", json={"password": "newsecret1"}, headers=headers)
+        assert resp.status_code == 200
+
+        resp = await client.get(f"{BASE}/climber/me", headers=headers)
+        assert resp.status_code == 401
+
+        new_token = (await login(client, username="revoked", password="newsecret1")).json()["access_token"]
+        resp = await client.get(f"{BASE}/climber/me", headers={"Authorization": f"Bearer {new_token}"})
+        assert resp.status_code == 200
+
+
+# ---------------------------------------------------------------------------
+# Refresh-token store: rotation, reuse detection, logout, sweeper
+# ---------------------------------------------------------------------------
+
+class TestRefreshTokenStore:
+    async def test_rotated_refresh_token_cannot_be_reused(self, client):
+        await signup(client)
+        old = (await login(client)).json()["refresh_token"]
+
+        first = await client.post(f"{BASE}/auth/refresh", json={"refresh_token": old})
+        assert first.status_code == 200
+
+        reused = await client.post(f"{BASE}/auth/refresh", json={"refresh_token": old})
+        assert reused.status_code == 401
+
+    async def test_reuse_revokes_the_whole_session(self, client):
+        await signup(client)
+        old = (await login(client)).json()["refresh_token"]
+        new = (await client.post(f"{BASE}/auth/refresh", json={"refresh_token": old})).json()["refresh_token"]
+
+        # Same worker that rotated it: the replay must still reach reuse detection.
+        assert (await client.post(f"{BASE}/auth/refresh", json={"refresh_token": old})).status_code == 401
+        assert (await client.post(f"{BASE}/auth/refresh", json={"refresh_token": new})).status_code == 401
+
+    async def test_reuse_after_later_rotations_revokes_the_family(self, client):
+        await signup(client)
+        first = (await login(client)).json()["refresh_token"]
+        other = (await login(client)).json()["refresh_token"]  # a second login, its own family
+        token = first
+        for _ in range(3):
+            token = (await client.post(f"{BASE}/auth/refresh", json={"refresh_token": token})).json()["refresh_token"]
+
+        assert (await client.post(f"{BASE}/auth/refresh", json={"refresh_token": first})).status_code == 401
+        assert (await client.post(f"{BASE}/auth/refresh", json={"refresh_token": token})).status_code == 401
+        assert (await client.post(f"{BASE}/auth/refresh", json={"refresh_token": other})).status_code == 200
+
+    async def test_refresh_chain_keeps_working(self, client):
+        await signup(client)
+        token = (await login(client)).json()["refresh_token"]
+        for _ in range(3):
+            resp = await client.post(f"{BASE}/auth/refresh", json={"refresh_token": token})
+            assert resp.status_code == 200
+            token = resp.json()["refresh_token"]
+
+    async def test_refresh_token_without_jti_is_rejected(self, client):
+        from security.jwt_tools import create_refresh_token
+
+        user_id = (await signup(client)).json()["climber"]["id"]
+        legacy = create_refresh_token(user_id)
+        for _ in range(2):
+            resp = await client.post(f"{BASE}/auth/refresh", json={"refresh_token": legacy})
+            assert resp.status_code == 401
+
+    async def test_logout_revokes_refresh_token(self, client):
+        await signup(client)
+        token = (await login(client)).json()["refresh_token"]
+
+        assert (await client.post(f"{BASE}/auth/logout", json={"refresh_token": token})).status_code == 204
+        assert (await client.post(f"{BASE}/auth/refresh", json={"refresh_token": token})).status_code == 401
+
+    async def test_sweeper_deletes_expired_rows_in_batches(self, client, engine):
+        from datetime import datetime, timedelta, timezone
+
+        from sqlalchemy import func, select
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+
+        from db.models import RefreshToken
+        from security.refresh_store import sweep_expired
+
+        user_id = (await signup(client)).json()["climber"]["id"]
+        factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+        past = datetime.now(tz=timezone.utc) - timedelta(days=1)
+        async with factory() as session:
+            session.add_all([
+                RefreshToken(jti=f"expired-{i}", family_id=f"expired-{i}", user_id=user_id, expires_at=past) for i in range(5)
+            ])
+            await session.commit()
+
+        assert await sweep_expired(factory, batch_size=2) == 5
+        async with factory() as session:
+            remaining = await session.scalar(select(func.count()).select_from(RefreshToken))
+        assert remaining == 1  # the live signup session
+
+
+# ---------------------------------------------------------------------------
+# Deferred rehash on login
+# ---------------------------------------------------------------------------
+
+class TestDeferredRehash:
+    async def test_login_defers_rehash_to_worker(self, client, engine):
+        from passlib.context import CryptContext
+        from sqlalchemy import select, update
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+
+        from db.models import Climber
+        from security import rehash
+        from security.hashing import PEPPER, needs_rehash
+
+        user_id = (await signup(client, username="oldhash")).json()["climber"]["id"]
+        old_ctx = CryptContext(schemes=["argon2"], argon2__type="ID", argon2__time_cost=2,
+                               argon2__memory_cost=8, argon2__parallelism=1)
+        old_hash = old_ctx.hash("secret123" + PEPPER)
+        factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+        async with factory() as session:
+            await session.execute(update(Climber).where(Climber.id == user_id).values(password=old_hash))
+            await session.commit()
+
+        resp = await login(client, username="oldhash")
+        assert resp.status_code == 200
+        async with factory() as session:
+            assert await session.scalar(select(Climber.password).where(Climber.id == user_id)) == old_hash
+
+        assert await rehash.process_next(factory) is True
+        async with factory() as session:
+            new_hash = await session.scalar(select(Climber.password).where(Climber.id == user_id))
+        assert new_hash != old_hash
+        assert not needs_rehash(new_hash)
+        assert (await login(client, username="oldhash")).status_code == 200
+
+    async def test_rehash_skips_password_changed_meanwhile(self, client, engine):
+        from sqlalchemy import select
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+
+        from db.models import Climber
+        from security import rehash
+
+        user_id = (await signup(client, username="changed")).json()["climber"]["id"]
+        assert rehash.schedule_rehash(user_id, "secret123", "not-the-current-hash") is True
+        assert rehash.schedule_rehash(user_id, "secret123", "not-the-current-hash") is False
+
+        factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+        async with factory() as session:
+            before = await session.scalar(select(Climber.password).where(Climber.id == user_id))
+        assert await rehash.process_next(factory) is True
+        async with factory() as session:
+            assert await session.scalar(select(Climber.password).where(Climber.id == user_id)) == before
+
+
+class TestPasswordResetTokenMaintenance:
+    async def _tokens(self, engine):
+        from sqlalchemy import select
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+
+        from db.models import PasswordResetToken
+
+        async with async_sessionmaker(bind=engine)() as session:
+            return (await session.scalars(select(PasswordResetToken))).all()
+
+    async def test_new_request_invalidates_previous_tokens(self, client, engine):
+        await client.post(f"{BASE}/auth/signup", json={
+            "username": "resetme", "password": "secret123", "firstname": "R", "lastname": "M",
+            "email": "resetme@example.com",
+        })
+        for _ in range(3):
+            resp = await client.post(f"{BASE}/auth/password-reset/request", json={"username": "resetme"})
+            assert resp.status_code == 200
+
+        tokens = await self._tokens(engine)
+        assert len(tokens) == 1
+        assert tokens[0].used is False
+
+    async def test_purge_removes_used_and_expired_tokens(self, client, engine):
+        from datetime import datetime, timedelta, timezone
+
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+
+        from db.models import PasswordResetToken
+        from security.reset_tokens import purge_expired
+
+        user_id = (await signup(client, username="purge")).json()["climber"]["id"]
+        now = datetime.now(tz=timezone.utc)
+        factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+        async with factory() as session:
+            session.add_all([
+                PasswordResetToken(user_id=user_id, token="live", expires_at=now + timedelta(hours=1)),
+                PasswordResetToken(user_id=user_id, token="used", expires_at=now + timedelta(hours=1), used=True),
+                PasswordResetToken(user_id=user_id, token="old1", expires_at=now - timedelta(hours=1)),
+                PasswordResetToken(user_id=user_id, token="old2", expires_at=now - timedelta(hours=2)),
+            ])
+            await session.commit()
+
+        assert await purge_expired(factory, batch_size=2) == 3
+        assert [t.token for t in await self._tokens(engine)] == ["live"]
+
+
+class TestEmailOutbox:
+    async def _outbox(self, engine):
+        from sqlalchemy import select
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+
+        from db.models import EmailOutbox
+
+        async with async_sessionmaker(bind=engine)() as session:
+            return (await session.scalars(select(EmailOutbox).order_by(EmailOutbox.id))).all()
+
+    async def test_reset_request_enqueues_mail(self, client, engine):
+        await client.post(f"{BASE}/auth/signup", json={
+            "username": "outboxed", "password": "secret123", "firstname": "O", "lastname": "B",
+            "email": "outboxed@example.com",
+        })
+        await client.post(f"{BASE}/auth/password-reset/request", json={"username": "outboxed"})
+
+        [mail] = await self._outbox(engine)
+        assert mail.recipient == "outboxed@example.com"
+        assert mail.status == "pending"
+        assert "reset-password?token=" in mail.body_html
+
+    async def test_batch_is_sent_over_one_reused_connection(self, engine, monkeypatch):
+        import socket
+
+        from aiosmtpd.controller import Controller
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+
+        from services.email import email_settings, enqueue_email
+        from services.outbox import SMTPPool, deliver_batch
+
+        monkeypatch.setattr(email_settings, "MAIL_FROM", "noreply@example.com")
+
+        class Handler:
+            def __init__(self):
+                self.recipients = []
+
+            async def handle_DATA(self, server, session, envelope):
+                self.recipients.extend(envelope.rcpt_tos)
+                return "250 OK"
+
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        handler = Handler()
+        controller = Controller(handler, hostname="127.0.0.1", port=port)
+        controller.start()
+        try:
+            factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+            async with factory() as session:
+                for i in range(5):
+                    enqueue_email(session, f"user{i}@example.com", "Hej", "<p>Hej</p>", "Hej")
+                await session.commit()
+
+            pool = SMTPPool("127.0.0.1", port, start_tls=False, size=1)
+            assert await deliver_batch(factory, pool) == 5
+            assert await deliver_batch(factory, pool) == 0
+            await pool.close()
+        finally:
+            controller.stop()
+
+        assert sorted(handler.recipients) == [f"user{i}@example.com" for i in range(5)]
+        assert pool.connections_opened == 1
+        assert {m.status for m in await self._outbox(engine)} == {"sent"}
+
+    async def test_failed_send_is_retried_with_backoff_then_dropped(self, engine, monkeypatch):
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+
+        from services.email import email_settings, enqueue_email
+        from services.outbox import deliver_batch
+
+        class FailingMailer:
+            async def send_many(self, messages):
+                return [ConnectionError("smtp down")] * len(messages)
+
+        monkeypatch.setattr(email_settings, "MAIL_MAX_ATTEMPTS", 2)
+        monkeypatch.setattr(email_settings, "MAIL_RETRY_BASE_S", 0)
+        factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+        async with factory() as session:
+            enqueue_email(session, "nobody@example.com", "Hej", "<p>Hej</p>")
+            await session.commit()
+
+        assert await deliver_batch(factory, FailingMailer()) == 1
+        [mail] = await self._outbox(engine)
+        assert (mail.status, mail.attempts, mail.last_error) == ("pending", 1, "smtp down")
+
+        assert await deliver_batch(factory, FailingMailer()) == 1
+        [mail] = await self._outbox(engine)
+        assert (mail.status, mail.attempts) == ("failed", 2)
+        assert await deliver_batch(factory, FailingMailer()) == 0
+
+    async def test_batch_is_leased_not_locked_while_sending(self, engine):
+        from datetime import datetime, timedelta, timezone
+
+        from sqlalchemy import update
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+
+        from db.models import EmailOutbox
+        from services.email import enqueue_email
+        from services.outbox import deliver_batch
+
+        outbox = self._outbox
+
+        class CheckingMailer:
+            seen = []
+
+            async def send_many(self, messages):
+                # The claim is committed: another session sees the lease
+                self.seen = [(m.status, m.locked_until is not None) for m in await outbox(engine)]
+                return [None] * len(messages)
+
+        factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+        async with factory() as session:
+            enqueue_email(session, "a@example.com", "Hej", "<p>Hej</p>")
+            enqueue_email(session, "b@example.com", "Hej", "<p>Hej</p>")
+            await session.commit()
+            # b was claimed by a worker that died; its lease has run out
+            await session.execute(update(EmailOutbox).where(EmailOutbox.recipient == "b@example.com").values(
+                status="sending", locked_until=datetime.now(tz=timezone.utc) - timedelta(seconds=1)))
+            enqueue_email(session, "c@example.com", "Hej", "<p>Hej</p>")
+            await session.commit()
+            await session.execute(update(EmailOutbox).where(EmailOutbox.recipient == "c@example.com").values(
+                status="sending", locked_until=datetime.now(tz=timezone.utc) + timedelta(minutes=5)))
+            await session.commit()
+
+        mailer = CheckingMailer()
+        assert await deliver_batch(factory, mailer) == 2  # c is still leased to another worker
+        assert mailer.seen == [("sending", True)] * 3
+        assert [(m.recipient, m.status, m.locked_until is None) for m in await self._outbox(engine)] == [
+            ("a@example.com", "sent", True), ("b@example.com", "sent", True), ("c@example.com", "sending", False),
+        ]
+
+
+    async def test_purge_deletes_sent_rows_past_retention(self, engine):
+        from datetime import datetime, timedelta, timezone
+
+        from sqlalchemy import update
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+
+        from db.models import EmailOutbox
+        from services.email import enqueue_email
+        from services.outbox import purge_sent
+
+        now = datetime.now(tz=timezone.utc)
+        factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+        async with factory() as session:
+            for recipient in ("old1", "old2", "old3", "recent", "pending", "failed"):
+                enqueue_email(session, f"{recipient}@example.com", "Hej", "<p>Hej</p>")
+            await session.commit()
+            for recipient, status, sent_at in [("old1", "sent", now - timedelta(days=8)),
+                                               ("old2", "sent", now - timedelta(days=9)),
+                                               ("old3", "sent", now - timedelta(days=10)),
+                                               ("recent", "sent", now - timedelta(hours=1)),
+                                               ("failed", "failed", None)]:
+                await session.execute(update(EmailOutbox).where(EmailOutbox.recipient == f"{recipient}@example.com")
+                                      .values(status=status, sent_at=sent_at))
+            await session.commit()
+
+        assert await purge_sent(factory, batch_size=2, retention_s=7 * 86400) == 3
+        assert [m.recipient for m in await self._outbox(engine)] == [
+            "recent@example.com", "pending@example.com", "failed@example.com",
+        ]
@@ -0,0 +1,1001 @@
+"""
+Integration tests for competition scoring and the leaderboard.
+
+Builds a season and competition as an admin, registers climbers and writes
+scores through the API, then checks the leaderboard and its backing totals.
+"""
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import event, func, select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from db.models import Climber, LeaderboardTotal, Problem, ProblemScore, SeasonStanding, UserScope
+
+BASE = "/api/v1"
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+async def climber(client: AsyncClient, username: str, firstname: str = "") -> dict:
+    resp = await client.post(f"{BASE}/auth/signup", json={
+        "username": username, "password": "secret123", "firstname": firstname or username.title(),
+        "lastname": "",
+    })
+    body = resp.json()
+    return {"id": body["climber"]["id"], "headers": {"Authorization": f"Bearer {body['access_token']}"}}
+
+
+async def admin(client: AsyncClient, engine) -> dict:
+    user = await climber(client, "admin")
+    async with async_sessionmaker(bind=engine)() as session:
+        await session.execute(update(Climber).where(Climber.id == user["id"]).values(user_scope=UserScope.admin))
+        await session.commit()
+    return user
+
+
+async def competition(client: AsyncClient, headers: dict) -> int:
+    season = await client.post(f"{BASE}/season", json={"name": "Vår", "year": 2026}, headers=headers)
+    comp = await client.post(f"{BASE}/competition", json={
+        "name": "Deltävling 1", "comp_type": "QUALIFIER", "comp_date": "2026-03-01",
+        "season_id": season.json()["id"], "round_no": 1,
+    }, headers=headers)
+    assert comp.status_code == 201, comp.text
+    return comp.json()["id"]
+
+
+async def register(client, comp_id, user, level=1, approve_with=None):
+    resp = await client.post(f"{BASE}/competition/{comp_id}/register", json={"level": level}, headers=user["headers"])
+    assert resp.status_code == 201, resp.text
+    if approve_with:
+        await client.patch(f"{BASE}/competition/{comp_id}/registration/{user['id']}",
+                           json={"approved": True}, headers=approve_with)
+
+
+def top(attempts: int) -> dict:
+    return {"attempts_total": attempts, "got_bonus": True, "got_top": True,
+            "attempts_to_bonus": 1, "attempts_to_top": attempts}
+
+
+def bonus(attempts: int) -> dict:
+    return {"attempts_total": attempts, "got_bonus": True, "got_top": False, "attempts_to_bonus": attempts}
+
+
+async def score(client, comp_id, user, problem_no, body, level=1):
+    resp = await client.put(f"{BASE}/competitions/{comp_id}/level/{level}/problems/{problem_no}/score",
+                            json=body, headers=user["headers"])
+    assert resp.status_code == 200, resp.text
+
+
+async def leaderboard(client, comp_id, headers) -> dict:
+    resp = await client.get(f"{BASE}/competition/{comp_id}/leaderboard", headers=headers)
+    assert resp.status_code == 200, resp.text
+    return {lvl["level"]: [(e["rank"], e["name"], e["total_score"]) for e in lvl["entries"]]
+            for lvl in resp.json()["levels"]}
+
+
+async def assert_totals_match_scores(engine, comp_id):
+    """leaderboard_total must equal a fresh aggregate over problem_score."""
+    async with async_sessionmaker(bind=engine)() as session:
+        expected = {
+            (level, user_id): round(total, 1)
+            for level, user_id, total in (await session.execute(
+                select(Problem.level_no, ProblemScore.user_id, func.sum(ProblemScore.ifsc_score))
+                .join(Problem, Problem.id == ProblemScore.problem_id)
+                .where(ProblemScore.competition_id == comp_id)
+                .group_by(Problem.level_no, ProblemScore.user_id)
+            )).all()
+        }
+        actual = {
+            (row.level, row.user_id): round(row.total_score, 1)
+            for row in (await session.scalars(
+                select(LeaderboardTotal).where(LeaderboardTotal.competition_id == comp_id)
+            )).all()
+        }
+    assert actual == expected
+
+
+# ---------------------------------------------------------------------------
+# GET /competition/{comp_id}/leaderboard
+# ---------------------------------------------------------------------------
+
+class TestLeaderboard:
+    @pytest.fixture()
+    async def setup(self, client, engine):
+        boss = await admin(client, engine)
+        comp_id = await competition(client, boss["headers"])
+        return boss, comp_id
+
+    async def test_ranks_approved_climbers_by_total(self, client, engine, setup):
+        boss, comp_id = setup
+        anna, bo, cia = [await climber(client, name) for name in ("anna", "bo", "cia")]
+        await register(client, comp_id, anna, approve_with=boss["headers"])
+        await register(client, comp_id, bo, approve_with=boss["headers"])
+        await register(client, comp_id, cia)  # not approved
+
+        await score(client, comp_id, anna, 1, top(1))
+        await score(client, comp_id, bo, 1, top(3))
+        await score(client, comp_id, cia, 1, top(1))
+
+        board = await leaderboard(client, comp_id, boss["headers"])
+        assert board == {1: [(1, "Anna", 25.0), (2, "Bo", 24.8)]}
+        await assert_totals_match_scores(engine, comp_id)
+
+    async def test_rewriting_a_score_applies_the_difference(self, client, engine, setup):
+        boss, comp_id = setup
+        anna = await climber(client, "anna")
+        await register(client, comp_id, anna, approve_with=boss["headers"])
+
+        await score(client, comp_id, anna, 1, top(2))
+        await score(client, comp_id, anna, 2, top(1))
+        await score(client, comp_id, anna, 1, bonus(4))
+
+        board = await leaderboard(client, comp_id, boss["headers"])
+        assert board == {1: [(1, "Anna", 39.7)]}
+        await assert_totals_match_scores(engine, comp_id)
+
+    async def test_batch_upsert_updates_totals(self, client, engine, setup):
+        boss, comp_id = setup
+        anna = await climber(client, "anna")
+        await register(client, comp_id, anna, approve_with=boss["headers"])
+        await score(client, comp_id, anna, 3, top(1))
+
+        resp = await client.put(f"{BASE}/competitions/{comp_id}/level/1/scores/batch", json={"items": [
+            {"problem_no": 1, **top(1)},
+            {"problem_no": 2, **bonus(2)},
+            {"problem_no": 3, **bonus(1)},
+        ]}, headers=anna["headers"])
+        assert resp.status_code == 200, resp.text
+
+        assert await leaderboard(client, comp_id, boss["headers"]) == {1: [(1, "Anna", 54.9)]}
+        await assert_totals_match_scores(engine, comp_id)
+
+    async def test_ties_share_a_rank(self, client, setup):
+        boss, comp_id = setup
+        users = [await climber(client, name) for name in ("anna", "bo", "cia")]
+        for user in users:
+            await register(client, comp_id, user, approve_with=boss["headers"])
+        await score(client, comp_id, users[0], 1, top(1))
+        await score(client, comp_id, users[1], 1, top(1))
+
+        ranks = [rank for rank, _, _ in (await leaderboard(client, comp_id, boss["headers"]))[1]]
+        assert ranks == [1, 1, 3]
+
+    async def test_unapproving_hides_climber(self, client, setup):
+        boss, comp_id = setup
+        anna = await climber(client, "anna")
+        await register(client, comp_id, anna, approve_with=boss["headers"])
+        await score(client, comp_id, anna, 1, top(1))
+
+        await client.patch(f"{BASE}/competition/{comp_id}/registration/{anna['id']}",
+                           json={"approved": False}, headers=boss["headers"])
+        assert await leaderboard(client, comp_id, boss["headers"]) == {}
+
+    async def test_level_change_moves_climber(self, client, engine, setup):
+        boss, comp_id = setup
+        anna = await climber(client, "anna")
+        await register(client, comp_id, anna, approve_with=boss["headers"])
+        await score(client, comp_id, anna, 1, top(1))
+
+        resp = await client.patch(f"{BASE}/competition/{comp_id}/registration/{anna['id']}/level",
+                                  json={"level": 2}, headers=boss["headers"])
+        assert resp.status_code == 200
+        assert await leaderboard(client, comp_id, boss["headers"]) == {2: [(1, "Anna", 0.0)]}
+
+        await client.patch(f"{BASE}/competition/{comp_id}/registration/{anna['id']}/level",
+                           json={"level": 1}, headers=boss["headers"])
+        assert await leaderboard(client, comp_id, boss["headers"]) == {1: [(1, "Anna", 25.0)]}
+        await assert_totals_match_scores(engine, comp_id)
+
+
+    async def test_equal_totals_are_broken_by_tops_then_attempts(self, client, engine, setup):
+        boss, comp_id = setup
+        anna, bo, cia = [await climber(client, name) for name in ("anna", "bo", "cia")]
+        for user in (anna, bo, cia):
+            await register(client, comp_id, user, approve_with=boss["headers"])
+
+        # All on 39.9 or 25.0: Bo needed fewer attempts to top than Anna;
+        # Cia's 25.0 comes from two zones and loses to any top.
+        await score(client, comp_id, anna, 1, top(2))
+        await score(client, comp_id, anna, 2, bonus(1))
+        await score(client, comp_id, bo, 1, top(1))
+        await score(client, comp_id, bo, 2, bonus(2))
+        await score(client, comp_id, cia, 1, bonus(1))
+        await score(client, comp_id, cia, 2, bonus(51))
+
+        board = await leaderboard(client, comp_id, boss["headers"])
+        assert board == {1: [(1, "Bo", 39.9), (2, "Anna", 39.9), (3, "Cia", 25.0)]}
+
+    async def test_board_is_the_top_twenty_and_their_ties(self, client, engine, setup):
+        boss, comp_id = setup
+        users = [await climber(client, f"user{i:02}") for i in range(23)]
+        for i, user in enumerate(users):
+            await register(client, comp_id, user, approve_with=boss["headers"])
+            if i < 18:
+                await score(client, comp_id, user, 1, top(i + 1))
+
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(engine.sync_engine, "before_cursor_execute", record)
+        try:
+            board = await leaderboard(client, comp_id, boss["headers"])
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", record)
+        # 18 distinct scores, then five climbers without one share 19th: all 23 are shown
+        assert [rank for rank, _, _ in board[1]] == [*range(1, 19), 19, 19, 19, 19, 19]
+        assert not any("problem_score" in statement for statement in statements)
+
+    async def test_every_endpoint_applies_the_tie_breaks(self, client, setup):
+        boss, comp_id = setup
+        anna, bo, cia = [await climber(client, name) for name in ("anna", "bo", "cia")]
+        for user in (anna, bo, cia):
+            await register(client, comp_id, user, approve_with=boss["headers"])
+
+        # All topped in three attempts (24.8); Anna reached the zone on her third, the others on their first.
+        await score(client, comp_id, anna, 1, {**top(3), "attempts_to_bonus": 3})
+        await score(client, comp_id, bo, 1, top(3))
+        await score(client, comp_id, cia, 1, top(3))
+        expected = [(1, "Bo"), (1, "Cia"), (3, "Anna")]
+
+        board = await leaderboard(client, comp_id, boss["headers"])
+        assert [(rank, name) for rank, name, _ in board[1]] == expected
+
+        pages, after = [], None
+        while True:
+            resp = await client.get(f"{BASE}/competition/{comp_id}/leaderboard/level/1",
+                                    params={"limit": 1, **({"after": after} if after else {})},
+                                    headers=anna["headers"])
+            pages += [(e["rank"], e["name"]) for e in resp.json()["entries"]]
+            after = resp.json()["next_cursor"]
+            if after is None:
+                break
+        assert pages == expected
+
+        resp = await client.get(f"{BASE}/competition/{comp_id}/leaderboard/me",
+                                params={"window": 2}, headers=anna["headers"])
+        assert resp.json()["rank"] == 3
+        assert [(e["rank"], e["name"]) for e in resp.json()["entries"]] == expected
+
+
+class TestScoreUpsert:
+    async def test_statements_per_write(self, client, engine):
+        from sqlalchemy import event
+
+        boss = await admin(client, engine)
+        comp_id = await competition(client, boss["headers"])
+        anna = await climber(client, "anna")
+        await register(client, comp_id, anna, approve_with=boss["headers"])
+        await score(client, comp_id, anna, 1, top(1))  # warm the auth caches
+
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement.split()[0].upper())
+
+        event.listen(engine.sync_engine, "before_cursor_execute", record)
+        try:
+            await score(client, comp_id, anna, 1, top(2))
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", record)
+        # lock total, upsert score, refresh total, season standing; nothing competition-wide
+        assert statements == ["UPDATE", "INSERT", "INSERT", "INSERT"]
+        assert await leaderboard(client, comp_id, boss["headers"]) == {1: [(1, "Anna", 24.9)]}
+        await assert_totals_match_scores(engine, comp_id)
+
+    async def test_returns_the_stored_score(self, client, engine):
+        boss = await admin(client, engine)
+        comp_id = await competition(client, boss["headers"])
+        anna = await climber(client, "anna")
+        await register(client, comp_id, anna)
+        resp = await client.put(f"{BASE}/competitions/{comp_id}/level/1/problems/3/score",
+                                json=bonus(2), headers=anna["headers"])
+        assert resp.json() == {"problem_no": 3, "attempts_total": 2, "got_bonus": True, "got_top": False,
+                               "attempts_to_bonus": 2, "attempts_to_top": None, "ifsc_score": 14.9}
+
+    async def test_batch_is_one_upsert(self, client, engine):
+        from sqlalchemy import event
+
+        boss = await admin(client, engine)
+        comp_id = await competition(client, boss["headers"])
+        anna = await climber(client, "anna")
+        await register(client, comp_id, anna, approve_with=boss["headers"])
+        await score(client, comp_id, anna, 1, top(1))
+
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement.split()[0].upper())
+
+        items = [{"problem_no": no, **(top(no) if no % 2 else bonus(no))} for no in range(1, 9)]
+        event.listen(engine.sync_engine, "before_cursor_execute", record)
+        try:
+            resp = await client.put(f"{BASE}/competitions/{comp_id}/level/1/scores/batch",
+                                    json={"items": items}, headers=anna["headers"])
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", record)
+        assert resp.status_code == 200, resp.text
+        assert statements == ["UPDATE", "INSERT", "INSERT", "INSERT"]
+        assert [r["score"]["ifsc_score"] for r in resp.json()] == [25.0, 14.9, 24.8, 14.7, 24.6, 14.5, 24.4, 14.3]
+        await assert_totals_match_scores(engine, comp_id)
+
+    async def test_batch_errors(self, client, engine):
+        boss = await admin(client, engine)
+        comp_id = await competition(client, boss["headers"])
+        anna, bo = await climber(client, "anna"), await climber(client, "bo")
+        await register(client, comp_id, anna, level=7)
+
+        url = f"{BASE}/competitions/{comp_id}/level/{{level}}/scores/batch"
+        items = {"items": [{"problem_no": 1, **top(1)}, {"problem_no": 2, **top(1)}]}
+        resp = await client.put(url.format(level=1), json=items, headers=bo["headers"])
+        assert (resp.status_code, resp.json()["detail"]) == (403, "Not registered for this competition")
+        resp = await client.put(url.format(level=1), json=items, headers=anna["headers"])
+        assert (resp.status_code, resp.json()["detail"]) == (403, "Registered for a different level")
+
+        async with async_sessionmaker(bind=engine)() as session:
+            problem = await session.scalar(select(Problem).where(
+                Problem.competition_id == comp_id, Problem.level_no == 7, Problem.problem_no == 2))
+            await session.delete(problem)
+            await session.commit()
+        resp = await client.put(url.format(level=7), json=items, headers=anna["headers"])
+        assert (resp.status_code, resp.json()["detail"]) == (404, "Problems not found: [2]")
+        # The whole batch was rolled back
+        await assert_totals_match_scores(engine, comp_id)
+        resp = await client.get(url.format(level=7), headers=anna["headers"])
+        assert resp.json()[0]["score"]["ifsc_score"] == 0.0
+
+    async def test_errors(self, client, engine):
+        boss = await admin(client, engine)
+        comp_id = await competition(client, boss["headers"])
+        anna, bo = await climber(client, "anna"), await climber(client, "bo")
+        await register(client, comp_id, anna, level=2)
+
+        url = f"{BASE}/competitions/{comp_id}/level/{{level}}/problems/{{problem}}/score"
+        resp = await client.put(url.format(level=2, problem=9), json=top(1), headers=anna["headers"])
+        assert (resp.status_code, resp.json()["detail"]) == (404, "Problem not found")
+        resp = await client.put(url.format(level=1, problem=1), json=top(1), headers=anna["headers"])
+        assert (resp.status_code, resp.json()["detail"]) == (403, "Registered for a different level")
+        resp = await client.put(url.format(level=1, problem=1), json=top(1), headers=bo["headers"])
+        assert (resp.status_code, resp.json()["detail"]) == (403, "Not registered for this competition")
+        await assert_totals_match_scores(engine, comp_id)
+
+
+class TestLeaderboardCache:
+    async def test_repeated_reads_are_served_from_cache(self, client, engine):
+        from services.leaderboard import leaderboard_cache
+
+        boss = await admin(client, engine)
+        comp_id = await competition(client, boss["headers"])
+        anna = await climber(client, "anna")
+        await register(client, comp_id, anna, approve_with=boss["headers"])
+
+        hits = leaderboard_cache.stats()["hits"]
+        first = await leaderboard(client, comp_id, boss["headers"])
+        for _ in range(3):
+            assert await leaderboard(client, comp_id, boss["headers"]) == first
+        assert leaderboard_cache.stats()["hits"] - hits == 3
+
+        resp = await client.get(f"{BASE}/metrics", headers=boss["headers"])
+        assert resp.json()["leaderboard_cache"]["hits"] >= 3
+
+    async def test_writes_invalidate(self, client, engine):
+        boss = await admin(client, engine)
+        comp_id = await competition(client, boss["headers"])
+        anna = await climber(client, "anna")
+        await register(client, comp_id, anna, approve_with=boss["headers"])
+        assert await leaderboard(client, comp_id, boss["headers"]) == {1: [(1, "Anna", 0.0)]}
+
+        await score(client, comp_id, anna, 1, top(1))
+        assert await leaderboard(client, comp_id, boss["headers"]) == {1: [(1, "Anna", 25.0)]}
+
+        await client.patch(f"{BASE}/climber/me", json={"firstname": "Annie"}, headers=anna["headers"])
+        assert await leaderboard(client, comp_id, boss["headers"]) == {1: [(1, "Annie", 25.0)]}
+
+
+    async def test_concurrent_misses_share_one_computation(self, client, engine):
+        import asyncio
+
+        from services.leaderboard import leaderboard_cache
+
+        boss = await admin(client, engine)
+        comp_id = await competition(client, boss["headers"])
+        anna = await climber(client, "anna")
+        await register(client, comp_id, anna, approve_with=boss["headers"])
+
+        leaders = leaderboard_cache.stats()["leaders"]
+        boards = await asyncio.gather(*(leaderboard(client, comp_id, boss["headers"]) for _ in range(10)))
+        assert all(board == {1: [(1, "Anna", 0.0)]} for board in boards)
+        assert leaderboard_cache.stats()["leaders"] - leaders == 1
+
+
+class TestPublicLeaderboard:
+    @pytest.fixture()
+    async def setup(self, client, engine):
+        boss = await admin(client, engine)
+        comp_id = await competition(client, boss["headers"])
+        anna = await climber(client, "anna")
+        await register(client, comp_id, anna, approve_with=boss["headers"])
+        resp = await client.patch(f"{BASE}/competition/{comp_id}", json={"published": True}, headers=boss["headers"])
+        assert resp.json()["published"] is True
+        return boss, comp_id, anna
+
+    async def test_unpublished_competition_is_not_found(self, client, engine):
+        boss = await admin(client, engine)
+        comp_id = await competition(client, boss["headers"])
+        resp = await client.get(f"{BASE}/competition/{comp_id}/leaderboard/public")
+        assert resp.status_code == 404
+
+    async def test_etag_and_304(self, client, setup):
+        _, comp_id, _ = setup
+        url = f"{BASE}/competition/{comp_id}/leaderboard/public"
+        resp = await client.get(url)
+        assert resp.status_code == 200
+        assert resp.json()["levels"][0]["entries"] == [{"rank": 1, "name": "Anna", "total_score": 0.0}]
+        assert resp.headers["cache-control"].startswith("public, max-age=")
+        etag = resp.headers["etag"]
+
+        resp = await client.get(url, headers={"If-None-Match": etag})
+        assert resp.status_code == 304
+        assert resp.content == b""
+        assert resp.headers["etag"] == etag
+        assert (await client.get(url, headers={"If-None-Match": f'"other", W/{etag}'})).status_code == 304
+
+    async def test_board_changes_produce_a_new_etag(self, client, setup):
+        boss, comp_id, anna = setup
+        url = f"{BASE}/competition/{comp_id}/leaderboard/public"
+        etag = (await client.get(url)).headers["etag"]
+
+        # An unapproved climber's scores are not on the board
+        bo = await climber(client, "bo")
+        await register(client, comp_id, bo)
+        await score(client, comp_id, bo, 1, top(1))
+        assert (await client.get(url, headers={"If-None-Match": etag})).status_code == 304
+
+        await score(client, comp_id, anna, 1, top(1))
+        resp = await client.get(url, headers={"If-None-Match": etag})
+        assert resp.status_code == 200
+        assert resp.json()["levels"][0]["entries"][0]["total_score"] == 25.0
+        assert resp.headers["etag"] != etag
+        etag = resp.headers["etag"]
+
+        await client.patch(f"{BASE}/climber/me", json={"firstname": "Annie"}, headers=anna["headers"])
+        resp = await client.get(url, headers={"If-None-Match": etag})
+        assert resp.status_code == 200
+        assert resp.json()["levels"][0]["entries"][0]["name"] == "Annie"
+
+    async def test_etag_names_the_content_served(self, client, engine, setup):
+        from services.leaderboard import leaderboard_cache
+
+        _, comp_id, _ = setup
+        url = f"{BASE}/competition/{comp_id}/leaderboard/public"
+        etag = (await client.get(url)).headers["etag"]
+        leaderboard_cache.invalidate(comp_id)
+        assert (await client.get(url, headers={"If-None-Match": etag})).status_code == 304  # same board, same tag
+
+        # Another worker committed a write; this worker serves its cached board, under that board's tag, until it expires.
+        async with async_sessionmaker(bind=engine)() as session:
+            await session.execute(
+                update(LeaderboardTotal).where(LeaderboardTotal.competition_id == comp_id).values(total_score=10)
+            )
+            await session.commit()
+        assert (await client.get(url, headers={"If-None-Match": etag})).status_code == 304
+
+        leaderboard_cache.invalidate(comp_id)
+        resp = await client.get(url, headers={"If-None-Match": etag})
+        assert resp.status_code == 200
+        assert resp.json()["levels"][0]["entries"][0]["total_score"] == 10.0
+        assert resp.headers["etag"] != etag
+
+
+class TestLeaderboardStream:
+    async def test_score_write_pushes_diff(self, client, engine, monkeypatch):
+        import json
+
+        from api.v1.competition import _cached_leaderboard
+        from services.leaderboard import leaderboard_stream
+
+        monkeypatch.setattr(leaderboard_stream, "debounce", 0)
+        boss = await admin(client, engine)
+        comp_id = await competition(client, boss["headers"])
+        anna, bo = await climber(client, "anna"), await climber(client, "bo")
+        await register(client, comp_id, anna, approve_with=boss["headers"])
+        await register(client, comp_id, bo, approve_with=boss["headers"])
+
+        async def load():
+            return (await _cached_leaderboard(engine, comp_id)).model_dump()
+
+        def parse(event):
+            fields = dict(line.split(": ", 1) for line in event.decode().strip().split("\n"))
+            return fields["event"], json.loads(fields["data"])
+
+        sub = await leaderboard_stream.subscribe(comp_id, load)
+        try:
+            kind, snapshot = parse(await sub.next(1))
+            assert kind == "snapshot"
+            assert [e["total_score"] for e in snapshot["levels"][0]["entries"]] == [0.0, 0.0]
+
+            await score(client, comp_id, bo, 1, top(1))
+            kind, diff = parse(await sub.next(1))
+            assert kind == "diff"
+            [level] = diff["levels"]
+            assert level["remove"] == []
+            assert {(e["user_id"], e["rank"], e["total_score"]) for e in level["upsert"]} == {
+                (bo["id"], 1, 25.0), (anna["id"], 2, 0.0),
+            }
+        finally:
+            leaderboard_stream.unsubscribe(sub)
+
+    async def test_stream_of_missing_competition_is_404(self, client, engine):
+        boss = await admin(client, engine)
+        resp = await client.get(f"{BASE}/competition/999/leaderboard/stream", headers=boss["headers"])
+        assert resp.status_code == 404
+
+
+class TestLeaderboardWindows:
+    @pytest.fixture()
+    async def field(self, client, engine):
+        """Seven approved climbers at level 1; c and d tie, as do f and g."""
+        boss = await admin(client, engine)
+        comp_id = await competition(client, boss["headers"])
+        users = {}
+        for name, body in [("a", top(1)), ("b", top(2)), ("c", top(3)), ("d", top(3)),
+                           ("e", bonus(1)), ("f", None), ("g", None)]:
+            users[name] = await climber(client, f"user{name}", firstname=name.upper())
+            await register(client, comp_id, users[name], approve_with=boss["headers"])
+            if body:
+                await score(client, comp_id, users[name], 1, body)
+        return comp_id, users
+
+    @staticmethod
+    def ranks(entries):
+        return [(e["rank"], e["name"]) for e in entries]
+
+    async def test_pages_walk_the_full_ranking(self, client, field):
+        comp_id, users = field
+        seen, after = [], None
+        while True:
+            params = {"limit": 2, **({"after": after} if after else {})}
+            resp = await client.get(f"{BASE}/competition/{comp_id}/leaderboard/level/1",
+                                    params=params, headers=users["a"]["headers"])
+            assert resp.status_code == 200, resp.text
+            seen += self.ranks(resp.json()["entries"])
+            after = resp.json()["next_cursor"]
+            if after is None:
+                break
+        assert seen == [(1, "A"), (2, "B"), (3, "C"), (3, "D"), (5, "E"), (6, "F"), (6, "G")]
+
+    async def test_page_starting_inside_a_tie_keeps_the_shared_rank(self, client, field):
+        comp_id, users = field
+        resp = await client.get(f"{BASE}/competition/{comp_id}/leaderboard/level/1",
+                                params={"limit": 3}, headers=users["a"]["headers"])
+        resp = await client.get(f"{BASE}/competition/{comp_id}/leaderboard/level/1",
+                                params={"limit": 3, "after": resp.json()["next_cursor"]},
+                                headers=users["a"]["headers"])
+        assert self.ranks(resp.json()["entries"]) == [(3, "D"), (5, "E"), (6, "F")]
+
+    async def test_my_rank_with_window(self, client, field):
+        comp_id, users = field
+        resp = await client.get(f"{BASE}/competition/{comp_id}/leaderboard/me",
+                                params={"window": 2}, headers=users["d"]["headers"])
+        assert resp.status_code == 200, resp.text
+        body = resp.json()
+        assert (body["level"], body["rank"], body["total_score"]) == (1, 3, 24.8)
+        assert self.ranks(body["entries"]) == [(2, "B"), (3, "C"), (3, "D"), (5, "E"), (6, "F")]
+
+        resp = await client.get(f"{BASE}/competition/{comp_id}/leaderboard/me",
+                                params={"window": 1}, headers=users["a"]["headers"])
+        assert self.ranks(resp.json()["entries"]) == [(1, "A"), (2, "B")]
+
+    async def test_my_rank_requires_an_approved_registration(self, client, engine, field):
+        comp_id, users = field
+        outsider = await climber(client, "outsider")
+        resp = await client.get(f"{BASE}/competition/{comp_id}/leaderboard/me", headers=outsider["headers"])
+        assert resp.status_code == 404
+
+        await register(client, comp_id, outsider)
+        resp = await client.get(f"{BASE}/competition/{comp_id}/leaderboard/me", headers=outsider["headers"])
+        assert resp.status_code == 404
+        assert resp.json()["detail"] == "Not ranked in this competition"
+
+    async def test_invalid_cursor(self, client, field):
+        comp_id, users = field
+        resp = await client.get(f"{BASE}/competition/{comp_id}/leaderboard/level/1",
+                                params={"after": "nope"}, headers=users["a"]["headers"])
+        assert resp.status_code == 400
+
+
+class TestJudgeScores:
+    async def test_writes_many_climbers_in_bounded_statements(self, client, engine, monkeypatch):
+        from sqlalchemy import event
+
+        from api.v1 import problem_score
+
+        boss = await admin(client, engine)
+        comp_id = await competition(client, boss["headers"])
+        season_id = (await client.get(f"{BASE}/competition/{comp_id}")).json()["season_id"]
+        names = ["anna", "bo", "cem", "dag", "eva"]
+        climbers = [await climber(client, name) for name in names]
+        for c in climbers[:4]:
+            await register(client, comp_id, c, approve_with=boss["headers"])
+        await register(client, comp_id, climbers[4])  # not approved: scored but not ranked
+        await score(client, comp_id, climbers[0], 2, top(1))
+
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement.split()[0].upper())
+
+        monkeypatch.setattr(problem_score, "JUDGE_CHUNK_ROWS", 2)
+        items = [{"user_id": c["id"], "problem_no": 1, **(top(i + 1) if i % 2 else bonus(i + 1))}
+                 for i, c in enumerate(climbers)]
+        event.listen(engine.sync_engine, "before_cursor_execute", record)
+        try:
+            resp = await client.put(f"{BASE}/competitions/{comp_id}/level/1/scores/judge",
+                                    json={"items": items}, headers=boss["headers"])
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", record)
+        assert resp.status_code == 200, resp.text
+        assert [(r["user_id"], r["score"]["ifsc_score"]) for r in resp.json()] == [
+            (c["id"], s) for c, s in zip(climbers, [15.0, 24.9, 14.8, 24.7, 14.6])
+        ]
+        # 2 checks, lock totals, 3 chunks, refresh totals, season standings
+        assert statements == ["SELECT", "SELECT", "UPDATE", "INSERT", "INSERT", "INSERT", "INSERT", "INSERT"]
+
+        assert await leaderboard(client, comp_id, boss["headers"]) == {
+            1: [(1, "Anna", 40.0), (2, "Bo", 24.9), (3, "Dag", 24.7), (4, "Cem", 14.8)],
+        }
+        assert await standings(client, season_id, boss["headers"]) == {
+            1: [(1, "Anna", 40.0), (2, "Bo", 24.9), (3, "Dag", 24.7), (4, "Cem", 14.8)],
+        }
+        await assert_totals_match_scores(engine, comp_id)
+
+    async def test_errors(self, client, engine):
+        boss = await admin(client, engine)
+        comp_id = await competition(client, boss["headers"])
+        anna, bo = await climber(client, "anna"), await climber(client, "bo")
+        await register(client, comp_id, anna)
+        await register(client, comp_id, bo, level=2)
+
+        url = f"{BASE}/competitions/{comp_id}/level/1/scores/judge"
+        resp = await client.put(url, json={"items": [{"user_id": anna["id"], "problem_no": 1, **top(1)}]},
+                                headers=anna["headers"])
+        assert resp.status_code == 403
+
+        items = [{"user_id": anna["id"], "problem_no": 1, **top(1)}, {"user_id": bo["id"], "problem_no": 1, **top(1)}]
+        resp = await client.put(url, json={"items": items}, headers=boss["headers"])
+        assert (resp.status_code, resp.json()["detail"]) == (404, f"Not registered for this level: [{bo['id']}]")
+        resp = await client.put(url, json={"items": items + items[:1]}, headers=boss["headers"])
+        assert resp.status_code == 422
+
+        async with async_sessionmaker(bind=engine)() as session:
+            problem = await session.scalar(select(Problem).where(
+                Problem.competition_id == comp_id, Problem.level_no == 1, Problem.problem_no == 3))
+            await session.delete(problem)
+            await session.commit()
+        items = [{"user_id": anna["id"], "problem_no": no, **top(1)} for no in (1, 3)]
+        resp = await client.put(url, json={"items": items}, headers=boss["headers"])
+        assert (resp.status_code, resp.json()["detail"]) == (404, "Problems not found: [3]")
+        await assert_totals_match_scores(engine, comp_id)
+
+
+class TestIdempotencyKey:
+    async def test_retries_are_answered_without_the_database(self, client, engine):
+        from sqlalchemy import event
+
+        boss = await admin(client, engine)
+        comp_id = await competition(client, boss["headers"])
+        anna = await climber(client, "anna")
+        headers = {**anna["headers"], "Idempotency-Key": "reg-1"}
+        url = f"{BASE}/competition/{comp_id}/register"
+        first = await client.post(url, json={"level": 1}, headers=headers)
+        retry = await client.post(url, json={"level": 1}, headers=headers)
+        assert (first.status_code, retry.status_code) == (201, 201)  # not 409 "Already registered"
+        assert retry.json() == first.json()
+
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        url = f"{BASE}/competitions/{comp_id}/level/1/problems/1/score"
+        headers = {**anna["headers"], "Idempotency-Key": "score-1"}
+        first = await client.put(url, json=top(2), headers=headers)
+        event.listen(engine.sync_engine, "before_cursor_execute", record)
+        try:
+            retry = await client.put(url, json=top(2), headers=headers)
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", record)
+        assert statements == []
+        assert (retry.json(), retry.headers["idempotent-replayed"]) == (first.json(), "true")
+
+        resp = await client.put(url, json=top(3), headers=headers)
+        assert resp.status_code == 422
+        await assert_totals_match_scores(engine, comp_id)
+
+
+class TestAttemptEvents:
+    async def log(self, client, comp_id, user, problem_no, *kinds):
+        for kind in kinds:
+            resp = await client.post(f"{BASE}/competitions/{comp_id}/level/1/problems/{problem_no}/attempts",
+                                     json={"kind": kind}, headers=user["headers"])
+            assert resp.status_code == 202, resp.text
+
+    async def test_projection_and_compaction(self, client, engine):
+        from sqlalchemy import event
+
+        from db.models import AttemptEvent
+        from services import attempts
+
+        factory = async_sessionmaker(bind=engine)
+        boss = await admin(client, engine)
+        comp_id = await competition(client, boss["headers"])
+        anna, bo = await climber(client, "anna"), await climber(client, "bo")
+        await register(client, comp_id, anna, approve_with=boss["headers"])
+        await register(client, comp_id, bo, approve_with=boss["headers"])
+
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement.split()[0].upper())
+
+        event.listen(engine.sync_engine, "before_cursor_execute", record)
+        try:
+            await self.log(client, comp_id, anna, 1, "attempt")
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", record)
+        assert statements == ["INSERT"]  # nothing read or locked
+
+        await self.log(client, comp_id, anna, 1, "attempt", "zone", "attempt", "top")
+        await self.log(client, comp_id, anna, 2, "top")  # no attempt logged: counts as the first
+        await self.log(client, comp_id, bo, 1, "attempt", "zone")
+        assert await leaderboard(client, comp_id, boss["headers"]) == {1: [(1, "Anna", 0.0), (1, "Bo", 0.0)]}
+
+        assert await attempts.project_batch(factory, batch_size=4) == 4
+        assert await attempts.project_batch(factory) == 4
+        assert await attempts.project_batch(factory) == 0
+        assert await leaderboard(client, comp_id, boss["headers"]) == {1: [(1, "Anna", 49.8), (2, "Bo", 15.0)]}
+        resp = await client.get(f"{BASE}/competitions/{comp_id}/level/1/scores/batch", headers=anna["headers"])
+        assert resp.json()[0]["score"] == {"attempts_total": 3, "got_bonus": True, "got_top": True,
+                                           "attempts_to_bonus": 2, "attempts_to_top": 3, "ifsc_score": 24.8}
+        await assert_totals_match_scores(engine, comp_id)
+
+        assert await attempts.compact(factory, retention_s=0) == 8
+        await self.log(client, comp_id, bo, 1, "attempt", "top")
+        assert await attempts.compact(factory, retention_s=0) == 0  # not projected yet
+        assert await attempts.project_batch(factory) == 2
+        assert await leaderboard(client, comp_id, boss["headers"]) == {1: [(1, "Anna", 49.8), (2, "Bo", 24.9)]}
+        assert await attempts.compact(factory, retention_s=0) == 2
+        async with factory() as session:
+            assert await session.scalar(select(func.count()).select_from(AttemptEvent)) == 0
+
+    async def test_event_committed_behind_an_applied_one_is_still_applied(self, client, engine):
+        from db.models import AttemptEvent, Problem
+        from services import attempts
+
+        factory = async_sessionmaker(bind=engine)
+        boss = await admin(client, engine)
+        comp_id = await competition(client, boss["headers"])
+        anna = await climber(client, "anna")
+        await register(client, comp_id, anna, approve_with=boss["headers"])
+        async with factory() as session:
+            problem_id = await session.scalar(select(Problem.id).where(
+                Problem.competition_id == comp_id, Problem.level_no == 1, Problem.problem_no == 1,
+            ))
+
+        async def commit_event(event_id, kind):
+            async with factory() as session:
+                session.add(AttemptEvent(id=event_id, competition_id=comp_id, problem_id=problem_id,
+                                         user_id=anna["id"], kind=kind))
+                await session.commit()
+
+        # Id 10 commits and is applied before id 5, which took its id first but committed later
+        await commit_event(10, "attempt")
+        assert await attempts.project_batch(factory) == 1
+        await commit_event(5, "top")
+        assert await attempts.project_batch(factory) == 1
+        assert await attempts.project_batch(factory) == 0
+        assert await leaderboard(client, comp_id, boss["headers"]) == {1: [(1, "Anna", 25.0)]}
+        assert await attempts.compact(factory, retention_s=0) == 2
+
+    async def test_errors(self, client, engine):
+        boss = await admin(client, engine)
+        comp_id = await competition(client, boss["headers"])
+        anna, bo = await climber(client, "anna"), await climber(client, "bo")
+        await register(client, comp_id, anna)
+
+        url = f"{BASE}/competitions/{comp_id}/level/1/problems/{{problem}}/attempts"
+        resp = await client.post(url.format(problem=9), json={"kind": "attempt"}, headers=anna["headers"])
+        assert (resp.status_code, resp.json()["detail"]) == (404, "Problem not found")
+        resp = await client.post(url.format(problem=1), json={"kind": "attempt"}, headers=bo["headers"])
+        assert (resp.status_code, resp.json()["detail"]) == (403, "Not registered for this competition")
+        resp = await client.post(url.format(problem=1), json={"kind": "flash"}, headers=anna["headers"])
+        assert resp.status_code == 422
+
+
+# ---------------------------------------------------------------------------
+# GET /season/{season_id}/standings
+# ---------------------------------------------------------------------------
+
+async def standings(client, season_id, headers) -> dict:
+    resp = await client.get(f"{BASE}/season/{season_id}/standings", headers=headers)
+    assert resp.status_code == 200, resp.text
+    return {lvl["level"]: [(e["rank"], e["name"], e["total_score"]) for e in lvl["entries"]]
+            for lvl in resp.json()["levels"]}
+
+
+async def standing_rows(engine) -> set:
+    async with async_sessionmaker(bind=engine)() as session:
+        return {
+            (r.season_id, r.level, r.user_id, round(r.total_score, 1), r.competitions)
+            for r in (await session.scalars(select(SeasonStanding))).all()
+        }
+
+
+class TestSeasonStandings:
+    @pytest.fixture()
+    async def setup(self, client, engine):
+        boss = await admin(client, engine)
+        first = await competition(client, boss["headers"])
+        season_id = (await client.get(f"{BASE}/competition/{first}")).json()["season_id"]
+        resp = await client.post(f"{BASE}/competition", json={
+            "name": "Deltävling 2", "comp_type": "QUALIFIER", "comp_date": "2026-04-01",
+            "season_id": season_id, "round_no": 2,
+        }, headers=boss["headers"])
+        return boss, season_id, first, resp.json()["id"]
+
+    async def test_sums_approved_rounds(self, client, engine, setup):
+        boss, season_id, first, second = setup
+        anna, bo = await climber(client, "anna"), await climber(client, "bo")
+        await register(client, first, anna, approve_with=boss["headers"])
+        await register(client, second, anna, approve_with=boss["headers"])
+        await register(client, first, bo)  # not approved: not in the standings
+
+        await score(client, first, anna, 1, top(1))
+        await score(client, second, anna, 1, bonus(2))
+        await score(client, first, bo, 1, top(1))
+        assert await standings(client, season_id, boss["headers"]) == {1: [(1, "Anna", 39.9)]}
+
+        await client.patch(f"{BASE}/competition/{first}/registration/{bo['id']}",
+                           json={"approved": True}, headers=boss["headers"])
+        assert await standings(client, season_id, boss["headers"]) == {1: [(1, "Anna", 39.9), (2, "Bo", 25.0)]}
+
+        await score(client, second, anna, 1, bonus(5))
+        assert await standings(client, season_id, boss["headers"]) == {1: [(1, "Anna", 39.6), (2, "Bo", 25.0)]}
+
+        await client.patch(f"{BASE}/competition/{second}/registration/{anna['id']}",
+                           json={"approved": False}, headers=boss["headers"])
+        board = await standings(client, season_id, boss["headers"])
+        assert sorted(board[1]) == [(1, "Anna", 25.0), (1, "Bo", 25.0)]
+
+    async def test_equal_totals_are_broken_across_rounds(self, client, engine, setup):
+        boss, season_id, first, second = setup
+        anna, bo = await climber(client, "anna"), await climber(client, "bo")
+        for comp_id in (first, second):
+            await register(client, comp_id, anna, approve_with=boss["headers"])
+            await register(client, comp_id, bo, approve_with=boss["headers"])
+
+        # 25.0 each: one top for Anna, two zones in different rounds for Bo
+        await score(client, first, anna, 1, top(1))
+        await score(client, first, bo, 1, bonus(1))
+        await score(client, second, bo, 1, bonus(51))
+        assert await standings(client, season_id, boss["headers"]) == {1: [(1, "Anna", 25.0), (2, "Bo", 25.0)]}
+
+    async def test_level_change_moves_total(self, client, engine, setup):
+        boss, season_id, first, _ = setup
+        anna = await climber(client, "anna")
+        await register(client, first, anna, approve_with=boss["headers"])
+        await score(client, first, anna, 1, top(1))
+
+        await client.patch(f"{BASE}/competition/{first}/registration/{anna['id']}/level",
+                           json={"level": 2}, headers=boss["headers"])
+        assert await standings(client, season_id, boss["headers"]) == {2: [(1, "Anna", 0.0)]}
+
+    async def test_rebuild_matches_incremental(self, client, engine, setup):
+        from services import standings as standings_service
+
+        boss, season_id, first, second = setup
+        anna, bo = await climber(client, "anna"), await climber(client, "bo")
+        for comp_id in (first, second):
+            await register(client, comp_id, anna, approve_with=boss["headers"])
+            await register(client, comp_id, bo, approve_with=boss["headers"])
+        await score(client, first, anna, 1, top(3))
+        await score(client, first, anna, 2, bonus(1))
+        await score(client, second, bo, 1, top(1))
+        await score(client, second, bo, 1, bonus(4))
+
+        incremental = await standing_rows(engine)
+        assert await standings_service.rebuild(async_sessionmaker(bind=engine)) == len(incremental)
+        assert await standing_rows(engine) == incremental
+
+    async def test_deleting_a_round_removes_its_points(self, client, engine, setup):
+        boss, season_id, first, second = setup
+        anna = await climber(client, "anna")
+        await register(client, first, anna, approve_with=boss["headers"])
+        await register(client, second, anna, approve_with=boss["headers"])
+        await score(client, first, anna, 1, top(1))
+        await score(client, second, anna, 1, top(1))
+
+        resp = await client.delete(f"{BASE}/competition/{second}", headers=boss["headers"])
+        assert resp.status_code == 204
+        assert await standings(client, season_id, boss["headers"]) == {1: [(1, "Anna", 25.0)]}
+        assert {row[4] for row in await standing_rows(engine)} == {1}
+
+
+# ---------------------------------------------------------------------------
+# GET /export/competition/{comp_id}, /export/season/{season_id}
+# ---------------------------------------------------------------------------
+
+class TestExport:
+    @pytest.fixture()
+    async def setup(self, client, engine):
+        boss = await admin(client, engine)
+        comp_id = await competition(client, boss["headers"])
+        analyst = await climber(client, "analyst")
+        async with async_sessionmaker(bind=engine)() as session:
+            await session.execute(
+                update(Climber).where(Climber.id == analyst["id"]).values(user_scope=UserScope.analyst)
+            )
+            await session.commit()
+        # Re-login so the token carries the analyst scope
+        resp = await client.post(f"{BASE}/auth/login", json={"username": "analyst", "password": "secret123"})
+        analyst["headers"] = {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+        anna, bo = await climber(client, "anna"), await climber(client, "bo")
+        await register(client, comp_id, anna, approve_with=boss["headers"])
+        await register(client, comp_id, bo, approve_with=boss["headers"])
+        await score(client, comp_id, anna, 1, top(1))
+        await score(client, comp_id, anna, 2, bonus(2))
+        season_id = (await client.get(f"{BASE}/competition/{comp_id}")).json()["season_id"]
+        return analyst, comp_id, season_id
+
+    async def test_csv(self, client, setup):
+        import csv
+        import io
+
+        analyst, comp_id, _ = setup
+        resp = await client.get(f"{BASE}/export/competition/{comp_id}", headers=analyst["headers"])
+        assert resp.status_code == 200, resp.text
+        assert resp.headers["content-type"].startswith("text/csv")
+        rows = [(r["username"], int(r["problem_no"]), float(r["ifsc_score"]), float(r["total_score"]), int(r["rank"]))
+                for r in csv.DictReader(io.StringIO(resp.text))]
+        # Registration creates an empty score for each of the level's 8 problems
+        assert len(rows) == 16
+        assert rows[:3] == [("anna", 1, 25.0, 39.9, 1), ("anna", 2, 14.9, 39.9, 1), ("anna", 3, 0.0, 39.9, 1)]
+        assert rows[8] == ("bo", 1, 0.0, 0.0, 2)
+
+    @pytest.mark.parametrize("fmt", ["arrow", "parquet"])
+    async def test_columnar(self, client, setup, monkeypatch, fmt):
+        import io
+
+        import pyarrow.ipc
+        import pyarrow.parquet
+
+        from api.v1 import export
+
+        monkeypatch.setattr(export, "EXPORT_CHUNK_ROWS", 1)
+        analyst, _, season_id = setup
+        resp = await client.get(f"{BASE}/export/season/{season_id}", params={"format": fmt},
+                                headers=analyst["headers"])
+        assert resp.status_code == 200, resp.text
+        if fmt == "arrow":
+            table = pyarrow.ipc.open_stream(resp.content).read_all()
+        else:
+            table = pyarrow.parquet.read_table(io.BytesIO(resp.content))
+        assert table.num_rows == 16
+        assert table.column("username").to_pylist() == ["anna"] * 8 + ["bo"] * 8
+        assert table.column("rank").to_pylist() == [1] * 8 + [2] * 8
+        assert table.column("ifsc_score").to_pylist()[:3] == [25.0, 14.9, 0.0]
+
+    async def test_requires_analyst_scope(self, client, engine, setup):
+        _, comp_id, _ = setup
+        someone = await climber(client, "someone")
+        resp = await client.get(f"{BASE}/export/competition/{comp_id}", headers=someone["headers"])
+        assert resp.status_code == 403
+
+    async def test_unknown_competition(self, client, setup):
+        analyst, _, _ = setup
+        resp = await client.get(f"{BASE}/export/competition/999", headers=analyst["headers"])
+        assert resp.status_code == 404
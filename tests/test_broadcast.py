@@ -0,0 +1,123 @@
+"""Unit tests for services/broadcast.py — SSE fan-out with bounded queues."""
+import asyncio
+import json
+
+from services.broadcast import Broadcaster, encode_event
+from services.leaderboard import diff_boards
+
+
+def parse(event: bytes) -> tuple[str, dict]:
+    fields = dict(line.split(": ", 1) for line in event.decode().strip().split("\n"))
+    return fields["event"], json.loads(fields["data"])
+
+
+def numeric_diff(old, new):
+    return None if old == new else {"value": new}
+
+
+class State:
+    def __init__(self):
+        self.value = 0
+        self.loads = 0
+
+    async def load(self):
+        self.loads += 1
+        return self.value
+
+
+class TestBroadcaster:
+    async def test_subscriber_starts_with_snapshot(self):
+        b = Broadcaster(diff=numeric_diff, debounce=0)
+        state = State()
+        sub = await b.subscribe("k", state.load)
+        assert parse(await sub.next(1)) == ("snapshot", 0)
+        b.unsubscribe(sub)
+
+    async def test_notify_sends_one_diff_to_every_subscriber(self):
+        b = Broadcaster(diff=numeric_diff, debounce=0)
+        state = State()
+        subs = [await b.subscribe("k", state.load) for _ in range(100)]
+        for sub in subs:
+            await sub.next(1)
+
+        state.value = 5
+        b.notify("k")
+        events = [await sub.next(1) for sub in subs]
+        assert all(parse(e) == ("diff", {"value": 5}) for e in events)
+        assert len({id(e) for e in events}) == 1  # encoded once, shared
+        assert state.loads == 2
+        for sub in subs:
+            b.unsubscribe(sub)
+
+    async def test_burst_of_writes_is_reloaded_once(self):
+        b = Broadcaster(diff=numeric_diff, debounce=0.02)
+        state = State()
+        sub = await b.subscribe("k", state.load)
+        await sub.next(1)
+        for i in range(10):
+            state.value = i
+            b.notify("k")
+        assert parse(await sub.next(1)) == ("diff", {"value": 9})
+        assert await sub.next(0.05) is None
+        assert state.loads == 2
+        b.unsubscribe(sub)
+
+    async def test_unchanged_state_sends_nothing(self):
+        b = Broadcaster(diff=numeric_diff, debounce=0)
+        state = State()
+        sub = await b.subscribe("k", state.load)
+        await sub.next(1)
+        b.notify("k")
+        assert await sub.next(0.05) is None
+        b.unsubscribe(sub)
+
+    async def test_slow_subscriber_is_resynced_with_snapshot(self):
+        b = Broadcaster(diff=numeric_diff, queue_size=3, debounce=0)
+        state = State()
+        slow = await b.subscribe("k", state.load)
+        for i in range(1, 6):
+            state.value = i
+            b.notify("k")
+            await asyncio.sleep(0.01)
+
+        # snapshot + diffs 1, 2 fill the queue; diff 3 overflows and is replaced by a snapshot
+        events = [parse(slow.queue.get_nowait()) for _ in range(slow.queue.qsize())]
+        assert events == [("snapshot", 3), ("diff", {"value": 4}), ("diff", {"value": 5})]
+        assert b.stats()["resyncs"] == 1
+        b.unsubscribe(slow)
+
+    async def test_last_unsubscribe_closes_channel(self):
+        b = Broadcaster(diff=numeric_diff, debounce=0)
+        state = State()
+        sub = await b.subscribe("k", state.load)
+        b.unsubscribe(sub)
+        assert b.stats()["channels"] == 0
+        b.notify("k")  # no-op
+
+
+class TestEncodeEvent:
+    def test_sse_framing(self):
+        assert encode_event("diff", {"a": 1}, 7) == b'id: 7\nevent: diff\ndata: {"a":1}\n\n'
+
+
+class TestDiffBoards:
+    def board(self, *entries):
+        levels = {}
+        for level, uid, rank, score in entries:
+            levels.setdefault(level, []).append({"rank": rank, "user_id": uid, "name": f"u{uid}", "total_score": score})
+        return {"competition_id": 1, "levels": [{"level": k, "entries": v} for k, v in sorted(levels.items())]}
+
+    def test_no_change(self):
+        b = self.board((1, 10, 1, 25.0))
+        assert diff_boards(b, b) is None
+
+    def test_changed_and_removed_entries(self):
+        old = self.board((1, 10, 1, 25.0), (1, 11, 2, 15.0), (2, 20, 1, 5.0))
+        new = self.board((1, 11, 1, 40.0), (1, 10, 2, 25.0))
+        assert diff_boards(old, new) == {"competition_id": 1, "levels": [
+            {"level": 1, "upsert": [
+                {"rank": 1, "user_id": 11, "name": "u11", "total_score": 40.0},
+                {"rank": 2, "user_id": 10, "name": "u10", "total_score": 25.0},
+            ], "remove": []},
+            {"level": 2, "upsert": [], "remove": [20]},
+        ]}
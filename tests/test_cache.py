@@ -0,0 +1,64 @@
+"""Unit tests for services/cache.py — TTL/LRU cache."""
+import time
+
+from services.cache import TTLCache
+
+
+class TestTTLCache:
+    def test_get_returns_stored_value(self):
+        cache = TTLCache(maxsize=4, ttl=60)
+        cache.set("a", 1)
+        assert cache.get("a") == 1
+
+    def test_missing_key_returns_none(self):
+        cache = TTLCache(maxsize=4, ttl=60)
+        assert cache.get("nope") is None
+
+    def test_entry_expires_after_ttl(self, monkeypatch):
+        cache = TTLCache(maxsize=4, ttl=10)
+        now = time.monotonic()
+        monkeypatch.setattr(time, "monotonic", lambda: now)
+        cache.set("a", 1)
+        monkeypatch.setattr(time, "monotonic", lambda: now + 11)
+        assert cache.get("a") is None
+        assert len(cache) == 0
+
+    def test_per_entry_ttl_overrides_default(self, monkeypatch):
+        cache = TTLCache(maxsize=4, ttl=60)
+        now = time.monotonic()
+        monkeypatch.setattr(time, "monotonic", lambda: now)
+        cache.set("short", 1, ttl=1)
+        monkeypatch.setattr(time, "monotonic", lambda: now + 2)
+        assert cache.get("short") is None
+
+    def test_least_recently_used_is_evicted(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.evictions == 1
+
+    def test_pop_removes_entry(self):
+        cache = TTLCache(maxsize=4, ttl=60)
+        cache.set("a", 1)
+        assert cache.pop("a") == 1
+        assert cache.get("a") is None
+        assert cache.pop("a") is None
+
+    def test_zero_maxsize_disables_cache(self):
+        cache = TTLCache(maxsize=0, ttl=60)
+        cache.set("a", 1)
+        assert cache.get("a") is None
+
+    def test_stats_report_hit_rate(self):
+        cache = TTLCache(maxsize=4, ttl=60)
+        cache.set("a", 1)
+        cache.get("a")
+        cache.get("b")
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["hit_rate"] == 0.5
@@ -0,0 +1,66 @@
+"""Unit tests for security/calibrate.py — Argon2 parameter recommendation."""
+import json
+
+from security.calibrate import (
+    CandidateResult,
+    LevelResult,
+    concurrency_levels,
+    main,
+    measure_candidate,
+    recommend,
+)
+
+
+def _candidate(memory_kib, time_cost, parallelism=1, p95_ms=100.0, lps=50.0):
+    res = CandidateResult(memory_kib, time_cost, parallelism, max_concurrency=4)
+    res.levels.append(LevelResult(concurrency=4, p50_ms=p95_ms, p95_ms=p95_ms, verifies_per_sec=lps))
+    return res
+
+
+class TestConcurrencyLevels:
+    def test_powers_of_two_up_to_max(self):
+        assert concurrency_levels(6) == [1, 2, 4, 6]
+
+    def test_single_level(self):
+        assert concurrency_levels(1) == [1]
+
+
+class TestRecommend:
+    def test_picks_strongest_candidate_meeting_targets(self):
+        weak = _candidate(19456, 1)
+        strong = _candidate(65536, 3)
+        assert recommend([weak, strong], target_ms=250, target_lps=20) is strong
+
+    def test_skips_candidates_over_latency_target(self):
+        ok = _candidate(19456, 2)
+        slow = _candidate(131072, 4, p95_ms=900)
+        assert recommend([ok, slow], target_ms=250, target_lps=20) is ok
+
+    def test_skips_candidates_below_throughput_target(self):
+        ok = _candidate(19456, 2, lps=40)
+        starved = _candidate(65536, 3, lps=5)
+        assert recommend([ok, starved], target_ms=250, target_lps=20) is ok
+
+    def test_none_when_nothing_qualifies(self):
+        assert recommend([_candidate(65536, 3, p95_ms=900)], target_ms=250, target_lps=20) is None
+
+
+def test_measure_candidate_with_tiny_parameters():
+    res = measure_candidate(8, 1, 1, memory_budget_mib=1, cpu_budget=2, rounds=1)
+    assert res.max_concurrency == 2
+    assert [lvl.concurrency for lvl in res.levels] == [1, 2]
+    assert all(lvl.verifies_per_sec > 0 for lvl in res.levels)
+
+
+def test_main_writes_report(tmp_path):
+    report_path = tmp_path / "report.json"
+    code = main([
+        "--memory-kib", "8", "--time-cost", "1", "--parallelism", "1",
+        "--memory-budget-mib", "1", "--cpu-budget", "1", "--rounds", "1",
+        "--target-ms", "10000", "--target-lps", "0.1",
+        "--report", str(report_path),
+    ])
+    assert code == 0
+    report = json.loads(report_path.read_text())
+    assert report["recommendation"]["ARGON2_MEMORY_KIB"] == 8
+    assert report["host"]["cpu_count"]
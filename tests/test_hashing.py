@@ -1,6 +1,17 @@
 """Unit tests for security/hashing.py"""
+import asyncio
+
 import pytest
-from security.hashing import hash_password, verify_password, needs_rehash
+from security import hashing
+from security.hashing import (
+    hash_password,
+    verify_password,
+    needs_rehash,
+    hash_password_async,
+    verify_password_async,
+    HashLimiter,
+    HashingOverloaded,
+)
 
 
 def test_hash_password_returns_string():
@@ -41,3 +52,62 @@ def test_needs_rehash_fresh_hash():
     """A freshly created hash using current params should not need rehashing."""
     hashed = hash_password("testpassword")
     assert needs_rehash(hashed) is False
+
+
+async def test_hash_password_async_round_trip():
+    hashed = await hash_password_async("asyncpassword")
+    assert await verify_password_async("asyncpassword", hashed) is True
+    assert await verify_password_async("wrongpassword", hashed) is False
+
+
+async def test_async_hash_is_compatible_with_sync_verify():
+    hashed = await hash_password_async("mixedpassword")
+    assert verify_password("mixedpassword", hashed) is True
+
+
+async def test_concurrent_async_hashes_within_queue_capacity():
+    """Callers beyond the running slots wait in the queue instead of failing."""
+    n = hashing.hash_limiter.slots + hashing.hash_limiter.queue_size
+    hashes = await asyncio.gather(*(hash_password_async(f"pw{i}") for i in range(n)))
+    assert len(set(hashes)) == n
+
+
+def test_hash_concurrency_respects_memory_budget(monkeypatch):
+    monkeypatch.setattr(hashing, "HASH_WORKERS", 64)
+    monkeypatch.setattr(hashing, "HASH_CPU_BUDGET", 64)
+    monkeypatch.setattr(hashing, "HASH_MEMORY_BUDGET_MIB", 0)
+    assert hashing.hash_concurrency() == 1
+
+
+class TestHashLimiter:
+    async def test_rejects_when_queue_full(self):
+        limiter = HashLimiter(slots=1, queue_size=1, timeout=5)
+        await limiter.acquire()
+        queued = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert limiter.queue_depth == 1
+
+        with pytest.raises(HashingOverloaded) as exc:
+            await limiter.acquire()
+        assert exc.value.retry_after >= 1
+        assert limiter.rejected_full == 1
+
+        limiter.release(0.1)
+        await queued
+        assert limiter.in_flight == 1
+        assert limiter.queue_depth == 0
+
+    async def test_rejects_after_queue_timeout(self):
+        limiter = HashLimiter(slots=1, queue_size=4, timeout=0.01)
+        await limiter.acquire()
+        with pytest.raises(HashingOverloaded):
+            await limiter.acquire()
+        assert limiter.rejected_timeout == 1
+        assert limiter.queue_depth == 0
+
+    async def test_release_frees_slot(self):
+        limiter = HashLimiter(slots=2, queue_size=0, timeout=1)
+        await limiter.acquire()
+        limiter.release(0.1)
+        assert limiter.in_flight == 0
+        assert limiter.stats()["admitted"] == 1
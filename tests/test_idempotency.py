@@ -0,0 +1,136 @@
+"""Unit tests for services/idempotency.py — replaying retried writes by Idempotency-Key."""
+import asyncio
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+from starlette.responses import JSONResponse
+
+from services.idempotency import IdempotencyMiddleware, IdempotencyStore, MemoryIdempotencyStore
+
+
+class Endpoint:
+    """ASGI app that counts calls and answers with the call number and request body."""
+
+    def __init__(self, status: int = 200, delay: float = 0.0):
+        self.calls = 0
+        self.status = status
+        self.delay = delay
+
+    async def __call__(self, scope, receive, send):
+        self.calls += 1
+        call = self.calls
+        body = (await receive())["body"].decode()
+        await asyncio.sleep(self.delay)
+        await JSONResponse({"call": call, "body": body}, status_code=self.status)(scope, receive, send)
+
+
+def make_client(endpoint: Endpoint, store=None, wait: float = 5.0) -> AsyncClient:
+    app = IdempotencyMiddleware(
+        endpoint,
+        routes=[("PUT", "/scores/{problem_no}")],
+        store=store or MemoryIdempotencyStore(maxsize=100, ttl=60),
+        wait=wait,
+    )
+    return AsyncClient(transport=ASGITransport(app=app), base_url="http://test")
+
+
+def put(client, key="k1", body="a", path="/scores/1", token="t1"):
+    headers = {"Authorization": f"Bearer {token}"}
+    if key is not None:
+        headers["Idempotency-Key"] = key
+    return client.put(path, content=body, headers=headers)
+
+
+class TestIdempotencyMiddleware:
+    async def test_retry_is_replayed(self):
+        endpoint = Endpoint()
+        async with make_client(endpoint) as client:
+            first = await put(client)
+            retry = await put(client)
+        assert endpoint.calls == 1
+        assert retry.json() == first.json() == {"call": 1, "body": "a"}
+        assert retry.headers["idempotent-replayed"] == "true"
+        assert "idempotent-replayed" not in first.headers
+
+    async def test_key_is_scoped_to_caller_and_path(self):
+        endpoint = Endpoint()
+        async with make_client(endpoint) as client:
+            await put(client)
+            other_user = await put(client, token="t2")
+            other_path = await put(client, path="/scores/2")
+        assert (other_user.json()["call"], other_path.json()["call"]) == (2, 3)
+
+    async def test_reused_key_with_different_body(self):
+        endpoint = Endpoint()
+        async with make_client(endpoint) as client:
+            await put(client, body="a")
+            resp = await put(client, body="b")
+        assert resp.status_code == 422
+        assert endpoint.calls == 1
+
+    async def test_concurrent_duplicates_wait_for_the_first(self):
+        endpoint = Endpoint(delay=0.05)
+        async with make_client(endpoint) as client:
+            responses = await asyncio.gather(*(put(client) for _ in range(5)))
+        assert endpoint.calls == 1
+        assert {r.json()["call"] for r in responses} == {1}
+        assert sum(r.headers.get("idempotent-replayed") == "true" for r in responses) == 4
+
+    async def test_waiting_too_long_is_a_conflict(self):
+        endpoint = Endpoint(delay=0.2)
+        async with make_client(endpoint, wait=0.01) as client:
+            first, second = await asyncio.gather(put(client), put(client))
+        assert sorted([first.status_code, second.status_code]) == [200, 409]
+        assert endpoint.calls == 1
+
+    @pytest.mark.parametrize("status", [409, 429, 503])
+    async def test_retryable_responses_are_not_stored(self, status):
+        endpoint = Endpoint(status=status)
+        async with make_client(endpoint) as client:
+            await put(client)
+            retry = await put(client)
+        assert endpoint.calls == 2
+        assert "idempotent-replayed" not in retry.headers
+
+    @pytest.mark.parametrize("status", [201, 404, 422])
+    async def test_definite_responses_are_stored(self, status):
+        endpoint = Endpoint(status=status)
+        async with make_client(endpoint) as client:
+            await put(client)
+            retry = await put(client)
+        assert endpoint.calls == 1
+        assert retry.status_code == status
+
+    @pytest.mark.parametrize("key, path", [(None, "/scores/1"), ("k1", "/other")])
+    async def test_passes_through_without_key_or_route(self, key, path):
+        endpoint = Endpoint()
+        async with make_client(endpoint) as client:
+            await put(client, key=key, path=path)
+            await put(client, key=key, path=path)
+        assert endpoint.calls == 2
+
+    async def test_store_is_bounded(self):
+        endpoint = Endpoint()
+        store = MemoryIdempotencyStore(maxsize=2, ttl=60)
+        async with make_client(endpoint, store=store) as client:
+            for key in ("k1", "k2", "k3"):
+                await put(client, key=key)
+            await put(client, key="k1")  # evicted: runs again
+        assert endpoint.calls == 4
+        assert store.stats()["size"] == 2
+
+
+class TestIdempotencyStore:
+    def test_incomplete_backend_fails_at_construction(self):
+        class NoWait(IdempotencyStore):
+            async def claim(self, key, fingerprint):
+                return None
+
+            async def complete(self, key, response):
+                pass
+
+            async def release(self, key):
+                pass
+
+        with pytest.raises(TypeError, match="wait"):
+            NoWait()
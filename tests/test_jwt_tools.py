@@ -1,8 +1,11 @@
 """Unit tests for security/jwt_tools.py — token creation and decoding."""
+import hashlib
+import time
+
 import pytest
 import jwt as pyjwt
 
-from security.jwt_tools import create_access_token, create_refresh_token, decode_token
+from security.jwt_tools import create_access_token, create_refresh_token, decode_token, _verified_tokens
 from schema.setting import settings
 
 
@@ -144,3 +147,39 @@ class TestDecodeToken:
     def test_garbage_string_raises(self):
         with pytest.raises(pyjwt.exceptions.PyJWTError):
             decode_token("not.a.jwt")
+
+
+class TestDecodeTokenCache:
+    def setup_method(self):
+        _verified_tokens.clear()
+
+    def test_second_decode_is_served_from_cache(self):
+        token = create_access_token("cached")
+        hits = _verified_tokens.hits
+        first = decode_token(token)
+        second = decode_token(token)
+        assert first == second
+        assert _verified_tokens.hits == hits + 1
+
+    def test_cached_payload_is_a_copy(self):
+        token = create_access_token("copy")
+        decode_token(token)["sub"] = "mutated"
+        assert decode_token(token)["sub"] == "copy"
+
+    def test_refresh_tokens_are_not_cached(self):
+        decode_token(create_refresh_token("r"))
+        assert len(_verified_tokens) == 0
+
+    def test_entry_expires_at_token_exp(self, monkeypatch):
+        token = create_access_token("expiring")
+        exp = decode_token(token)["exp"]
+        now = time.monotonic()
+        monkeypatch.setattr(time, "monotonic", lambda: now + (exp - time.time()) + 1)
+        assert _verified_tokens.get(hashlib.sha256(token.encode()).digest()) is None
+
+    def test_tampered_token_is_not_served_from_cache(self):
+        token = create_access_token("u")
+        decode_token(token)
+        tampered = token[:-1] + ("A" if token[-1] != "A" else "B")
+        with pytest.raises(pyjwt.exceptions.PyJWTError):
+            decode_token(tampered)
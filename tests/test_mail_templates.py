@@ -0,0 +1,60 @@
+import pytest
+from jinja2 import TemplateNotFound
+
+from services import mail_templates
+
+
+def _reset(**kw):
+    context = {"firstname": "Alice", "reset_url": "https://grepp.se/reset-password?token=abc"}
+    context.update(kw)
+    return mail_templates.render("password_reset", **context)
+
+
+class TestRender:
+    def test_default_locale_is_swedish(self):
+        mail = _reset()
+        assert mail.subject == "Återställ ditt lösenord - Grepp"
+        assert "Hej Alice," in mail.html
+        assert "Hej Alice," in mail.text
+
+    def test_renders_requested_locale(self):
+        mail = _reset(locale="en")
+        assert mail.subject == "Reset your password - Grepp"
+        assert "Hi Alice," in mail.text
+
+    def test_unknown_locale_falls_back_to_default(self):
+        assert _reset(locale="de").subject == _reset().subject
+        assert _reset(locale="../en").subject == _reset().subject
+
+    def test_html_is_escaped_text_is_not(self):
+        mail = _reset(firstname="<b>Bob</b>", reset_url="https://x/?a=1&b=2")
+        assert "&lt;b&gt;Bob&lt;/b&gt;" in mail.html
+        assert 'href="https://x/?a=1&amp;b=2"' in mail.html
+        assert "Hej <b>Bob</b>," in mail.text
+        assert "https://x/?a=1&b=2" in mail.text
+
+    def test_missing_firstname(self):
+        assert _reset(firstname=None).text.startswith("Hej,")
+
+    def test_unknown_template_raises(self):
+        with pytest.raises(TemplateNotFound):
+            mail_templates.render("no_such_mail")
+
+    def test_templates_are_compiled_once(self):
+        mail_templates.warm()
+        before = mail_templates._template.cache_info().misses
+        for _ in range(3):
+            _reset(locale="en")
+        assert mail_templates._template.cache_info().misses == before
+
+
+class TestLocaleFromHeader:
+    @pytest.mark.parametrize("header, expected", [
+        (None, None),
+        ("", None),
+        ("en-GB,en;q=0.8,sv;q=0.5", "en"),
+        ("sv", "sv"),
+        ("*", None),
+    ])
+    def test_primary_language(self, header, expected):
+        assert mail_templates.locale_from_header(header) == expected
@@ -0,0 +1,69 @@
+"""Unit tests for services/ranking.py — IFSC ordering of per-climber totals."""
+import numpy as np
+
+from services.ranking import Totals, rank, tied_on_points
+
+
+def totals(*rows):
+    """Totals from (user_id, points, tops, zones, top_attempts, zone_attempts) rows."""
+    t = Totals.from_points([r[0] for r in rows], [r[1] for r in rows])
+    t.set_tiebreaks([(r[0], *r[2:]) for r in rows])
+    return t
+
+
+def board(*rows):
+    t = totals(*rows)
+    order, ranks = rank(t)
+    return [(int(r), int(t.user_ids[i])) for i, r in zip(order, ranks)]
+
+
+class TestRank:
+    def test_points_first(self):
+        assert board((1, 24.8, 1, 1, 3, 1), (2, 25.0, 1, 1, 1, 1)) == [(1, 2), (2, 1)]
+
+    def test_equal_points_broken_by_tops(self):
+        # 25.0 from one top against 15.0 + 10.0 from two zones
+        assert board((1, 25.0, 1, 1, 1, 1), (2, 25.0, 0, 2, 0, 52)) == [(1, 1), (2, 2)]
+
+    def test_equal_points_and_tops_broken_by_attempts(self):
+        # 24.9 + 15.0 against 25.0 + 14.9: fewer attempts to top wins
+        assert board((1, 39.9, 1, 2, 2, 2), (2, 39.9, 1, 2, 1, 3)) == [(1, 2), (2, 1)]
+
+    def test_equal_attempts_to_top_broken_by_attempts_to_zone(self):
+        assert board((1, 24.8, 1, 1, 3, 3), (2, 24.8, 1, 1, 3, 1)) == [(1, 2), (2, 1)]
+
+    def test_full_ties_share_a_rank_and_the_next_rank_skips(self):
+        rows = [(3, 24.9, 1, 1, 2, 1), (2, 25.0, 1, 1, 1, 1), (1, 25.0, 1, 1, 1, 1), (4, 0.0, 0, 0, 0, 0)]
+        assert board(*rows) == [(1, 1), (1, 2), (3, 3), (4, 4)]
+
+    def test_empty(self):
+        order, ranks = rank(Totals.from_points([], []))
+        assert order.tolist() == ranks.tolist() == []
+
+    def test_large_field_matches_a_python_sort(self):
+        rng = np.random.default_rng(1)
+        t = Totals(
+            user_ids=np.arange(500, dtype=np.int64),
+            points=rng.integers(0, 40, 500) * 25,
+            tops=rng.integers(0, 3, 500),
+            zones=rng.integers(0, 3, 500),
+            top_attempts=rng.integers(0, 4, 500),
+            zone_attempts=rng.integers(0, 4, 500),
+        )
+        order, _ = rank(t)
+
+        def key(i):
+            return -t.points[i], -t.tops[i], -t.zones[i], t.top_attempts[i], t.zone_attempts[i], t.user_ids[i]
+
+        assert order.tolist() == sorted(range(500), key=key)
+
+
+class TestTotalsFromPoints:
+    def test_tied_on_points_and_tiebreaks(self):
+        totals = Totals.from_points([10, 11, 12], [39.9, 25.0, 39.9])
+        assert tied_on_points(totals).tolist() == [True, False, True]
+
+        totals.set_tiebreaks([(10, 1, 2, 2, 2), (12, 1, 2, 1, 3)])
+        order, ranks = rank(totals)
+        assert totals.user_ids[order].tolist() == [12, 10, 11]
+        assert ranks.tolist() == [1, 2, 3]
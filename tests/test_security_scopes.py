@@ -58,3 +58,16 @@ class TestExpandScopes:
 
     def test_mixed_case_role_is_normalised(self):
         assert expand_scopes(_Scope("Climber")) == {"climber"}
+
+
+class TestPrincipal:
+    def test_from_climber_expands_scopes(self):
+        from db.models import Climber, UserScope
+        from security.deps import Principal
+
+        climber = Climber(id=3, username="setter", user_scope=UserScope.admin, firstname="A")
+        principal = Principal.from_climber(climber)
+        assert principal.id == 3
+        assert principal.user_scope == "admin"
+        assert principal.effective_scopes == {"admin", "analyst", "setter", "climber"}
+        assert principal.firstname == "A"
@@ -0,0 +1,117 @@
+"""Unit tests for services/singleflight.py — request coalescing and stale-while-revalidate."""
+import asyncio
+
+import pytest
+
+from services.singleflight import CoalescedCache, SingleFlight
+
+
+class Counter:
+    def __init__(self, delay: float = 0.01):
+        self.calls = 0
+        self.delay = delay
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def __call__(self):
+        self.calls += 1
+        call = self.calls
+        await self.release.wait()
+        await asyncio.sleep(self.delay)
+        return call
+
+
+class TestSingleFlight:
+    async def test_concurrent_callers_share_one_computation(self):
+        flight = SingleFlight()
+        compute = Counter()
+        results = await asyncio.gather(*(flight.do("k", compute) for _ in range(50)))
+        assert results == [1] * 50
+        assert compute.calls == 1
+        assert flight.stats()["leaders"] == 1
+        assert flight.stats()["followers"] == 49
+        assert flight.stats()["in_flight"] == 0
+
+    async def test_sequential_calls_recompute(self):
+        flight = SingleFlight()
+        compute = Counter()
+        assert await flight.do("k", compute) == 1
+        assert await flight.do("k", compute) == 2
+
+    async def test_errors_reach_every_waiter(self):
+        flight = SingleFlight()
+
+        async def boom():
+            await asyncio.sleep(0.01)
+            raise ValueError("nope")
+
+        results = await asyncio.gather(*(flight.do("k", boom) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(r, ValueError) for r in results)
+
+    async def test_timeout_leaves_computation_running(self):
+        flight = SingleFlight()
+        compute = Counter()
+        compute.release.clear()
+        with pytest.raises(asyncio.TimeoutError):
+            await flight.do("k", compute, timeout=0.01)
+        assert flight.in_flight("k")
+        compute.release.set()
+        assert await flight.do("k", compute) == 1
+        assert compute.calls == 1
+        assert flight.stats()["timeouts"] == 1
+
+
+class TestCoalescedCache:
+    async def test_fresh_entry_is_served_without_recompute(self):
+        cache = CoalescedCache(maxsize=4, ttl=60)
+        compute = Counter()
+        assert await cache.get("k", compute) == 1
+        assert await cache.get("k", compute) == 1
+        assert compute.calls == 1
+
+    # Real (short) TTLs: patching time.monotonic would also stop the event loop's clock.
+    async def test_stale_entry_is_served_while_one_refresh_runs(self):
+        cache = CoalescedCache(maxsize=4, ttl=0.05, stale_ttl=30)
+        compute = Counter()
+        assert await cache.get("k", compute) == 1
+
+        await asyncio.sleep(0.06)
+        results = await asyncio.gather(*(cache.get("k", compute) for _ in range(10)))
+        assert results == [1] * 10
+        await asyncio.sleep(0.03)
+        assert compute.calls == 2
+        assert await cache.get("k", compute) == 2
+        assert cache.stats()["stale_served"] == 10
+
+    async def test_past_stale_window_waits_for_recompute(self):
+        cache = CoalescedCache(maxsize=4, ttl=0.02, stale_ttl=0.02)
+        compute = Counter()
+        await cache.get("k", compute)
+        await asyncio.sleep(0.05)
+        assert await cache.get("k", compute) == 2
+        assert cache.stats()["stale_served"] == 0
+
+    async def test_invalidate_during_computation_discards_its_result(self):
+        cache = CoalescedCache(maxsize=4, ttl=60)
+        compute = Counter()
+        compute.release.clear()
+        before_write = asyncio.ensure_future(cache.get("k", compute))
+        await asyncio.sleep(0)
+
+        cache.invalidate("k")
+        after_write = asyncio.ensure_future(cache.get("k", compute))
+        compute.release.set()
+
+        assert await before_write == 1
+        assert await after_write == 2
+        assert await cache.get("k", compute) == 2
+        assert compute.calls == 2
+
+    async def test_clear_drops_everything(self):
+        cache = CoalescedCache(maxsize=4, ttl=60)
+        compute = Counter()
+        await cache.get("a", compute)
+        await cache.get("b", compute)
+        cache.clear()
+        assert len(cache) == 0
+        assert await cache.get("a", compute) == 3